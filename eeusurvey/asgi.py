@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eeusurvey.settings')
+# Under ASGI, serve the survey reads and submissions with the async views
+os.environ.setdefault('ASYNC_API', 'True')
 
 application = get_asgi_application()
@@ -2,19 +2,32 @@ from django import forms
 from django.contrib import admin
 from django.contrib.admin.widgets import AdminSplitDateTime
 from django.urls import path, reverse
-from django.shortcuts import render, get_object_or_404
-from django.db.models import Avg, Count, Q, F, Max, Min
-from django.http import HttpResponse, JsonResponse
-from django.utils.html import format_html
+from django.shortcuts import redirect, render, get_object_or_404
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, Q, F, Max, Min, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
 from collections import defaultdict
-import csv
+import hashlib
 import json
+import uuid
 from datetime import datetime, timedelta
 
+from . import archives, export_jobs, exports, profiling
+from .categories import renumber_categories, reorder_categories
+from .analysis import category_summary_data, question_chart_data
+from .dashboard import dashboard_stats
+from .imports import ResponseImporter
+from .paginators import EstimatedCountPaginator
+from .purge import request_survey_deletion, start_survey_deletion
+from .routers import iterate_on_replica, replica_reads
 from .models import (
-    Answer, KeyChoice, Survey, Question, QuestionOption, 
-    QuestionCategory, SurveyResponse
+    Answer, ExportJob, KeyChoice, Survey, Question, QuestionOption, 
+    QuestionCategory, SurveyArchive, SurveyDeletion, SurveyResponse
 )
 
 
@@ -44,6 +57,9 @@ class AnswerInline(admin.TabularInline):
     readonly_fields = ['question', 'text_value', 'rating_value', 'number_value', 'custom_text']
     fields = ['question', 'text_value', 'rating_value', 'number_value', 'custom_text']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('question')
+
     def has_add_permission(self, request, obj=None):
         return False
 
@@ -53,16 +69,22 @@ class SurveyAdmin(admin.ModelAdmin):
     list_display = ['title', 'version', 'language', 'is_active', 'response_count', 'date_range', 'analysis_link']
     list_filter = ['language', 'version', 'is_active', 'created_at']
     search_fields = ['title', 'instructions']
-    readonly_fields = ['id', 'created_at', 'updated_at']
+    readonly_fields = [
+        'id', 'created_at', 'updated_at', 'recent_export_jobs', 'import_link', 'archive_status', 'deletion_status',
+    ]
     inlines = [KeyChoiceInline, QuestionCategoryInline]
+    actions = ['restore_archived_responses', 'renumber_survey_categories']
     
     fieldsets = (
         ('Basic Information', {
-            'fields': ('title', 'instructions', 'version', 'language')
+            'fields': ('title', 'instructions', 'version', 'language', 'storage_mode')
         }),
         ('Schedule', {
             'fields': ('start_time', 'end_time', 'is_active')
         }),
+        ('Exports & Imports', {
+            'fields': ('recent_export_jobs', 'import_link', 'archive_status'),
+        }),
         ('System', {
             'fields': ('id', 'created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -77,38 +99,339 @@ class SurveyAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(self.analysis_view),
                 name='survey_analysis',
             ),
+            path(
+                '<path:object_id>/analysis/questions/<int:question_id>/',
+                self.admin_site.admin_view(self.question_analysis_view),
+                name='survey_analysis_question',
+            ),
+            path(
+                '<path:object_id>/analysis/categories/<int:category_id>/',
+                self.admin_site.admin_view(self.category_analysis_view),
+                name='survey_analysis_category',
+            ),
             path(
                 '<path:object_id>/export/',
                 self.admin_site.admin_view(self.export_responses),
                 name='survey_export',
             ),
+            path(
+                '<path:object_id>/export/<str:export_format>/',
+                self.admin_site.admin_view(self.export_responses),
+                name='survey_export_format',
+            ),
+            path(
+                '<path:object_id>/import/',
+                self.admin_site.admin_view(self.import_responses),
+                name='survey_import',
+            ),
+            path(
+                '<path:object_id>/import/progress/<str:token>/',
+                self.admin_site.admin_view(self.import_progress),
+                name='survey_import_progress',
+            ),
+            path(
+                'export-jobs/<uuid:job_id>/',
+                self.admin_site.admin_view(self.export_job_status),
+                name='survey_export_job',
+            ),
+            path(
+                'export-jobs/<uuid:job_id>/download/',
+                self.admin_site.admin_view(self.export_job_download),
+                name='survey_export_job_download',
+            ),
         ]
         return custom_urls + urls
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            response_total=Count('responses'), archived_total=F('archive__response_count'),
+            deletion_state=F('deletion__status'), deletion_done=F('deletion__deleted_responses'),
+            deletion_total=F('deletion__total_responses'),
+        )
+
+    def get_fieldsets(self, request, obj=None):
+        fieldsets = super().get_fieldsets(request, obj)
+        if obj is not None and obj.deleted_at:
+            fieldsets = (('Deletion', {'fields': ('deletion_status',)}),) + tuple(fieldsets)
+        return fieldsets
+
+    def has_change_permission(self, request, obj=None):
+        # a survey being deleted is read-only until its rows are gone
+        if obj is not None and obj.deleted_at:
+            return False
+        return super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        if obj is not None and obj.deleted_at:
+            return False
+        return super().has_delete_permission(request, obj)
+
+    def delete_model(self, request, obj):
+        """Hide the survey now and purge its responses in batches on a background thread"""
+        deletion = request_survey_deletion(obj, request.user.get_username())
+        # the admin deletes inside a transaction; the worker must see the committed rows
+        transaction.on_commit(lambda: start_survey_deletion(deletion))
+
+    def delete_queryset(self, request, queryset):
+        for survey in queryset.filter(deleted_at__isnull=True):
+            self.delete_model(request, survey)
+
+    def get_deleted_objects(self, objs, request):
+        """Summarise what goes with the surveys by counting, instead of collecting every response and answer"""
+        surveys = list(objs)
+        summary = []
+        for survey in surveys:
+            summary.append(f"Survey: {survey}")
+            summary.append([
+                f"{SurveyResponse.objects.filter(survey=survey).count()} responses with their answers",
+                f"{survey.questions.count()} questions and {survey.categories.count()} categories", # type: ignore
+            ])
+        model_count = {
+            Survey._meta.verbose_name_plural: len(surveys),
+            SurveyResponse._meta.verbose_name_plural: SurveyResponse.objects.filter(survey__in=surveys).count(),
+        }
+        return summary, model_count, set(), []
+
+    def response_delete(self, request, obj_display, obj_id):
+        self.message_user(
+            request, f"“{obj_display}” is being deleted in the background; the survey list shows its progress."
+        )
+        return redirect('admin:eeusurvey_app_survey_changelist')
+
+    def deletion_status(self, obj):
+        if obj is None or obj._state.adding:
+            return '-'
+        deletion = SurveyDeletion.objects.filter(survey=obj).first()
+        if deletion is None:
+            return '-'
+        if deletion.status == 'failed':
+            return format_html(
+                'Deletion failed after {} of {} responses: {}<br>'
+                'Run <code>manage.py purge_deleted_surveys</code> to retry.',
+                deletion.deleted_responses, deletion.total_responses, deletion.error,
+            )
+        return format_html(
+            'Requested by {} on {} — {} of {} responses purged ({}%)',
+            deletion.requested_by or 'unknown', deletion.created_at.strftime('%Y-%m-%d %H:%M'),
+            deletion.deleted_responses, deletion.total_responses, deletion.progress,
+        )
+    deletion_status.short_description = 'Deletion' # type: ignore
+
     def response_count(self, obj):
-        count = obj.responses.count()
+        count = obj.response_total
+        if obj.deletion_state == 'failed':
+            return f"Deletion failed ({obj.deletion_done} of {obj.deletion_total} purged)"
+        if obj.deletion_state is not None:
+            percent = 100 * obj.deletion_done // obj.deletion_total if obj.deletion_total else 0
+            return f"Deleting… {percent}%"
+        if obj.archived_total is not None:
+            return f"{obj.archived_total} responses (archived)"
         if count > 0:
             url = reverse('admin:eeusurvey_app_surveyresponse_changelist')
             return format_html('<a href="{}?survey__id__exact={}">{} responses</a>', url, obj.id, count)
         return '0 responses'
     response_count.short_description = 'Responses' # type: ignore
+    response_count.admin_order_field = 'response_total' # type: ignore
     
+    def import_responses(self, request, object_id):
+        """Upload paper-collected responses in the export_responses layout"""
+        survey = get_object_or_404(Survey, id=object_id, deleted_at__isnull=True)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f"Import responses: {survey.title}",
+            'survey': survey,
+            'opts': self.model._meta,
+            'token': uuid.uuid4().hex,
+        }
+
+        if request.method == 'POST' and request.FILES.get('file'):
+            token = request.POST.get('token') or context['token']
+            progress_key = f"eeusurvey:import:{token}"
+
+            def progress(processed, total):
+                cache.set(progress_key, {'processed': processed, 'total': total}, 3600)
+
+            report = ResponseImporter(survey, progress=progress).run(request.FILES['file'])
+            cache.delete(progress_key)
+            if request.headers.get('Accept') == 'application/json':
+                return JsonResponse(report)
+            context['report'] = report
+
+        return render(request, 'admin/survey_import.html', context)
+
+    def import_link(self, obj):
+        if obj is None or obj._state.adding:
+            return '-'
+        url = reverse('admin:survey_import', args=[obj.id])
+        return format_html('<a href="{}" class="button">📥 Import responses from CSV/XLSX</a>', url)
+    import_link.short_description = 'Paper responses' # type: ignore
+
+    def archive_status(self, obj):
+        if obj is None or obj._state.adding:
+            return '-'
+        archive = SurveyArchive.objects.filter(survey=obj).first()
+        if archive is None:
+            if obj.restored_at:
+                return f"Responses are in the live tables (restored {obj.restored_at:%Y-%m-%d %H:%M})"
+            return 'Responses are in the live tables'
+        if archive.status == 'archiving':
+            return 'Archiving… the live rows are still being purged'
+        if archive.status == 'restoring':
+            return format_html(
+                'Restoring — {} of {} responses back ({}%)',
+                archive.restored_responses, archive.response_count, archive.progress,
+            )
+        if archive.status == 'failed':
+            return format_html(
+                'Restore failed after {} of {} responses: {}<br>'
+                'Fix the cause and run the "Restore archived responses" action again.',
+                archive.restored_responses, archive.response_count, archive.error,
+            )
+        return format_html(
+            'Archived {} — {} responses, {} answers, {} KB <small>sha256 {}</small><br>'
+            'Analysis shows the statistics kept at archiving. Use the "Restore archived responses" '
+            'action on the survey list to bring the responses back.',
+            archive.archived_at.strftime('%Y-%m-%d %H:%M'), archive.response_count,
+            archive.answer_count, archive.file_size // 1024, archive.checksum[:12],
+        )
+    archive_status.short_description = 'Archive' # type: ignore
+
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not QuestionCategory:
+            return super().save_formset(request, form, formset, change)
+        self.save_category_formset(form.instance, formset)
+
+    def save_category_formset(self, survey, formset):
+        """Apply the inline's numbering in one reorder instead of shifting siblings row by row"""
+        instances = formset.save(commit=False)
+        with transaction.atomic():
+            if formset.deleted_objects:
+                QuestionCategory.objects.filter(pk__in=[obj.pk for obj in formset.deleted_objects]).delete()
+            requested = {}
+            for obj in formset.new_objects:
+                number, obj.cat_number = obj.cat_number, None
+                obj.save()  # appended; moved into place below
+                if number is not None:
+                    requested[obj.pk] = (number, 0)
+            changed = [obj for obj, _ in formset.changed_objects]
+            if changed:
+                QuestionCategory.objects.bulk_update(changed, ['name'])
+            for obj, fields in formset.changed_objects:
+                if 'cat_number' in fields and obj.cat_number is not None:
+                    # on a tie, a category moved up goes before the one there, one moved down after it
+                    previous = obj._loaded_cat_number
+                    moved_up = previous is None or obj.cat_number < previous
+                    requested[obj.pk] = (obj.cat_number, 0 if moved_up else 2)
+
+            current = survey.categories.values_list('id', 'cat_number') # type: ignore
+            order = sorted(
+                current,
+                key=lambda row: (*requested.get(row[0], (row[1], 1)), row[1] or 0),
+            )
+            reorder_categories(survey, [category_id for category_id, _ in order])
+        formset.save_m2m()
+        return instances
+
+    @admin.action(description="Renumber categories 1..n")
+    def renumber_survey_categories(self, request, queryset):
+        for survey in queryset:
+            renumber_categories(survey)
+        self.message_user(request, f"Renumbered the categories of {queryset.count()} survey(s).")
+
+    @admin.action(description="Restore archived responses")
+    def restore_archived_responses(self, request, queryset):
+        started = 0
+        for survey in queryset.filter(archive__isnull=False):
+            try:
+                archives.start_restore(survey)
+            except archives.ArchiveError as e:
+                self.message_user(request, f"Can't restore {survey.title}: {e}", level='warning')
+                continue
+            started += 1
+        self.message_user(
+            request, f"Restoring {started} archived survey(s) in the background; the survey page shows progress."
+        )
+
+    def import_progress(self, request, object_id, token):
+        return JsonResponse(cache.get(f"eeusurvey:import:{token}") or {'processed': 0, 'total': 0})
+
+    def recent_export_jobs(self, obj):
+        if obj is None or obj._state.adding:
+            return '-'
+        jobs = obj.export_jobs.all()[:10]
+        if not jobs:
+            return 'No exports yet'
+        rows = format_html_join(
+            '',
+            '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}%</td><td>{}</td></tr>',
+            (
+                (
+                    job.created_at.strftime('%Y-%m-%d %H:%M'),
+                    job.export_format,
+                    job.get_status_display(),
+                    job.progress,
+                    format_html(
+                        '<a href="{}">Download</a> <small>sha256 {}</small>',
+                        reverse('admin:survey_export_job_download', args=[job.id]),
+                        job.checksum[:12],
+                    ) if job.status == 'finished' else job.error[:80],
+                )
+                for job in jobs
+            ),
+        )
+        return format_html(
+            '<table><thead><tr><th>Created</th><th>Format</th><th>Status</th><th>Progress</th><th></th></tr></thead>'
+            '<tbody>{}</tbody></table>',
+            rows,
+        )
+    recent_export_jobs.short_description = 'Recent exports' # type: ignore
+
+    def export_job_status(self, request, job_id):
+        job = get_object_or_404(ExportJob, id=job_id)
+        return JsonResponse({
+            'id': str(job.id),
+            'survey': str(job.survey_id),
+            'format': job.export_format,
+            'status': job.status,
+            'progress': job.progress,
+            'processed_responses': job.processed_responses,
+            'total_responses': job.total_responses,
+            'file_size': job.file_size,
+            'checksum': job.checksum,
+            'error': job.error,
+            'download_url': reverse('admin:survey_export_job_download', args=[job.id]) if job.status == 'finished' else None,
+        })
+
+    def export_job_download(self, request, job_id):
+        job = get_object_or_404(ExportJob, id=job_id, status='finished', survey__deleted_at__isnull=True)
+        extension = 'sqlite3' if job.export_format == 'sqlite' else job.export_format
+        return export_jobs.ranged_file_response(
+            request,
+            job.file_path,
+            filename=f"{job.survey.title}_responses.{extension}",
+            content_type=export_jobs.CONTENT_TYPES[job.export_format],
+            checksum=job.checksum,
+        )
+
     def date_range(self, obj):
         return f"{obj.start_time} to {obj.end_time}"
     date_range.short_description = 'Active Period' # type: ignore
     
     def analysis_link(self, obj):
-        if obj.responses.count() > 0:
+        if obj.response_total > 0 or obj.archived_total:
             url = reverse('admin:survey_analysis', args=[obj.id])
             return format_html('<a href="{}" class="button">📊 View Analysis</a>', url)
         return 'No data'
     analysis_link.short_description = 'Analysis' # type: ignore
     
+    @replica_reads()
     def analysis_view(self, request, object_id):
-        survey = get_object_or_404(Survey, id=object_id)
+        """Page shell; each section loads its data from the endpoints below"""
+        survey = get_object_or_404(Survey, id=object_id, deleted_at__isnull=True)
+        archive = SurveyArchive.objects.filter(survey=survey).first()
         
         # Basic statistics
-        total_responses = survey.responses.count() # type: ignore
+        total_responses = archive.response_count if archive else survey.responses.count() # type: ignore
         
         if total_responses == 0:
             context = {
@@ -122,174 +445,153 @@ class SurveyAdmin(admin.ModelAdmin):
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=30)
         
-        daily_responses = (
-            survey.responses # type: ignore
-            .filter(submitted_at__date__gte=start_date)
-            .extra({'date': "DATE(submitted_at)"})
-            .values('date')
-            .annotate(count=Count('id'))
-            .order_by('date')
-        )
-        
-        # Question analysis
-        questions_data = []
-        for question in survey.questions.all().select_related('category'): # type: ignore
-            question_data = self.analyze_question(question)
-            questions_data.append(question_data)
-        
-        # Category summary
-        category_summary = {}
-        for category in survey.categories.all():             # type: ignore
-                # Get all questions in this category
-            category_questions = category.questions.all()
-            total_questions = category_questions.count()
-
-            # Count total answers across all questions in category
-            total_answers = sum(q.answers.count() for q in category_questions)
-
-            # Calculate average responses per question
-            avg_responses = total_answers / total_questions if total_questions > 0 else 0
-
-            category_summary[category.name] = {
-                'total_questions': total_questions,
-                'avg_responses': avg_responses
-            }
+        if archive:
+            # the last 30 days of the survey rather than of the calendar
+            daily_responses = archive.statistics['analysis']['survey']['response_timeline'][-30:]
+        else:
+            daily_responses = (
+                survey.responses # type: ignore
+                .filter(submitted_at__date__gte=start_date)
+                .extra({'date': "DATE(submitted_at)"})
+                .values('date')
+                .annotate(count=Count('id'))
+                .order_by('date')
+            )
         
+        categories = list(
+            survey.categories.order_by('cat_number') # type: ignore
+            .prefetch_related(Prefetch('questions', queryset=Question.objects.order_by('id')))
+        )
+        question_total = sum(len(category.questions.all()) for category in categories)
+
         context = {
             'survey': survey,
+            'archive': archive,
             'total_responses': total_responses,
             'has_responses': True,
             'daily_responses': list(daily_responses),
-            'questions_data': questions_data,
-            'category_summary': category_summary,
-            'completion_rate': (total_responses / max(survey.questions.count(), 1)) * 100 # type: ignore
+            'categories': categories,
+            'question_total': question_total,
+            'completion_rate': (total_responses / max(question_total, 1)) * 100
         }
         
         return render(request, 'admin/survey_analysis.html', context)
+
+    def cached_analysis_response(self, request, survey_id, key, compute):
+        """JSON for one analysis section, with an ETag that changes whenever responses do"""
+        archive = SurveyArchive.objects.filter(survey_id=survey_id).first()
+        if archive:
+            data = archive.statistics['sections'].get(key)
+            if data is None:
+                raise Http404("Not part of the archived statistics")
+            return JsonResponse(data)
+
+        # document-mode responses are counted once materialize_responses has written
+        # their Answer rows; the pending count keeps the ETag changing when it does
+        stats = SurveyResponse.objects.filter(survey_id=survey_id).aggregate(
+            total=Count('id'), last=Max('submitted_at'), pending=Count('id', filter=Q(answers_materialized=False)),
+        )
+        etag = hashlib.md5(f"{key}:{stats['total']}:{stats['last']}:{stats['pending']}".encode()).hexdigest()
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, max-age=30'}
+
+        if request.headers.get('If-None-Match') == f'"{etag}"':
+            response = HttpResponse(status=304)
+        else:
+            cache_key = f"eeusurvey:analysis:{etag}"
+            data = cache.get(cache_key)
+            if data is None:
+                data = compute(stats['total'])
+                cache.set(cache_key, data, settings.ANALYSIS_CACHE_TTL)
+            response = JsonResponse(data)
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    @replica_reads()
+    def question_analysis_view(self, request, object_id, question_id):
+        question = get_object_or_404(
+            Question.objects.select_related('category'),
+            id=question_id, survey_id=object_id, survey__deleted_at__isnull=True,
+        )
+        return self.cached_analysis_response(
+            request, object_id, f"question:{question.id}",
+            lambda total: question_chart_data(question, total),
+        )
+
+    @replica_reads()
+    def category_analysis_view(self, request, object_id, category_id):
+        category = get_object_or_404(QuestionCategory, id=category_id, survey_id=object_id, survey__deleted_at__isnull=True)
+        return self.cached_analysis_response(
+            request, object_id, f"category:{category.id}",
+            lambda total: category_summary_data(category),
+        )
     
-    def analyze_question(self, question):
-        """Analyze individual question responses"""
-        answers = question.answers.all()
-        total_answers = answers.count()
-        
-        analysis = {
-            'question': question,
-            'total_responses': total_answers,
-            'response_rate': (total_answers / max(question.survey.responses.count(), 1)) * 100
-        }
-        
-        if total_answers == 0:
-            return analysis
-        
-        if question.question_type in ['single_choice', 'drop_down']:
-            # Choice distribution
-            option_counts = defaultdict(int)
-            other_responses = []
-            
-            for answer in answers:
-                selected_options = answer.selected_options.all()
-                if selected_options:
-                    for option in selected_options:
-                        if option.is_other and answer.custom_text:
-                            other_responses.append(answer.custom_text)
-                        option_counts[option.label or option.text or option.value] += 1
-            
-            analysis['distribution'] = dict(option_counts)
-            analysis['other_responses'] = other_responses
-            
-        elif question.question_type == 'multi_select':
-            option_counts = defaultdict(int)
-            for answer in answers:
-                for option in answer.selected_options.all():
-                    option_counts[option.label or option.text or option.value] += 1
-            analysis['distribution'] = dict(option_counts)
-            
-        elif question.question_type == 'rating':
-            ratings = [a.rating_value for a in answers if a.rating_value is not None]
-            if ratings:
-                analysis['average_rating'] = sum(ratings) / len(ratings)
-                analysis['rating_distribution'] = {
-                    str(i): ratings.count(i) for i in range(1, 6)
-                }
-                
-        elif question.question_type == 'number':
-            numbers = [a.number_value for a in answers if a.number_value is not None]
-            if numbers:
-                analysis['average'] = sum(numbers) / len(numbers)
-                analysis['min_value'] = min(numbers)
-                analysis['max_value'] = max(numbers)
-                
-        elif question.question_type in ['text', 'text_area']:
-            text_responses = [a.text_value for a in answers if a.text_value]
-            analysis['text_count'] = len(text_responses)
-            analysis['avg_length'] = sum(len(text) for text in text_responses) / len(text_responses) if text_responses else 0
-            analysis['sample_responses'] = text_responses[:3]  # Show first 3 responses
-        
-        return analysis
-    
-    def export_responses(self, request, object_id):
-        survey = get_object_or_404(Survey, id=object_id)
-        
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{survey.title}_responses.csv"'
-        
-        writer = csv.writer(response)
-        
-        # Header row
-        headers = ['Response ID', 'Submitted At']
-        questions = list(survey.questions.all().order_by('category__cat_number', 'id')) # type: ignore
-        for question in questions:
-            headers.append(f"Q{question.id}: {question.question_text[:50]}")
-        writer.writerow(headers)
-        
-        # Data rows
-        for survey_response in survey.responses.all(): # type: ignore
-            row = [str(survey_response.id), survey_response.submitted_at.strftime('%Y-%m-%d %H:%M:%S')]
-            
-            for question in questions:
-                try:
-                    answer = Answer.objects.get(response=survey_response, question=question)
-                    
-                    if question.question_type in ['single_choice', 'drop_down', 'multi_select']:
-                        selected_options = answer.selected_options.all()
-                        if selected_options:
-                            option_texts = [opt.label or opt.text or opt.value for opt in selected_options]
-                            cell_value = '; '.join(option_texts)
-                            if answer.custom_text:
-                                cell_value += f" (Other: {answer.custom_text})"
-                        else:
-                            cell_value = ''
-                    elif question.question_type == 'rating':
-                        cell_value = answer.rating_value or ''
-                    elif question.question_type == 'number':
-                        cell_value = answer.number_value or ''
-                    else:  # text, text_area
-                        cell_value = answer.text_value or ''
-                        
-                    row.append(cell_value)
-                except Answer.DoesNotExist:
-                    row.append('')  # No answer for this question
-            
-            writer.writerow(row)
-        
+    @replica_reads()
+    def export_responses(self, request, object_id, export_format='csv'):
+        survey = get_object_or_404(Survey, id=object_id, deleted_at__isnull=True)
+        if SurveyArchive.objects.filter(survey=survey).exists():
+            self.message_user(request, "This survey's responses are archived; restore them before exporting.", level='warning')
+            return redirect('admin:eeusurvey_app_survey_change', survey.id)
+
+        # a POST queues a background job (it writes, so it goes through the CSRF check)
+        if request.method == 'POST':
+            try:
+                job = export_jobs.create_export_job(survey, export_format)
+            except ValueError as e:
+                raise Http404(str(e))
+            export_jobs.start_export_job(job)
+            self.message_user(request, f"Export job started ({export_format}); it is listed under Exports & Imports below.")
+            return redirect('admin:eeusurvey_app_survey_change', survey.id)
+
+        if export_format == 'csv':
+            response = StreamingHttpResponse(iterate_on_replica(exports.stream_csv(survey)), content_type='text/csv')
+            filename = f"{survey.title}_responses.csv"
+        elif export_format == 'csv.gz':
+            response = StreamingHttpResponse(iterate_on_replica(exports.stream_csv_gzip(survey)), content_type='application/gzip')
+            filename = f"{survey.title}_responses.csv.gz"
+        elif export_format == 'jsonl':
+            response = StreamingHttpResponse(iterate_on_replica(exports.stream_jsonl(survey)), content_type='application/x-ndjson')
+            filename = f"{survey.title}_responses.jsonl"
+        elif export_format == 'sqlite':
+            return FileResponse(
+                exports.sqlite_snapshot_file(survey),
+                as_attachment=True,
+                filename=f"{survey.title}_responses.sqlite3",
+                content_type='application/vnd.sqlite3',
+            )
+        else:
+            raise Http404(f"Unknown export format: {export_format}")
+
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
         return response
 
 
+class CategoryListFilter(admin.RelatedFieldListFilter):
+    """Category filter whose choice labels don't query each category's survey"""
+    def field_choices(self, field, request, model_admin):
+        categories = QuestionCategory.objects.select_related('survey')
+        return [(category.pk, str(category)) for category in categories]
+
+
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin):
     list_display = ['question_text_short', 'question_type', 'category', 'survey', 'response_count','required']
-    list_filter = ['survey', 'question_type', 'category','required']
+    list_filter = ['survey', 'question_type', ('category', CategoryListFilter),'required']
     search_fields = ['question_text']
     readonly_fields = ['question_label']
+    list_select_related = ['survey', 'category__survey']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(answer_total=Count('answers'))
+
     def question_text_short(self, obj):
         return obj.question_text[:80] + "..." if len(obj.question_text) > 80 else obj.question_text
     question_text_short.short_description = 'Question Text' # type: ignore
     
     def response_count(self, obj):
-        count = obj.answers.count()
-        return f"{count} responses"
+        return f"{obj.answer_total} responses"
     response_count.short_description = 'Responses' # type: ignore
+    response_count.admin_order_field = 'answer_total' # type: ignore
 
 
 @admin.register(QuestionOption)
@@ -297,15 +599,19 @@ class QuestionOptionAdmin(admin.ModelAdmin):
     list_display = ['survey', 'label_or_text', 'value', 'is_other', 'usage_count']
     list_filter = ['survey', 'is_other']
     search_fields = ['label', 'text', 'value']
+    list_select_related = ['survey']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(question_total=Count('questions'))
+
     def label_or_text(self, obj):
         return obj.label or obj.text or obj.value or f"Option {obj.id}"
     label_or_text.short_description = 'Option Text' # type: ignore
     
     def usage_count(self, obj):
-        count = obj.questions.count()
-        return f"Used in {count} questions"
+        return f"Used in {obj.question_total} questions"
     usage_count.short_description = 'Usage' # type: ignore
+    usage_count.admin_order_field = 'question_total' # type: ignore
 
 
 @admin.register(QuestionCategory)
@@ -314,11 +620,15 @@ class QuestionCategoryAdmin(admin.ModelAdmin):
     list_filter = ['survey']
     search_fields = ['name']
     ordering = ['survey', 'cat_number']
+    list_select_related = ['survey']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(question_total=Count('questions'))
+
     def question_count(self, obj):
-        count = obj.questions.count()
-        return f"{count} questions"
+        return f"{obj.question_total} questions"
     question_count.short_description = 'Questions' # type: ignore
+    question_count.admin_order_field = 'question_total' # type: ignore
 
 
 @admin.register(KeyChoice)
@@ -332,9 +642,14 @@ class KeyChoiceAdmin(admin.ModelAdmin):
 class SurveyResponseAdmin(admin.ModelAdmin):
     list_display = ['survey', 'submitted_at', 'ip_address', 'is_complete', 'answer_count']
     list_filter = ['survey', 'submitted_at', 'is_complete']
-    readonly_fields = ['id', 'submitted_at', 'ip_address', 'user_agent']
-    search_fields = ['survey__title', 'ip_address']
+    readonly_fields = ['id', 'submitted_at', 'ip_address', 'user_agent', 'answers_materialized', 'document_display']
+    # Exact matches only, so every search hits an index
+    search_fields = ['=id', '=ip_address', '=session_id']
+    search_help_text = 'Exact response ID, IP address or session ID'
     inlines = [AnswerInline]
+    list_select_related = ['survey']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     fieldsets = (
         ('Response Info', {
@@ -343,30 +658,76 @@ class SurveyResponseAdmin(admin.ModelAdmin):
         ('Respondent Details', {
             'fields': ('ip_address', 'user_agent', 'session_id'),
             'classes': ('collapse',)
+        }),
+        ('Submitted Document', {
+            'fields': ('answers_materialized', 'document_display'),
+            'classes': ('collapse',)
         })
     )
     
+    def get_queryset(self, request):
+        # Subqueries rather than joins, so the two counts don't multiply each other
+        answers = (
+            Answer.objects.filter(response=OuterRef('pk'))
+            .order_by().values('response').annotate(c=Count('id')).values('c')
+        )
+        questions = (
+            Question.objects.filter(survey=OuterRef('survey'))
+            .order_by().values('survey').annotate(c=Count('id')).values('c')
+        )
+        return super().get_queryset(request).annotate(
+            answer_total=Coalesce(Subquery(answers), 0),
+            question_total=Coalesce(Subquery(questions), 0),
+        )
+
+    def document_display(self, obj):
+        if obj.answer_document is None:
+            return "-"
+        return format_html('<pre>{}</pre>', json.dumps(obj.answer_document, indent=2, ensure_ascii=False))
+    document_display.short_description = 'Answer document' # type: ignore
+
     def answer_count(self, obj):
-        count = obj.answers.count()
-        total_questions = obj.survey.questions.count()
-        return f"{count}/{total_questions} answered"
+        if not obj.answers_materialized:
+            return f"{len(obj.answer_document or [])}/{obj.question_total} answered (pending)"
+        return f"{obj.answer_total}/{obj.question_total} answered"
     answer_count.short_description = 'Completion' # type: ignore
+    answer_count.admin_order_field = 'answer_total' # type: ignore
 
 
 @admin.register(Answer)
 class AnswerAdmin(admin.ModelAdmin):
     list_display = ['response', 'question_short', 'answer_preview', 'created_at']
     list_filter = ['response__survey', 'question__question_type', 'created_at']
-    search_fields = ['question__question_text', 'text_value']
+    search_fields = ['=response__id']
+    search_help_text = 'Exact response ID'
     readonly_fields = ['created_at']
+    raw_id_fields = ['response', 'question', 'selected_option']
+    exclude = ['selected_options']
+    list_select_related = ['response__survey', 'question']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        # resolve the selected options of the whole page in one query
+        changelist.result_list = list(changelist.result_list)
+        options = QuestionOption.objects.in_bulk(
+            {option_id for answer in changelist.result_list for option_id in answer.selected_option_ids}
+        )
+        for answer in changelist.result_list:
+            answer.option_objects = [options[i] for i in answer.selected_option_ids if i in options]
+        return changelist
+
     def question_short(self, obj):
         return obj.question.question_text[:50] + "..." if len(obj.question.question_text) > 50 else obj.question.question_text
     question_short.short_description = 'Question' # type: ignore
     
     def answer_preview(self, obj):
-        if obj.selected_options.exists():
-            options = [opt.label or opt.text or opt.value for opt in obj.selected_options.all()]
+        selected_options = getattr(obj, 'option_objects', None)
+        if selected_options is None:
+            selected_options = QuestionOption.objects.filter(id__in=obj.selected_option_ids)
+        if selected_options:
+            options = [opt.label or opt.text or opt.value for opt in selected_options]
             preview = '; '.join(options)
             if obj.custom_text:
                 preview += f" (Other: {obj.custom_text[:30]}...)"
@@ -392,42 +753,62 @@ class SurveyAdminSite(admin.AdminSite):
         urls = super().get_urls()
         custom_urls = [
             path('dashboard/', self.admin_view(self.dashboard_view), name='dashboard'),
+            path('dashboard/data/', self.admin_view(self.dashboard_data_view), name='dashboard_data'),
+            path('profiles/', self.admin_view(self.profiles_view), name='request_profiles'),
+            path('profiles/<str:profile_id>/', self.admin_view(self.profile_view), name='request_profile'),
+            path(
+                'profiles/<str:profile_id>/download/',
+                self.admin_view(self.profile_download_view),
+                name='request_profile_download',
+            ),
         ]
         return custom_urls + urls
     
     def dashboard_view(self, request):
         """Custom dashboard with survey statistics"""
-        # Overall statistics
-        total_surveys = Survey.objects.count()
-        active_surveys = Survey.objects.filter(is_active=True).count()
-        total_responses = SurveyResponse.objects.count()
-        
-        # Recent activity
-        recent_responses = SurveyResponse.objects.select_related('survey')[:10]
-        recent_surveys = Survey.objects.order_by('-created_at')[:5]
-        
-        # Response statistics by survey
-        survey_stats = []
-        for survey in Survey.objects.filter(is_active=True):
-            response_count = survey.responses.count() # type: ignore
-            survey_stats.append({
-                'survey': survey,
-                'response_count': response_count,
-                'completion_rate': (response_count / max(survey.questions.count(), 1)) * 100 # type: ignore
-            })
-        
         context = {
             'title': 'Survey Dashboard',
-            'total_surveys': total_surveys,
-            'active_surveys': active_surveys,
-            'total_responses': total_responses,
-            'recent_responses': recent_responses,
-            'recent_surveys': recent_surveys,
-            'survey_stats': survey_stats,
+            **dashboard_stats(),
         }
-        
         return render(request, 'admin/dashboard.html', context)
 
+    def dashboard_data_view(self, request):
+        """Dashboard statistics as JSON, for polling"""
+        return JsonResponse(dashboard_stats())
+
+    def load_profile(self, request, profile_id):
+        try:
+            return profiling.load_profile(profile_id)
+        except (OSError, ValueError):
+            raise Http404("No such profile")
+
+    def profiles_view(self, request):
+        """Request profiles captured with X-Profile: 1 or ?_profile=1, newest first"""
+        context = {
+            **self.each_context(request),
+            'title': 'Request profiles',
+            'profiles': profiling.list_profiles(),
+            'keep': settings.PROFILE_KEEP,
+        }
+        return render(request, 'admin/request_profiles.html', context)
+
+    def profile_view(self, request, profile_id):
+        profile = self.load_profile(request, profile_id)
+        context = {
+            **self.each_context(request),
+            'title': f"Profile of {profile['method']} {profile['path']}",
+            'profile': profile,
+        }
+        return render(request, 'admin/request_profiles.html', context)
+
+    def profile_download_view(self, request, profile_id):
+        """The raw cProfile stats, for snakeviz or pstats"""
+        self.load_profile(request, profile_id)
+        return FileResponse(
+            open(profiling.profile_path(profile_id, 'prof'), 'rb'),
+            as_attachment=True, filename=f"{profile_id}.prof",
+        )
+
 
 # Use custom admin site
 admin_site = SurveyAdminSite(name='survey_admin')
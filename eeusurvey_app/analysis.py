@@ -1,16 +1,22 @@
 # analysis.py (or inside a view)
 
+import operator
 from collections import defaultdict
-from django.db.models import Avg, Count
+from functools import reduce
+from django.db.models import Avg, Count, Max, Min, Q
+from django.db.models.functions import Length
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
-from eeusurvey_app.models import Answer, Survey, SurveyResponse
+from eeusurvey_app.models import Answer, QuestionOption, Survey, SurveyResponse
+
+CHOICE_TYPES = ['single_choice', 'drop_down', 'multi_select']
+MAX_OTHER_RESPONSES = 100
 
 def analyze_survey_responses(survey_id):
     survey = get_object_or_404(Survey, id=survey_id)
     responses = SurveyResponse.objects.filter(survey=survey).prefetch_related(
-        'answers__question__category',
-        'answers__selected_options'
+        'answers__question__category'
     )
 
     analysis = {
@@ -56,17 +62,17 @@ def analyze_survey_responses(survey_id):
         elif question.question_type in ['single_choice', 'multi_select']:
             option_counts = defaultdict(int)
             total = 0
+            options = {opt.id: opt for opt in question.options.all()}
             for answer in answers:
+                opts = [options[i] for i in answer.selected_option_ids if i in options]
                 if question.question_type == 'single_choice':
-                    opts = answer.selected_options.all()
                     for opt in opts:
                         option_counts[opt.text] += 1
                         total += 1
                 else:  # multi_select
-                    opts = answer.selected_options.all()
                     for opt in opts:
                         option_counts[opt.text] += 1
-                    total += 1 if opts.exists() else 0
+                    total += 1 if opts else 0
 
             q_data["selection_counts"] = dict(option_counts)
             q_data["total_responded"] = total
@@ -90,4 +96,247 @@ def analyze_survey_responses(survey_id):
         if rating_totals:
             cat_data["avg_rating"] = round(sum(rating_totals) / len(rating_totals), 2)
 
-    return analysis
\ No newline at end of file
+    return analysis
+
+
+def question_chart_data(question, survey_responses):
+    """JSON-ready analysis of one question, computed with aggregate queries.
+
+    `chart` is shaped for Chart.js (labels plus one dataset of counts).
+    """
+    answers = Answer.objects.filter(question=question)
+    total_answers = answers.count()
+
+    data = {
+        'question_id': question.id,
+        'question_text': question.question_text,
+        'question_type': question.question_type,
+        'type_display': question.get_question_type_display(),
+        'category': {'id': question.category_id, 'name': question.category.name},
+        'total_responses': total_answers,
+        'response_rate': (total_answers / max(survey_responses, 1)) * 100,
+        'chart': None,
+    }
+    if total_answers == 0:
+        return data
+
+    if question.question_type in CHOICE_TYPES:
+        if question.question_type == 'multi_select':
+            # one conditional count per option over the encoded option_ids column
+            question_options = list(question.options.order_by('id'))
+            counts = answers.aggregate(**{
+                str(option.id): Count('id', filter=Q(option_ids__contains=f',{option.id},'))
+                for option in question_options
+            }) if question_options else {}
+            options = [option for option in question_options if counts.get(str(option.id))]
+            counts = {option.id: counts[str(option.id)] for option in options}
+            other = [Q(option_ids__contains=f',{option.id},') for option in question_options if option.is_other]
+            other_answers = answers.filter(reduce(operator.or_, other)) if other else answers.none()
+        else:
+            counts = dict(
+                answers.exclude(selected_option=None)
+                .values_list('selected_option_id')
+                .annotate(count=Count('id'))
+                .order_by()
+            )
+            options = QuestionOption.objects.filter(id__in=counts).order_by('id')
+            other_answers = answers.filter(selected_option__is_other=True)
+
+        data['chart'] = {
+            'labels': [str(option) for option in options],
+            'option_ids': [option.id for option in options],
+            'datasets': [{'label': 'Responses', 'data': [counts[option.id] for option in options]}],
+        }
+        data['other_responses'] = list(
+            other_answers
+            .exclude(custom_text__isnull=True).exclude(custom_text='')
+            .values_list('custom_text', flat=True)[:MAX_OTHER_RESPONSES]
+        )
+
+    elif question.question_type == 'rating':
+        ratings = answers.exclude(rating_value=None)
+        distribution = {i: 0 for i in range(1, 6)}
+        for rating, count in ratings.values_list('rating_value').annotate(count=Count('id')).order_by():
+            distribution[rating] = count
+        data['average_rating'] = ratings.aggregate(avg=Avg('rating_value'))['avg']
+        data['chart'] = {
+            'labels': [str(rating) for rating in distribution],
+            'datasets': [{'label': 'Ratings', 'data': list(distribution.values())}],
+        }
+
+    elif question.question_type == 'number':
+        stats = answers.exclude(number_value=None).aggregate(
+            average=Avg('number_value'), min_value=Min('number_value'),
+            max_value=Max('number_value'), count=Count('id'),
+        )
+        data.update(stats)
+
+    elif question.question_type in ['text', 'text_area']:
+        texts = answers.exclude(text_value__isnull=True).exclude(text_value='')
+        stats = texts.aggregate(text_count=Count('id'), avg_length=Avg(Length('text_value')))
+        data['text_count'] = stats['text_count']
+        data['avg_length'] = stats['avg_length'] or 0
+        data['sample_responses'] = list(texts.values_list('text_value', flat=True)[:3])
+
+    return data
+
+
+def category_summary_data(category):
+    """Question and answer totals for one category"""
+    total_questions = category.questions.count()
+    total_answers = Answer.objects.filter(question__category=category).count()
+    return {
+        'category_id': category.id,
+        'name': category.name,
+        'total_questions': total_questions,
+        'total_answers': total_answers,
+        'avg_responses': total_answers / total_questions if total_questions > 0 else 0,
+    }
+
+
+def survey_analysis_data(survey):
+    """Payload of the survey analysis API (document-mode responses must be materialized first)"""
+    # Basic statistics
+    total_responses = SurveyResponse.objects.filter(survey=survey).count()
+    
+    if total_responses == 0:
+        return {
+            'survey': {
+                'id': survey.id,
+                'title': survey.title,
+                'total_responses': 0
+            },
+            'analysis': {},
+            'message': 'No responses yet'
+        }
+    
+    # Response timeline
+    daily_responses = (
+        SurveyResponse.objects
+        .filter(survey=survey)
+        .extra({'date': "DATE(submitted_at)"})
+        .values('date')
+        .annotate(count=Count('id'))
+        .order_by('date')
+    )
+    
+    # Analyze each question
+    questions_analysis = {}
+    
+    for question in survey.questions.all():
+        question_analysis = analyze_question(question)
+        questions_analysis[question.id] = question_analysis
+    
+    # Category analysis
+    category_analysis = {}
+    for category in survey.categories.all():
+        category_questions = category.questions.all()
+        category_analysis[category.id] = {
+            'name': category.name,
+            'total_questions': category_questions.count(),
+            'questions': [q.id for q in category_questions]
+        }
+    
+    return {
+        'survey': {
+            'id': survey.id,
+            'title': survey.title,
+            'total_responses': total_responses,
+            'response_timeline': list(daily_responses)
+        },
+        'categories': category_analysis,
+        'questions': questions_analysis,
+        'generated_at': timezone.now().isoformat()
+    }
+
+
+def analyze_question(question):
+    """Analyze individual question responses"""
+    answers = Answer.objects.filter(question=question)
+    total_answers = answers.count()
+    
+    analysis = {
+        'question_id': question.id,
+        'question_text': question.question_text,
+        'question_type': question.question_type,
+        'total_responses': total_answers,
+        'category': {
+            'id': question.category.id,
+            'name': question.category.name
+        }
+    }
+    
+    if total_answers == 0:
+        return analysis
+    
+    if question.question_type in ['single_choice', 'drop_down']:
+        # Analyze choice distribution
+        option_counts = defaultdict(int)
+        other_responses = []
+        
+        answers = list(answers)
+        options = QuestionOption.objects.in_bulk({i for a in answers for i in a.selected_option_ids})
+        for answer in answers:
+            selected_options = [options[i] for i in answer.selected_option_ids if i in options]
+            if selected_options:
+                for option in selected_options:
+                    if option.is_other and answer.custom_text:
+                        other_responses.append(answer.custom_text)
+                    option_counts[option.label or option.text or option.value] += 1
+        
+        analysis['distribution'] = dict(option_counts)
+        analysis['other_responses'] = other_responses
+        
+    elif question.question_type == 'multi_select':
+        # Analyze multiple selection patterns
+        option_counts = defaultdict(int)
+        combination_counts = defaultdict(int)
+        
+        answers = list(answers)
+        options = QuestionOption.objects.in_bulk({i for a in answers for i in a.selected_option_ids})
+        for answer in answers:
+            selected_options = [options[i] for i in answer.selected_option_ids if i in options]
+            if selected_options:
+                # Count individual options
+                option_labels = []
+                for option in selected_options:
+                    label = option.label or option.text or option.value
+                    option_counts[label] += 1
+                    option_labels.append(label)
+                
+                # Count combinations
+                combination = ', '.join(sorted(option_labels))
+                combination_counts[combination] += 1
+        
+        analysis['option_distribution'] = dict(option_counts)
+        analysis['combination_distribution'] = dict(combination_counts)
+        
+    elif question.question_type == 'rating':
+        # Calculate rating statistics
+        ratings = [a.rating_value for a in answers if a.rating_value is not None]
+        if ratings:
+            analysis['average_rating'] = sum(ratings) / len(ratings)
+            analysis['rating_distribution'] = {
+                str(i): ratings.count(i) for i in range(1, 6)  # Assuming 1-5 scale
+            }
+            analysis['total_ratings'] = len(ratings)
+        
+    elif question.question_type == 'number':
+        # Calculate number statistics
+        numbers = [a.number_value for a in answers if a.number_value is not None]
+        if numbers:
+            analysis['average'] = sum(numbers) / len(numbers)
+            analysis['minimum'] = min(numbers)
+            analysis['maximum'] = max(numbers)
+            analysis['total_numeric_responses'] = len(numbers)
+        
+    elif question.question_type in ['text', 'text_area']:
+        # Analyze text responses
+        text_responses = [a.text_value for a in answers if a.text_value]
+        analysis['total_text_responses'] = len(text_responses)
+        analysis['average_length'] = sum(len(text) for text in text_responses) / len(text_responses) if text_responses else 0
+        
+        # You could add more text analysis here (sentiment, keywords, etc.)
+        # analysis['sample_responses'] = text_responses[:5]  # First 5 responses as sample
+    
+    return analysis
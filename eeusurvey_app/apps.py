@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class EeusurveyAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'eeusurvey_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
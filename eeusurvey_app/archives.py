@@ -0,0 +1,279 @@
+# archives.py
+import gzip
+import json
+import os
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .analysis import category_summary_data, question_chart_data, survey_analysis_data
+from .dashboard import invalidate_dashboard
+from .documents import materialize_survey
+from .export_jobs import file_checksum
+from .imports import insert_rows
+from .models import Answer, QuestionOption, Survey, SurveyArchive, SurveyResponse
+from .purge import PURGE_BATCH_SIZE, purge_responses
+from .survey_cache import invalidate_surveys
+
+ARCHIVE_BATCH_SIZE = 1000
+# A restore that hasn't finished a batch for this long may be claimed again
+STALE_RESTORE_AFTER = timedelta(minutes=10)
+# Columns written to the archive file; answers_materialized is always true there
+RESPONSE_FIELDS = ['id', 'submitted_at', 'ip_address', 'user_agent', 'session_id', 'is_complete', 'answer_document']
+ANSWER_FIELDS = [
+    'id', 'question_id', 'selected_option_id', 'option_ids', 'text_value',
+    'rating_value', 'number_value', 'custom_text', 'created_at',
+]
+
+
+class ArchiveError(Exception):
+    """An archive file is missing or doesn't match what was recorded for it"""
+
+
+def archive_root():
+    os.makedirs(settings.ARCHIVE_ROOT, exist_ok=True)
+    return settings.ARCHIVE_ROOT
+
+
+def archivable_surveys(days=None, include_restored=False):
+    """Surveys that ended more than `days` ago and still have their responses in the live tables.
+
+    Restored surveys were brought back on purpose and are left alone unless include_restored.
+    """
+    if days is None:
+        days = settings.ARCHIVE_AFTER_DAYS
+    cutoff = timezone.now().date() - timedelta(days=days)
+    surveys = Survey.objects.filter(end_time__lte=cutoff, archive__isnull=True, deleted_at__isnull=True)
+    if not include_restored:
+        surveys = surveys.filter(restored_at__isnull=True)
+    return surveys
+
+
+def interrupted_archives():
+    """Archives whose file was written but whose live rows weren't all purged yet"""
+    return SurveyArchive.objects.filter(status='archiving').select_related('survey')
+
+
+def _json_default(value):
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def final_statistics(survey):
+    """Everything the analysis API and admin pages show, as it stands before archiving"""
+    analysis = survey_analysis_data(survey)
+    total = analysis['survey']['total_responses']
+    sections = {}
+    for question in survey.questions.select_related('category'): # type: ignore
+        sections[f"question:{question.id}"] = question_chart_data(question, total)
+    for category in survey.categories.all(): # type: ignore
+        sections[f"category:{category.id}"] = category_summary_data(category)
+    return {'analysis': analysis, 'sections': sections}
+
+
+def write_archive(survey, path, batch_size=ARCHIVE_BATCH_SIZE):
+    """Write each response with its answers as one gzip-compressed JSON line; returns (responses, answers)"""
+    responses = survey.responses.order_by('id') # type: ignore
+    written = answers_written = 0
+    last_id = None
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        while True:
+            page = responses if last_id is None else responses.filter(id__gt=last_id)
+            batch = list(page.values(*RESPONSE_FIELDS)[:batch_size])
+            if not batch:
+                return written, answers_written
+            answers = defaultdict(list)
+            for answer in Answer.objects.filter(response_id__in=[r['id'] for r in batch]).values('response_id', *ANSWER_FIELDS):
+                answers[answer.pop('response_id')].append(answer)
+            for record in batch:
+                record['answers'] = answers.pop(record['id'], [])
+                answers_written += len(record['answers'])
+                f.write(json.dumps(record, default=_json_default, ensure_ascii=False) + '\n')
+            written += len(batch)
+            last_id = batch[-1]['id']
+
+
+def read_archive(path, batch_size=ARCHIVE_BATCH_SIZE):
+    """Archived response records, a batch at a time"""
+    batch = []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            batch.append(json.loads(line))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def purge_archived(archive, batch_size=PURGE_BATCH_SIZE):
+    """Delete the live copies of the responses in the archive file; safe to re-run.
+
+    Archiving moves responses rather than deleting them, so no ResponseTombstones
+    are written: incremental exports keep what they already have, and a restore
+    brings the same ids back through the cursor.
+    """
+    purged = 0
+    for batch in read_archive(archive.file_path, batch_size):
+        purged += purge_responses([uuid.UUID(record['id']) for record in batch])
+    return purged
+
+
+def archive_survey(survey, batch_size=PURGE_BATCH_SIZE):
+    """Move a closed survey's responses into a compressed file and keep its final statistics.
+
+    Only responses that made it into the verified file are deleted, in short
+    batches, so anything submitted meanwhile stays live.
+    """
+    # the survey may still be flagged active if it hasn't been saved since it ended
+    Survey.objects.filter(pk=survey.pk).update(is_active=False, restored_at=None)
+    invalidate_surveys()
+    materialize_survey(survey.id)
+    statistics = final_statistics(survey)
+
+    path = os.path.join(archive_root(), f"{survey.id}.jsonl.gz")
+    part_path = path + '.part'
+    try:
+        response_count, answer_count = write_archive(survey, part_path)
+        os.replace(part_path, path)
+    except Exception:
+        if os.path.exists(part_path):
+            os.unlink(part_path)
+        raise
+
+    archive = SurveyArchive.objects.create(
+        survey=survey,
+        file_path=path,
+        file_size=os.path.getsize(path),
+        checksum=file_checksum(path),
+        response_count=response_count,
+        answer_count=answer_count,
+        statistics=statistics,
+    )
+    finish_archive(archive, batch_size)
+    invalidate_dashboard()
+    return archive
+
+
+def finish_archive(archive, batch_size=PURGE_BATCH_SIZE):
+    """Purge the archived rows and mark the archive done (also resumes an interrupted run)"""
+    purged = purge_archived(archive, batch_size)
+    if SurveyArchive.objects.filter(pk=archive.pk, status='archiving').update(status='archived'):
+        archive.status = 'archived'
+    return purged
+
+
+def claim_restore(survey):
+    """Mark the survey's archive as restoring and return it; raises ArchiveError if it can't be"""
+    archive = SurveyArchive.objects.filter(survey=survey).first()
+    if archive is None:
+        raise ArchiveError("The survey has no archive")
+    stale = timezone.now() - STALE_RESTORE_AFTER
+    # one conditional UPDATE, so two restores (or a restore and a purge) can't both proceed
+    claimed = SurveyArchive.objects.filter(
+        Q(status__in=['archived', 'failed']) | Q(status='restoring', updated_at__lt=stale), pk=archive.pk,
+    ).update(status='restoring', error='', restored_responses=0, updated_at=timezone.now())
+    if not claimed:
+        raise ArchiveError(f"The archive is {archive.get_status_display().lower()}, it can't be restored now") # type: ignore
+    archive.refresh_from_db()
+    return archive
+
+
+def run_restore(archive, batch_size=ARCHIVE_BATCH_SIZE):
+    """Restore a claimed archive, recording a failure on it; returns how many responses came back"""
+    try:
+        return _restore(archive, batch_size)
+    except Exception as e:
+        SurveyArchive.objects.filter(pk=archive.pk).update(status='failed', error=str(e), updated_at=timezone.now())
+        raise
+
+
+def restore_survey(survey, batch_size=ARCHIVE_BATCH_SIZE):
+    """Load an archived survey's responses back into the live tables; returns how many were restored"""
+    return run_restore(claim_restore(survey), batch_size)
+
+
+def _restore(archive, batch_size):
+    survey = archive.survey
+    if not os.path.exists(archive.file_path):
+        raise ArchiveError(f"Archive file {archive.file_path} is missing")
+    if file_checksum(archive.file_path) != archive.checksum:
+        raise ArchiveError(f"Archive file {archive.file_path} does not match its checksum")
+
+    question_ids = set(survey.questions.values_list('id', flat=True)) # type: ignore
+    option_ids = set(QuestionOption.objects.filter(survey=survey).values_list('id', flat=True))
+    restored = 0
+    for batch in read_archive(archive.file_path, batch_size):
+        # a re-run after an interruption skips what is already back
+        live = set(SurveyResponse.objects.filter(
+            id__in=[record['id'] for record in batch]
+        ).values_list('id', flat=True))
+        records = [record for record in batch if uuid.UUID(record['id']) not in live]
+        for record in records:
+            record['submitted_at'] = parse_datetime(record['submitted_at'])
+        with transaction.atomic():
+            insert_rows(
+                SurveyResponse,
+                # a new created_at hands the restored rows to incremental exports again
+                RESPONSE_FIELDS + ['survey', 'answers_materialized', 'created_at'],
+                [
+                    [record[field] for field in RESPONSE_FIELDS] + [survey.id, True, timezone.now()]
+                    for record in records
+                ],
+            )
+            insert_rows(
+                Answer,
+                ['response'] + ANSWER_FIELDS,
+                [
+                    [
+                        record['id'], answer['id'], answer['question_id'],
+                        answer['selected_option_id'] if answer['selected_option_id'] in option_ids else None,
+                        answer['option_ids'], answer['text_value'], answer['rating_value'],
+                        answer['number_value'], answer['custom_text'], parse_datetime(answer['created_at']),
+                    ]
+                    for record in records
+                    for answer in record['answers']
+                    # questions deleted since archiving take their answers with them
+                    if answer['question_id'] in question_ids
+                ],
+            )
+        restored += len(records)
+        SurveyArchive.objects.filter(pk=archive.pk).update(restored_responses=restored, updated_at=timezone.now())
+
+    with transaction.atomic():
+        Survey.objects.filter(pk=survey.pk).update(restored_at=timezone.now())
+        archive.delete()
+    os.unlink(archive.file_path)
+    invalidate_dashboard()
+    return restored
+
+
+def start_restore(survey):
+    """Claim the archive, then restore on a daemon thread so the admin request returns immediately.
+
+    Raises ArchiveError if the archive can't be claimed; later failures are recorded
+    on the archive (status "failed" and its error), where the admin shows them.
+    """
+    archive = claim_restore(survey)
+
+    def target():
+        try:
+            run_restore(archive)
+        except Exception:
+            pass  # recorded on the archive by run_restore
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=target, name=f"restore-{survey.id}", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,170 @@
+# benchmarks.py
+import contextlib
+import platform
+import random
+import statistics
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from .analysis import analyze_survey_responses
+from .purge import request_survey_deletion, run_survey_deletion
+from .synthetic import ResponseGenerator, create_survey
+
+BENCHMARK_USER = 'benchmark'
+
+
+class QueryCounter:
+    """Execute wrapper counting the queries sent to every configured database"""
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    @contextlib.contextmanager
+    def installed(self):
+        with contextlib.ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class BenchmarkSuite:
+    """Times the hot paths against synthetic surveys of each size.
+
+    Requests go through the test client, so middleware, routing and
+    serialization are included; only the network is not.
+    """
+
+    def __init__(self, sizes, repeat=5, seed=None, log=None):
+        self.sizes = sizes
+        self.repeat = repeat
+        self.rng = random.Random(seed)
+        self.log = log or (lambda message: None)
+        self.client = Client()
+
+    def cases(self, survey, generator):
+        survey_id = survey.id
+        submissions = iter(range(10 ** 9))
+
+        def get(url):
+            response = self.client.get(url)
+            assert response.status_code == 200, f"GET {url}: {response.status_code}"
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+                response.close()
+
+        def submit():
+            response = self.client.post(
+                '/api/responses/submit/', generator.submission(next(submissions)), content_type='application/json',
+            )
+            assert response.status_code == 201, f"submit: {response.status_code} {response.content[:200]}"
+
+        return {
+            'submit': submit,
+            'survey_retrieve': lambda: get(f'/api/surveys/{survey_id}/'),
+            'survey_list': lambda: get(f'/api/surveys/?lang={survey.language}'),
+            'get_survey_analysis': lambda: get(f'/api/surveys/{survey_id}/analysis/'),
+            'analyze_survey_responses': lambda: analyze_survey_responses(survey_id),
+            'csv_export': lambda: get(f'/admin/eeusurvey_app/survey/{survey_id}/export/'),
+            'admin_survey_changelist': lambda: get('/admin/eeusurvey_app/survey/'),
+            'admin_response_changelist': lambda: get(
+                f'/admin/eeusurvey_app/surveyresponse/?survey__id__exact={survey_id}'
+            ),
+            'admin_answer_changelist': lambda: get('/admin/eeusurvey_app/answer/'),
+        }
+
+    def measure(self, case):
+        case()  # warm-up: template loading, first connection, query plan caches
+        timings, queries = [], 0
+        for _ in range(self.repeat):
+            counter = QueryCounter()
+            with counter.installed():
+                started = time.perf_counter()
+                case()
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, counter.count)
+        return {
+            'runs': len(timings),
+            'wall_ms': {
+                'min': round(min(timings), 2),
+                'median': round(statistics.median(timings), 2),
+                'mean': round(statistics.fmean(timings), 2),
+                'max': round(max(timings), 2),
+            },
+            'queries': queries,
+        }
+
+    def run(self, only=None, keep_data=False):
+        user, created_user = User.objects.get_or_create(
+            username=BENCHMARK_USER, defaults={'is_staff': True, 'is_superuser': True},
+        )
+        self.client.force_login(user)
+        surveys = []
+        results = []
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                for size in self.sizes:
+                    started = time.perf_counter()
+                    survey = create_survey('en', rng=self.rng, title=f"Benchmark {size}")
+                    surveys.append(survey)
+                    generator = ResponseGenerator(survey, self.rng)
+                    generator.insert(size)
+                    self.log(f"{size} responses generated in {time.perf_counter() - started:.1f}s")
+                    for name, case in self.cases(survey, generator).items():
+                        if only and name not in only:
+                            continue
+                        result = {'case': name, 'size': size, **self.measure(case)}
+                        results.append(result)
+                        self.log(
+                            f"  {name:<28} median {result['wall_ms']['median']:>9.1f} ms  "
+                            f"{result['queries']:>5} queries"
+                        )
+        finally:
+            if not keep_data:
+                for survey in surveys:
+                    run_survey_deletion(request_survey_deletion(survey, BENCHMARK_USER))
+                if created_user:
+                    user.delete()
+
+        return {
+            'created_at': timezone.now().isoformat(),
+            'commit': git_commit(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sizes': self.sizes,
+            'repeat': self.repeat,
+            'results': results,
+        }
+
+
+def compare(previous, current):
+    """(case, size, previous median, current median, ratio) for cases present in both runs"""
+    before = {(result['case'], result['size']): result['wall_ms']['median'] for result in previous['results']}
+    rows = []
+    for result in current['results']:
+        key = (result['case'], result['size'])
+        if key in before:
+            now = result['wall_ms']['median']
+            rows.append((*key, before[key], now, now / before[key] if before[key] else None))
+    return rows
@@ -0,0 +1,45 @@
+# categories.py
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from .models import QuestionCategory
+from .survey_cache import invalidate_surveys
+
+
+def reorder_categories(survey, category_ids):
+    """Number a survey's categories 1..n in the given order; returns the new order of ids.
+
+    Categories missing from category_ids follow the listed ones in their current
+    order. Two set-based UPDATEs whatever the number of categories: the first writes
+    the new order above every existing number and the second shifts it down, so no
+    row ever collides with one not yet rewritten on the unique constraint.
+    """
+    with transaction.atomic():
+        current = list(
+            QuestionCategory.objects.select_for_update()
+            .filter(survey=survey)
+            .order_by(F('cat_number').asc(nulls_last=True), 'id')
+            .values_list('id', 'cat_number')
+        )
+        known = {category_id for category_id, _ in current}
+        listed = list(dict.fromkeys(int(category_id) for category_id in category_ids))
+        unknown = [category_id for category_id in listed if category_id not in known]
+        if unknown:
+            raise ValueError(f"Categories {unknown} do not belong to this survey")
+        order = listed + [category_id for category_id, _ in current if category_id not in set(listed)]
+        if not order:
+            return order
+
+        categories = QuestionCategory.objects.filter(survey=survey)
+        offset = len(order) + max((number or 0 for _, number in current), default=0)
+        categories.update(cat_number=Value(offset) + Case(
+            *[When(id=category_id, then=Value(position)) for position, category_id in enumerate(order, 1)]
+        ))
+        categories.update(cat_number=F('cat_number') - offset)
+        invalidate_surveys()
+    return order
+
+
+def renumber_categories(survey):
+    """Close gaps in a survey's numbering, keeping the current order"""
+    return reorder_categories(survey, [])
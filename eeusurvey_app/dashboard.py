@@ -0,0 +1,93 @@
+# dashboard.py
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Question, Survey, SurveyResponse
+from .routers import replica_reads
+
+# holds (computed at, stats)
+DASHBOARD_CACHE_KEY = 'eeusurvey:dashboard:timed'
+
+
+def _count_by_survey(model):
+    return Coalesce(Subquery(
+        model.objects.filter(survey=OuterRef('pk'))
+        .order_by().values('survey').annotate(c=Count('id')).values('c')
+    ), 0)
+
+
+@replica_reads()
+def compute_dashboard_stats():
+    """All dashboard numbers from one grouped survey query plus the two recent lists"""
+    surveys = list(
+        Survey.objects
+        .filter(deleted_at__isnull=True)
+        .annotate(
+            live_total=_count_by_survey(SurveyResponse),
+            # archived surveys keep their count on SurveyArchive
+            response_total=F('live_total') + Coalesce(F('archive__response_count'), 0),
+            question_total=_count_by_survey(Question),
+        )
+        .order_by('-created_at')
+    )
+
+    survey_stats = [
+        {
+            'id': str(survey.id),
+            'title': survey.title,
+            'language': survey.language,
+            'language_display': survey.get_language_display(), # type: ignore
+            'response_count': survey.response_total,
+            'question_count': survey.question_total,
+            'completion_rate': (survey.response_total / max(survey.question_total, 1)) * 100,
+        }
+        for survey in surveys if survey.is_active
+    ]
+    recent_responses = [
+        {
+            'id': str(response.id),
+            'survey_title': response.survey.title,
+            'submitted_at': response.submitted_at,
+        }
+        for response in SurveyResponse.objects.select_related('survey')[:10]
+    ]
+    recent_surveys = [
+        {
+            'id': str(survey.id),
+            'title': survey.title,
+            'created_at': survey.created_at,
+            'is_active': survey.is_active,
+        }
+        for survey in surveys[:5]
+    ]
+
+    return {
+        'total_surveys': len(surveys),
+        'active_surveys': len(survey_stats),
+        'total_responses': sum(survey.response_total for survey in surveys),
+        'recent_responses': recent_responses,
+        'recent_surveys': recent_surveys,
+        'survey_stats': survey_stats,
+    }
+
+
+def dashboard_stats():
+    """Dashboard numbers from the shared cache, recomputed at most once per TTL"""
+    cached = cache.get(DASHBOARD_CACHE_KEY)
+    if cached is None:
+        cached = (time.time(), compute_dashboard_stats())
+        cache.set(DASHBOARD_CACHE_KEY, cached, settings.DASHBOARD_CACHE_TTL)
+    return cached[1]
+
+
+def invalidate_dashboard(min_age=0):
+    """Drop the cached numbers; with min_age, only if they were computed at least that many seconds ago"""
+    if min_age:
+        cached = cache.get(DASHBOARD_CACHE_KEY)
+        if cached is None or time.time() - cached[0] < min_age:
+            return
+    cache.delete(DASHBOARD_CACHE_KEY)
@@ -0,0 +1,143 @@
+# documents.py
+from django.db import transaction
+
+from .models import Answer, Question, QuestionOption, Survey, SurveyResponse
+
+MATERIALIZE_BATCH_SIZE = 500
+
+
+def submitted_option_ids(answer_data):
+    """Option ids of a submitted answer, from selected_option_id and/or selected_option_ids"""
+    option_ids = []
+    if answer_data.get('selected_option_id'):
+        option_ids.append(int(answer_data['selected_option_id']))
+    option_ids.extend(int(option_id) for option_id in answer_data.get('selected_option_ids') or [])
+    return option_ids
+
+
+def submitted_entries(question_types, responses_data):
+    """{question_id: (answer_data, option_ids)} of the answers to known questions, the first per question"""
+    entries = {}
+    for response_data in responses_data:
+        try:
+            question_id = int(response_data.get('question_id'))
+        except (TypeError, ValueError):
+            continue
+        if question_id not in question_types or question_id in entries:
+            continue
+        answer_data = response_data.get('answer', {})
+        entries[question_id] = (answer_data, submitted_option_ids(answer_data))
+    return entries
+
+
+def answer_document(question_types, entries, existing):
+    """The JSON-ready list for submitted_entries(), keeping only the option ids in `existing`"""
+    document = []
+    for question_id, (answer_data, option_ids) in entries.items():
+        option_ids = [option_id for option_id in option_ids if option_id in existing]
+        if question_types[question_id] != 'multi_select':
+            option_ids = option_ids[:1]
+        document.append({
+            'question_id': question_id,
+            'option_ids': option_ids,
+            'text_value': answer_data.get('text_value'),
+            'rating_value': answer_data.get('rating_value'),
+            'number_value': answer_data.get('number_value'),
+            'custom_text': answer_data.get('text_value') if answer_data.get('is_other') else None,
+        })
+    return document
+
+
+def build_answer_document(survey, responses_data):
+    """Validate submitted answers in two queries and return them as a JSON-ready list.
+
+    Unknown questions and options are skipped, like the normalized submit path.
+    """
+    question_types = dict(Question.objects.filter(survey=survey).values_list('id', 'question_type'))
+    entries = submitted_entries(question_types, responses_data)
+    all_option_ids = {option_id for _, option_ids in entries.values() for option_id in option_ids}
+    existing = set(
+        QuestionOption.objects.filter(id__in=all_option_ids).values_list('id', flat=True)
+    ) if all_option_ids else set()
+    return answer_document(question_types, entries, existing)
+
+
+async def abuild_answer_document(question_types, responses_data):
+    """build_answer_document on the async ORM, given the survey's {question id: question type}"""
+    entries = submitted_entries(question_types, responses_data)
+    all_option_ids = {option_id for _, option_ids in entries.values() for option_id in option_ids}
+    options = QuestionOption.objects.filter(id__in=all_option_ids).values_list('id', flat=True)
+    existing = {option_id async for option_id in options} if all_option_ids else set()
+    return answer_document(question_types, entries, existing)
+
+
+def document_answers(response_id, document, question_types, existing=None):
+    """Unsaved Answer rows for a document, skipping questions deleted since the submission
+    and, when `existing` is given, options that are no longer there"""
+    answers = []
+    for entry in document or []:
+        question_type = question_types.get(entry.get('question_id'))
+        if question_type is None:
+            continue
+        option_ids = entry.get('option_ids', [])
+        if existing is not None:
+            option_ids = [option_id for option_id in option_ids if option_id in existing]
+        answer = Answer(
+            response_id=response_id,
+            question_id=entry['question_id'],
+            text_value=entry.get('text_value'),
+            rating_value=entry.get('rating_value'),
+            number_value=entry.get('number_value'),
+            custom_text=entry.get('custom_text'),
+        )
+        answer.set_selected_option_ids(option_ids, multiple=question_type == 'multi_select')
+        answers.append(answer)
+    return answers
+
+
+def document_option_ids(document):
+    return [option_id for entry in document or [] for option_id in entry.get('option_ids', [])]
+
+
+def materialize_survey(survey_id, batch_size=MATERIALIZE_BATCH_SIZE):
+    """Create the Answer rows of a survey's pending document-mode responses; returns how many responses"""
+    pending = SurveyResponse.objects.filter(survey_id=survey_id, answers_materialized=False)
+    if not pending.exists():
+        return 0
+    question_types = dict(Question.objects.filter(survey_id=survey_id).values_list('id', 'question_type'))
+    materialized = 0
+    while True:
+        with transaction.atomic():
+            # skip_locked lets several materializers (or an export) share the backlog
+            batch = list(
+                pending.select_for_update(skip_locked=True)
+                .only('id', 'answer_document')
+                .order_by()[:batch_size]
+            )
+            if not batch:
+                return materialized
+
+            option_ids = {option_id for r in batch for option_id in document_option_ids(r.answer_document)}
+            existing = set(
+                QuestionOption.objects.filter(id__in=option_ids).values_list('id', flat=True)
+            ) if option_ids else set()
+
+            answers = [
+                answer
+                for survey_response in batch
+                for answer in document_answers(
+                    survey_response.id, survey_response.answer_document, question_types, existing,
+                )
+            ]
+
+            Answer.objects.bulk_create(answers, ignore_conflicts=True)
+            SurveyResponse.objects.filter(id__in=[r.id for r in batch]).update(answers_materialized=True)
+            materialized += len(batch)
+
+
+def materialize_pending(batch_size=MATERIALIZE_BATCH_SIZE):
+    """Materialize every survey's backlog; returns the number of responses processed"""
+    return sum(
+        materialize_survey(survey_id, batch_size)
+        for survey_id in Survey.objects.filter(deleted_at__isnull=True).values_list('id', flat=True)
+    )
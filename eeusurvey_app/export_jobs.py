@@ -0,0 +1,216 @@
+# export_jobs.py
+import gzip
+import hashlib
+import os
+import re
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from django.utils import timezone
+
+from . import exports
+from .documents import materialize_survey
+from .models import ExportJob
+from .routers import replica_reads
+
+# format -> (stream, number of header lines that aren't responses)
+JOB_STREAMS = {
+    'csv': (exports.stream_csv, 1),
+    'jsonl': (exports.stream_jsonl, 0),
+}
+JOB_FORMATS = list(JOB_STREAMS) + ['csv.gz', 'sqlite']
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'csv.gz': 'application/gzip',
+    'jsonl': 'application/x-ndjson',
+    'sqlite': 'application/vnd.sqlite3',
+}
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# A running job that hasn't reported progress for this long is assumed dead and requeued
+STALE_EXPORT_AFTER = timedelta(minutes=10)
+
+
+def export_root():
+    os.makedirs(settings.EXPORT_ROOT, exist_ok=True)
+    return settings.EXPORT_ROOT
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def create_export_job(survey, export_format):
+    if export_format not in JOB_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+    return ExportJob.objects.create(
+        survey=survey,
+        export_format=export_format,
+        total_responses=survey.responses.count(), # type: ignore
+    )
+
+
+def claim_export_job(job):
+    """Move a pending job to running; False if another worker (thread or command) got it first"""
+    claimed = ExportJob.objects.filter(pk=job.pk, status='pending').update(
+        status='running', updated_at=timezone.now()
+    )
+    if claimed:
+        job.status = 'running'
+    return bool(claimed)
+
+
+def requeue_stale_export_jobs():
+    """Put jobs left running by a worker that died (e.g. a restart) back in the queue"""
+    stale = timezone.now() - STALE_EXPORT_AFTER
+    return ExportJob.objects.filter(status='running', updated_at__lt=stale).update(
+        status='pending', processed_responses=0, updated_at=timezone.now()
+    )
+
+
+def run_export_job(job):
+    """Claim `job` and write its export file, updating its progress as chunks are written.
+
+    Returns the job, or None if it wasn't pending any more (someone else is running it).
+    """
+    if not claim_export_job(job):
+        return None
+
+    extension = 'sqlite3' if job.export_format == 'sqlite' else job.export_format
+    path = os.path.join(export_root(), f"{job.id}.{extension}")
+    part_path = path + '.part'
+
+    def report(processed):
+        ExportJob.objects.filter(pk=job.pk).update(processed_responses=processed, updated_at=timezone.now())
+
+    try:
+        # the worker writes the Answer rows of pending document-mode responses;
+        # exports served to a request only read what is already there
+        materialize_survey(job.survey_id) # type: ignore
+        if job.export_format == 'sqlite':
+            exports.build_sqlite_snapshot(job.survey, part_path, progress=report)
+            checksum = file_checksum(part_path)
+        else:
+            fmt = 'csv' if job.export_format == 'csv.gz' else job.export_format
+            stream, header_lines = JOB_STREAMS[fmt]
+            opener = gzip.open if job.export_format == 'csv.gz' else open
+            with opener(part_path, 'wb') as f:
+                # chunks are single lines, or blocks of many lines when streamed with COPY
+                lines, next_report = 0, exports.EXPORT_CHUNK_SIZE
+                for chunk in stream(job.survey):
+                    f.write(chunk.encode('utf-8'))
+                    lines += chunk.count('\n')
+                    if lines >= next_report:
+                        report(min(max(lines - header_lines, 0), job.total_responses))
+                        next_report = lines + exports.EXPORT_CHUNK_SIZE
+            checksum = file_checksum(part_path)
+        os.replace(part_path, path)
+    except Exception as e:
+        if os.path.exists(part_path):
+            os.unlink(part_path)
+        job.status = 'failed'
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        return job
+
+    job.status = 'finished'
+    job.processed_responses = job.total_responses
+    job.file_path = path
+    job.file_size = os.path.getsize(path)
+    job.checksum = checksum
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'processed_responses', 'file_path', 'file_size', 'checksum', 'finished_at'])
+    return job
+
+
+def start_export_job(job):
+    """Run the job on a daemon thread so the request that queued it returns immediately"""
+    def target():
+        try:
+            # threads start with a fresh context, so opt in to the replica here
+            with replica_reads():
+                run_export_job(job)
+            cleanup_export_files()
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=target, name=f"export-{job.id}", daemon=True)
+    thread.start()
+    return thread
+
+
+def cleanup_export_files(max_age=None, max_total_bytes=None):
+    """Expire finished exports older than max_age, then the oldest ones until under max_total_bytes"""
+    if max_age is None:
+        max_age = timedelta(days=settings.EXPORT_MAX_AGE_DAYS)
+    if max_total_bytes is None:
+        max_total_bytes = settings.EXPORT_MAX_TOTAL_MB * 1024 * 1024
+
+    finished = list(ExportJob.objects.filter(status='finished').order_by('finished_at'))
+    total = sum(job.file_size for job in finished)
+    cutoff = timezone.now() - max_age
+
+    expired = []
+    for job in finished:
+        if job.finished_at < cutoff or total > max_total_bytes:
+            if job.file_path and os.path.exists(job.file_path):
+                os.unlink(job.file_path)
+            total -= job.file_size
+            expired.append(job.pk)
+
+    ExportJob.objects.filter(pk__in=expired).update(status='expired', file_path='')
+    return len(expired)
+
+
+def ranged_file_response(request, path, filename, content_type, checksum=''):
+    """Serve `path`, honouring a single `Range: bytes=` request so downloads can resume"""
+    size = os.path.getsize(path)
+    match = RANGE_RE.match(request.headers.get('Range', '').strip())
+    if_range = request.headers.get('If-Range')
+    if match and (not if_range or if_range.strip('"') == checksum):
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        elif last:
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start, end = 0, size - 1
+        if start >= size or start > end:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        f = open(path, 'rb')
+        f.seek(start)
+        response = StreamingHttpResponse(_limited_reader(f, end - start + 1), status=206, content_type=content_type)
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type, as_attachment=True, filename=filename)
+
+    response['Accept-Ranges'] = 'bytes'
+    if checksum:
+        response['ETag'] = f'"{checksum}"'
+        response['X-Checksum-SHA256'] = checksum
+    return response
+
+
+def _limited_reader(f, length, block_size=64 * 1024):
+    try:
+        while length > 0:
+            block = f.read(min(block_size, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        f.close()
@@ -0,0 +1,375 @@
+# exports.py
+import base64
+import binascii
+import csv
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import uuid
+import zlib
+from datetime import datetime, timedelta
+
+from django.db import connections, router
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import QuestionOption, ResponseTombstone, SurveyResponse
+from .pg_copy import CopyExportQuery, copy_out, copy_supported
+from .pivot import PivotQueryBuilder
+
+EXPORT_CHUNK_SIZE = 500
+INCREMENTAL_EXPORT_LIMIT = 1000
+# Responses newer than this are held back so a slow transaction that commits
+# after a cursor was issued can't be skipped over.
+INCREMENTAL_EXPORT_LAG = timedelta(seconds=5)
+CHOICE_TYPES = ['single_choice', 'drop_down', 'multi_select']
+
+
+class Echo:
+    """File-like object that hands back what is written (for streaming csv)"""
+    def write(self, value):
+        return value
+
+
+class TemporaryExportFile(io.FileIO):
+    """Read handle on a temporary export file that removes it when closed"""
+    def close(self):
+        super().close()
+        if os.path.exists(self.name):
+            os.unlink(self.name)
+
+
+def option_text(option):
+    return option.label or option.text or option.value
+
+
+def export_questions(survey):
+    return list(survey.questions.all().order_by('category__cat_number', 'id')) # type: ignore
+
+
+def option_lookup(survey):
+    """option id -> QuestionOption for the survey, to resolve Answer.selected_option_ids"""
+    return QuestionOption.objects.filter(survey=survey).in_bulk()
+
+
+def selected_options(answer, options):
+    return [options[option_id] for option_id in answer.selected_option_ids if option_id in options]
+
+
+def iter_responses(survey, chunk_size=EXPORT_CHUNK_SIZE):
+    """Iterate responses with their answers prefetched one chunk at a time"""
+    return (
+        survey.responses.all() # type: ignore
+        .prefetch_related('answers')
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def cell_value(question, answer, options):
+    """Flatten an answer into a single csv cell"""
+    if answer is None:
+        return ''
+    if question.question_type in CHOICE_TYPES:
+        selected = selected_options(answer, options)
+        if not selected:
+            return ''
+        cell = '; '.join(option_text(opt) for opt in selected)
+        if answer.custom_text:
+            cell += f" (Other: {answer.custom_text})"
+        return cell
+    if question.question_type == 'rating':
+        return answer.rating_value or ''
+    if question.question_type == 'number':
+        return answer.number_value or ''
+    return answer.text_value or ''
+
+
+def typed_value(question, answer, options):
+    """Answer value keeping its native type (used by json lines)"""
+    if question.question_type in CHOICE_TYPES:
+        selected = [{'id': opt.id, 'label': option_text(opt)} for opt in selected_options(answer, options)]
+        if question.question_type == 'multi_select':
+            return selected
+        return selected[0] if selected else None
+    if question.question_type == 'rating':
+        return answer.rating_value
+    if question.question_type == 'number':
+        return answer.number_value
+    return answer.text_value
+
+
+def pivot_cell(question, value):
+    """Format a PivotQueryBuilder value the same way cell_value formats an Answer"""
+    if value is None:
+        return ''
+    if question.question_type in CHOICE_TYPES:
+        labels, custom_text = value
+        if not labels:
+            return ''
+        if custom_text:
+            labels += f" (Other: {custom_text})"
+        return labels
+    return value or ''
+
+
+def csv_headers(questions):
+    return ['Response ID', 'Submitted At'] + [f"Q{q.id}: {q.question_text[:50]}" for q in questions]
+
+
+def read_connection():
+    """Connection the router picks for response reads (the replica inside replica_reads())"""
+    return connections[router.db_for_read(SurveyResponse)]
+
+
+def csv_rows(survey):
+    """Header row followed by one row per response, pivoted in the database"""
+    questions = export_questions(survey)
+    yield csv_headers(questions)
+
+    for response_id, submitted_at, values in PivotQueryBuilder(survey, questions).rows():
+        row = [str(response_id), submitted_at.strftime('%Y-%m-%d %H:%M:%S')]
+        for question, value in zip(questions, values):
+            row.append(pivot_cell(question, value))
+        yield row
+
+
+def stream_csv(survey):
+    if copy_supported(read_connection()):
+        yield from copy_csv(survey)
+        return
+    writer = csv.writer(Echo())
+    for row in csv_rows(survey):
+        yield writer.writerow(row)
+
+
+def copy_csv(survey):
+    """stream_csv on PostgreSQL: the server formats the rows and streams them with COPY TO"""
+    connection = read_connection()
+    questions = export_questions(survey)
+    # COPY ends rows with \n, so the header does too
+    yield csv.writer(Echo(), lineterminator='\n').writerow(csv_headers(questions))
+    yield from copy_out(connection, CopyExportQuery(survey, connection).csv_sql(questions))
+
+
+def stream_csv_gzip(survey):
+    """Same rows as stream_csv, gzip-compressed on the fly"""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for line in stream_csv(survey):
+        chunk = compressor.compress(line.encode('utf-8'))
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+def stream_jsonl(survey):
+    """One JSON object per response, answers keyed by question label"""
+    connection = read_connection()
+    if copy_supported(connection):
+        yield from copy_out(connection, CopyExportQuery(survey, connection).jsonl_sql())
+        return
+    questions = {q.id: q for q in export_questions(survey)}
+    options = option_lookup(survey)
+    for survey_response in iter_responses(survey):
+        answers = {}
+        for answer in survey_response.answers.all():
+            question = questions.get(answer.question_id)
+            if question is None:
+                continue
+            answers[question.question_label] = {
+                'question_id': question.id,
+                'type': question.question_type,
+                'value': typed_value(question, answer, options),
+                'custom_text': answer.custom_text,
+            }
+        record = {
+            'response_id': str(survey_response.id),
+            'submitted_at': survey_response.submitted_at.isoformat(),
+            'is_complete': survey_response.is_complete,
+            'answers': answers,
+        }
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE survey (
+    id TEXT PRIMARY KEY, title TEXT, instructions TEXT, version TEXT,
+    language TEXT, start_time TEXT, end_time TEXT
+);
+CREATE TABLE category (id INTEGER PRIMARY KEY, cat_number INTEGER, name TEXT);
+CREATE TABLE question (
+    id INTEGER PRIMARY KEY, category_id INTEGER REFERENCES category(id),
+    question_type TEXT, question_text TEXT, question_label TEXT,
+    scale TEXT, required INTEGER
+);
+CREATE TABLE option (id INTEGER PRIMARY KEY, value TEXT, label TEXT, text TEXT, is_other INTEGER);
+CREATE TABLE question_option (
+    question_id INTEGER REFERENCES question(id), option_id INTEGER REFERENCES option(id),
+    PRIMARY KEY (question_id, option_id)
+);
+CREATE TABLE response (
+    id TEXT PRIMARY KEY, submitted_at TEXT, is_complete INTEGER, session_id TEXT
+);
+CREATE TABLE answer (
+    id INTEGER PRIMARY KEY, response_id TEXT REFERENCES response(id),
+    question_id INTEGER REFERENCES question(id), text_value TEXT,
+    rating_value INTEGER, number_value REAL, custom_text TEXT
+);
+CREATE TABLE answer_option (
+    answer_id INTEGER REFERENCES answer(id), option_id INTEGER REFERENCES option(id),
+    PRIMARY KEY (answer_id, option_id)
+);
+"""
+
+# Created after the load so inserts don't pay for index maintenance
+SQLITE_INDEXES = """
+CREATE INDEX question_category_idx ON question (category_id);
+CREATE INDEX response_submitted_idx ON response (submitted_at);
+CREATE INDEX answer_response_idx ON answer (response_id);
+CREATE INDEX answer_question_idx ON answer (question_id, rating_value, number_value);
+CREATE INDEX answer_option_option_idx ON answer_option (option_id);
+"""
+
+
+def build_sqlite_snapshot(survey, path, progress=None):
+    """Write a normalized, indexed copy of the survey and its responses to `path`.
+
+    `progress`, if given, is called with the number of responses written so far.
+    """
+    db = sqlite3.connect(path)
+    try:
+        db.execute('PRAGMA journal_mode = OFF')
+        db.execute('PRAGMA synchronous = OFF')
+        db.executescript(SQLITE_SCHEMA)
+
+        db.execute(
+            'INSERT INTO survey VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (str(survey.id), survey.title, survey.instructions, survey.version,
+             survey.language, survey.start_time.isoformat(), survey.end_time.isoformat())
+        )
+        db.executemany(
+            'INSERT INTO category VALUES (?, ?, ?)',
+            survey.categories.values_list('id', 'cat_number', 'name') # type: ignore
+        )
+        questions = survey.questions.all() # type: ignore
+        db.executemany(
+            'INSERT INTO question VALUES (?, ?, ?, ?, ?, ?, ?)',
+            questions.values_list('id', 'category_id', 'question_type', 'question_text',
+                                  'question_label', 'scale', 'required')
+        )
+        db.executemany(
+            'INSERT INTO option VALUES (?, ?, ?, ?, ?)',
+            survey.survey.values_list('id', 'value', 'label', 'text', 'is_other') # type: ignore
+        )
+        db.executemany(
+            'INSERT OR IGNORE INTO question_option VALUES (?, ?)',
+            questions.filter(options__isnull=False).values_list('id', 'options')
+        )
+
+        for written, survey_response in enumerate(iter_responses(survey), 1):
+            db.execute(
+                'INSERT INTO response VALUES (?, ?, ?, ?)',
+                (str(survey_response.id), survey_response.submitted_at.isoformat(),
+                 survey_response.is_complete, survey_response.session_id)
+            )
+            answers = survey_response.answers.all()
+            db.executemany(
+                'INSERT INTO answer VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(a.id, str(survey_response.id), a.question_id, a.text_value,
+                  a.rating_value, a.number_value, a.custom_text) for a in answers]
+            )
+            db.executemany(
+                'INSERT INTO answer_option VALUES (?, ?)',
+                [(a.id, option_id) for a in answers for option_id in a.selected_option_ids]
+            )
+            if progress and written % EXPORT_CHUNK_SIZE == 0:
+                progress(written)
+
+        db.executescript(SQLITE_INDEXES)
+        db.commit()
+    finally:
+        db.close()
+
+
+def sqlite_snapshot_file(survey):
+    """Build a snapshot in a temporary file and return a self-deleting handle on it"""
+    fd, path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(fd)
+    try:
+        build_sqlite_snapshot(survey, path)
+    except Exception:
+        os.unlink(path)
+        raise
+    return TemporaryExportFile(path)
+
+
+def encode_cursor(created_at, response_id, tombstone_id):
+    payload = {
+        't': created_at.isoformat() if created_at else None,
+        'id': str(response_id) if response_id else None,
+        'd': tombstone_id,
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return (created_at, response_id, tombstone_id); raises ValueError on a bad cursor"""
+    if not cursor:
+        return None, None, 0
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = datetime.fromisoformat(payload['t']) if payload.get('t') else None
+        response_id = uuid.UUID(payload['id']) if payload.get('id') else None
+        tombstone_id = int(payload.get('d') or 0)
+    except (binascii.Error, ValueError, TypeError, KeyError, AttributeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    # the keyset needs both halves; one without the other can't be resumed from
+    if (created_at is None) != (response_id is None):
+        raise ValueError("Invalid cursor: 't' and 'id' must be given together")
+    return created_at, response_id, tombstone_id
+
+
+def responses_since(survey, cursor=None, limit=INCREMENTAL_EXPORT_LIMIT):
+    """Responses and deletions after `cursor`, in the order they were written: (created_at, id).
+
+    Returns (responses, deleted_ids, next_cursor). Passing next_cursor back in
+    continues where this page stopped; an unchanged cursor means caught up.
+    """
+    created_at, response_id, tombstone_id = decode_cursor(cursor)
+
+    # created_at, not submitted_at: imported responses carry historical dates the
+    # cursor has long passed, but they are written (and stamped) now
+    responses = survey.responses.filter( # type: ignore
+        created_at__lte=timezone.now() - INCREMENTAL_EXPORT_LAG
+    )
+    # stop short of the oldest document-mode response still waiting for its Answer
+    # rows (materialize_responses writes them), so it isn't paged past without answers
+    pending = (
+        survey.responses.filter(answers_materialized=False) # type: ignore
+        .order_by('created_at', 'id').values_list('created_at', 'id').first()
+    )
+    if pending is not None:
+        responses = responses.filter(
+            Q(created_at__lt=pending[0]) | Q(created_at=pending[0], id__lt=pending[1])
+        )
+    if created_at is not None:
+        responses = responses.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=response_id)
+        )
+    responses = list(responses.order_by('created_at', 'id').prefetch_related('answers')[:limit])
+
+    tombstones = list(
+        ResponseTombstone.objects
+        .filter(survey_id=survey.id, id__gt=tombstone_id)
+        .order_by('id')
+        .values_list('id', 'response_id')[:limit]
+    )
+
+    if responses:
+        created_at, response_id = responses[-1].created_at, responses[-1].id
+    if tombstones:
+        tombstone_id = tombstones[-1][0]
+
+    next_cursor = encode_cursor(created_at, response_id, tombstone_id)
+    return responses, [str(deleted_id) for _, deleted_id in tombstones], next_cursor
@@ -0,0 +1,46 @@
+# ids.py
+import os
+import threading
+import time
+import uuid
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7():
+    """Time-ordered UUID (RFC 9562 version 7) that fits the existing UUIDField columns.
+
+    48-bit Unix millisecond timestamp, then a 12-bit counter (seeded randomly each
+    millisecond) and 62 random bits, so ids generated by one process always increase
+    and new rows land at the right-hand end of the primary key B-tree.
+    """
+    global _last_ms, _counter
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            _counter = int.from_bytes(os.urandom(2), 'big') & 0x7FF
+        else:
+            # same millisecond (or the clock stepped back): keep counting up
+            ms = _last_ms
+            _counter += 1
+            if _counter > 0xFFF:
+                ms += 1
+                _counter = 0
+        _last_ms = ms
+        counter = _counter
+
+    value = (ms & 0xFFFFFFFFFFFF) << 80
+    value |= 0x7 << 76
+    value |= counter << 64
+    value |= 0b10 << 62
+    value |= int.from_bytes(os.urandom(8), 'big') & 0x3FFFFFFFFFFFFFFF
+    return uuid.UUID(int=value)
+
+
+def uuid7_time(value):
+    """Milliseconds since the epoch encoded in a uuid7, or None for other versions"""
+    if value.version != 7:
+        return None
+    return value.int >> 80
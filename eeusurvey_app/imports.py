@@ -0,0 +1,290 @@
+# imports.py
+import csv
+import io
+import re
+import uuid
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from .dashboard import invalidate_dashboard
+from .ids import uuid7
+from .models import Answer, Question, SurveyResponse, encode_option_ids
+from .pg_copy import copy_rows_in, copy_supported
+
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 200
+CHOICE_TYPES = ['single_choice', 'drop_down', 'multi_select']
+QUESTION_HEADER_RE = re.compile(r'^Q(\d+)(?::|$)')
+OTHER_RE = re.compile(r'^(.*?) \(Other: (.*)\)$', re.S)
+DATETIME_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d']
+
+
+class ImportFormatError(Exception):
+    """The uploaded file can't be read as an export-style table"""
+
+
+def read_table(upload):
+    """Return (headers, rows) from an uploaded .csv or .xlsx file"""
+    name = upload.name.lower()
+    if name.endswith('.xlsx'):
+        try:
+            import openpyxl
+        except ImportError:
+            raise ImportFormatError("Reading .xlsx files requires openpyxl (pip install openpyxl)")
+        workbook = openpyxl.load_workbook(upload, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+    elif name.endswith('.csv'):
+        text = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        rows = csv.reader(text)
+    else:
+        raise ImportFormatError("Upload a .csv or .xlsx file")
+
+    try:
+        headers = [str(h).strip() if h is not None else '' for h in next(rows)]
+    except StopIteration:
+        raise ImportFormatError("The file is empty")
+    return headers, rows
+
+
+def normalize(value):
+    return str(value).strip().casefold()
+
+
+def insert_rows(model, field_names, rows):
+    """COPY FROM on PostgreSQL, executemany INSERT elsewhere.
+
+    Both skip per-object ORM work (and auto_now_add, so paper dates survive).
+    """
+    fields = [model._meta.get_field(name) for name in field_names]
+    db = connections[DEFAULT_DB_ALIAS]  # resolve the thread-local proxy once, not per value
+    params = [
+        [None if value is None else field.get_db_prep_save(value, db) for field, value in zip(fields, row)]
+        for row in rows
+    ]
+    if copy_supported(db):
+        copy_rows_in(db, model._meta.db_table, [field.column for field in fields], params)
+        return
+    qn = db.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        qn(model._meta.db_table),
+        ', '.join(qn(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    with db.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+class ResponseImporter:
+    """Validates an export-layout table in one pass, then bulk-inserts it in chunks.
+
+    Question columns are matched by the "Q{id}: ..." export header or by
+    question_label; option cells are matched against option label, text or value.
+    """
+
+    def __init__(self, survey, progress=None, chunk_size=IMPORT_CHUNK_SIZE):
+        self.survey = survey
+        self.progress = progress
+        self.chunk_size = chunk_size
+        self.questions = {q.id: q for q in Question.objects.filter(survey=survey)}
+        self.labels = {q.question_label: q for q in self.questions.values()}
+        self.options = {}
+        through = Question.options.through # type: ignore
+        for question_id, option_id, *names in through.objects.filter(question__survey=survey).values_list(
+            'question_id', 'questionoption_id',
+            'questionoption__label', 'questionoption__text', 'questionoption__value',
+        ):
+            lookup = self.options.setdefault(question_id, {})
+            for name in names:
+                if name:
+                    lookup.setdefault(normalize(name), option_id)
+        self.errors = []
+        self.error_count = 0
+
+    def error(self, row_number, column, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'column': column, 'message': message})
+
+    def map_columns(self, headers):
+        """Column index -> question, plus the indexes of the id and timestamp columns"""
+        columns = {}
+        id_column = submitted_column = None
+        for index, header in enumerate(headers):
+            if header == 'Response ID':
+                id_column = index
+                continue
+            if header == 'Submitted At':
+                submitted_column = index
+                continue
+            match = QUESTION_HEADER_RE.match(header)
+            question = self.questions.get(int(match.group(1))) if match else self.labels.get(header)
+            if question is None:
+                if header:
+                    self.error(1, header, "Column does not match a question of this survey")
+                continue
+            columns[index] = question
+        if not columns:
+            self.error(1, '', "No column matches a question of this survey")
+        return columns, id_column, submitted_column
+
+    def parse_answer(self, question, raw, row_number, column):
+        """Answer field values for one cell, or None if the cell is invalid"""
+        value = str(raw).strip()
+        if question.question_type in CHOICE_TYPES:
+            custom_text = None
+            match = OTHER_RE.match(value)
+            if match:
+                value, custom_text = match.groups()
+            names = [name for name in value.split(';') if name.strip()]
+            if question.question_type != 'multi_select' and len(names) > 1:
+                self.error(row_number, column, "Only one option may be selected")
+                return None
+            option_ids = []
+            lookup = self.options.get(question.id, {})
+            for name in names:
+                option_id = lookup.get(normalize(name))
+                if option_id is None:
+                    self.error(row_number, column, f"Unknown option '{name.strip()}'")
+                    return None
+                option_ids.append(option_id)
+            return {'custom_text': custom_text, 'option_ids': option_ids}
+        if question.question_type == 'rating':
+            try:
+                return {'rating_value': int(float(value))}
+            except ValueError:
+                self.error(row_number, column, f"'{value}' is not a rating")
+                return None
+        if question.question_type == 'number':
+            try:
+                return {'number_value': float(value)}
+            except ValueError:
+                self.error(row_number, column, f"'{value}' is not a number")
+                return None
+        if question.question_type == 'email':
+            try:
+                validate_email(value)
+            except ValidationError:
+                self.error(row_number, column, f"'{value}' is not an email address")
+                return None
+        if question.min_length and len(value) < question.min_length:
+            self.error(row_number, column, f"Shorter than {question.min_length} characters")
+            return None
+        if question.max_length and len(value) > question.max_length:
+            self.error(row_number, column, f"Longer than {question.max_length} characters")
+            return None
+        return {'text_value': value}
+
+    def parse_submitted_at(self, raw, row_number):
+        if isinstance(raw, datetime):
+            value = raw
+        else:
+            for fmt in DATETIME_FORMATS:
+                try:
+                    value = datetime.strptime(str(raw).strip(), fmt)
+                    break
+                except ValueError:
+                    continue
+            else:
+                self.error(row_number, 'Submitted At', f"'{raw}' is not a date (YYYY-MM-DD HH:MM:SS)")
+                return None
+        return timezone.make_aware(value) if timezone.is_naive(value) else value
+
+    def parse_response_id(self, raw, row_number, seen):
+        try:
+            response_id = uuid.UUID(str(raw).strip())
+        except ValueError:
+            self.error(row_number, 'Response ID', f"'{raw}' is not a response id")
+            return None
+        if response_id in seen:
+            self.error(row_number, 'Response ID', "Duplicate response id in file")
+            return None
+        seen.add(response_id)
+        return response_id
+
+    def validate(self, headers, rows):
+        """Parse every row; returns the parsed responses (only usable if there were no errors)"""
+        columns, id_column, submitted_column = self.map_columns(headers)
+        parsed = []
+        seen_ids = set()
+        for row_number, row in enumerate(rows, start=2):
+            if not any(cell not in (None, '') for cell in row):
+                continue
+            record = {'row': row_number, 'id': None, 'submitted_at': None, 'answers': []}
+            if id_column is not None and id_column < len(row) and row[id_column] not in (None, ''):
+                record['id'] = self.parse_response_id(row[id_column], row_number, seen_ids)
+            if submitted_column is not None and submitted_column < len(row) and row[submitted_column] not in (None, ''):
+                record['submitted_at'] = self.parse_submitted_at(row[submitted_column], row_number)
+            for index, question in columns.items():
+                if index >= len(row) or row[index] is None or str(row[index]).strip() == '':
+                    continue
+                answer = self.parse_answer(question, row[index], row_number, headers[index])
+                if answer is not None:
+                    record['answers'].append((question, answer))
+            parsed.append(record)
+
+        rows_by_id = {r['id']: r['row'] for r in parsed if r['id']}
+        existing = list(rows_by_id)
+        for i in range(0, len(existing), self.chunk_size):
+            for response_id in SurveyResponse.objects.filter(id__in=existing[i:i + self.chunk_size]).values_list('id', flat=True):
+                self.error(rows_by_id[response_id], 'Response ID', f"Response {response_id} already exists")
+        return parsed
+
+    def insert(self, parsed):
+        """Bulk insert in chunks, one transaction per chunk"""
+        for start in range(0, len(parsed), self.chunk_size):
+            chunk = parsed[start:start + self.chunk_size]
+            response_ids = [record['id'] or uuid7() for record in chunk]
+            with transaction.atomic():
+                # per chunk: ids from the file needn't increase, so only a later created_at
+                # keeps a chunk committed after an export cursor from sorting below it
+                now = timezone.now()
+                insert_rows(
+                    SurveyResponse,
+                    ['id', 'survey', 'submitted_at', 'created_at', 'session_id', 'is_complete',
+                     'answers_materialized'],
+                    [
+                        (response_id, self.survey.id, record['submitted_at'] or now, now, 'import', True, True)
+                        for response_id, record in zip(response_ids, chunk)
+                    ],
+                )
+
+                answers = []
+                for response_id, record in zip(response_ids, chunk):
+                    for question, values in record['answers']:
+                        option_ids = values.get('option_ids') or []
+                        if question.question_type == 'multi_select':
+                            selected_option, encoded_ids = None, encode_option_ids(option_ids)
+                        else:
+                            selected_option, encoded_ids = (option_ids[0] if option_ids else None), None
+                        answers.append((
+                            response_id, question.id, values.get('text_value'), values.get('rating_value'),
+                            values.get('number_value'), values.get('custom_text'), selected_option, encoded_ids, now,
+                        ))
+                insert_rows(
+                    Answer,
+                    ['response', 'question', 'text_value', 'rating_value', 'number_value', 'custom_text',
+                     'selected_option', 'option_ids', 'created_at'],
+                    answers,
+                )
+
+            if self.progress:
+                self.progress(min(start + self.chunk_size, len(parsed)), len(parsed))
+
+    def run(self, upload):
+        """Validate and import; returns a report dict (nothing is written if any row fails)"""
+        try:
+            headers, rows = read_table(upload)
+            parsed = self.validate(headers, rows)
+        except (ImportFormatError, UnicodeDecodeError, csv.Error) as e:
+            self.error('-', '', str(e))
+            parsed = []
+
+        if self.error_count:
+            return {'imported': 0, 'rows': len(parsed), 'error_count': self.error_count, 'errors': self.errors}
+        self.insert(parsed)
+        invalidate_dashboard()
+        return {'imported': len(parsed), 'rows': len(parsed), 'error_count': 0, 'errors': []}
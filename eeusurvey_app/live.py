@@ -0,0 +1,175 @@
+# live.py
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .documents import document_option_ids
+from .models import Answer, SurveyResponse, decode_option_ids
+
+# Seconds between flushes of accumulated deltas to a client
+FLUSH_INTERVAL = 1
+# Seconds between database polls, which pick up submissions handled by other
+# worker processes that the in-process feed never sees
+POLL_INTERVAL = 10
+# Overlap between polls so slow-committing submissions aren't missed
+POLL_OVERLAP = timedelta(seconds=30)
+KEEPALIVE_INTERVAL = 15
+
+
+class Subscription:
+    def __init__(self, survey_id, loop):
+        self.survey_id = survey_id
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+
+class LiveFeed:
+    """Process-local fan-out of submission events to the connected SSE clients"""
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, survey_id=None):
+        subscription = Subscription(survey_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        """Hand an event to every matching subscriber; safe to call from any thread"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if subscription.survey_id not in (None, event['survey_id']):
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.queue.put_nowait, event)
+            except RuntimeError:
+                # loop already closed; the stream's finally block will unsubscribe
+                pass
+
+
+feed = LiveFeed()
+
+
+def publish_response(survey_response, option_ids):
+    feed.publish({
+        'survey_id': str(survey_response.survey_id),
+        'response_id': str(survey_response.id),
+        'submitted_at': survey_response.submitted_at,
+        'option_ids': list(option_ids),
+    })
+
+
+class DeltaTracker:
+    """Accumulates per-survey deltas, counting each response once whichever way it arrived"""
+    def __init__(self, survey_id=None):
+        self.survey_id = survey_id
+        self.started = self.watermark = timezone.now()
+        self.seen = {}
+        self.deltas = {}
+
+    def _delta(self, survey_id):
+        if survey_id not in self.deltas:
+            self.deltas[survey_id] = {'new_responses': 0, 'option_counts': defaultdict(int)}
+        return self.deltas[survey_id]
+
+    def add_event(self, event):
+        if event['response_id'] in self.seen:
+            return
+        self.seen[event['response_id']] = event['submitted_at']
+        delta = self._delta(event['survey_id'])
+        delta['new_responses'] += 1
+        for option_id in event['option_ids']:
+            delta['option_counts'][str(option_id)] += 1
+
+    async def poll(self):
+        now = timezone.now()
+        since = max(self.watermark - POLL_OVERLAP, self.started)
+        responses = SurveyResponse.objects.filter(submitted_at__gte=since)
+        if self.survey_id:
+            responses = responses.filter(survey_id=self.survey_id)
+
+        new_ids = []
+        async for response_id, survey_id, submitted_at in responses.values_list('id', 'survey_id', 'submitted_at'):
+            if str(response_id) in self.seen:
+                continue
+            self.seen[str(response_id)] = submitted_at
+            self._delta(str(survey_id))['new_responses'] += 1
+            new_ids.append(response_id)
+
+        if new_ids:
+            # document-mode responses are counted from their document, which is
+            # there from the start; Answer rows may not be materialized yet
+            choices = (
+                Answer.objects.filter(response_id__in=new_ids, response__answer_document__isnull=True)
+                .filter(Q(selected_option__isnull=False) | Q(option_ids__isnull=False))
+                .values_list('response__survey_id', 'selected_option_id', 'option_ids')
+            )
+            async for survey_id, option_id, option_ids in choices:
+                option_counts = self._delta(str(survey_id))['option_counts']
+                for selected in [option_id] if option_id is not None else decode_option_ids(option_ids):
+                    option_counts[str(selected)] += 1
+            documents = SurveyResponse.objects.filter(id__in=new_ids, answer_document__isnull=False)
+            async for survey_id, document in documents.values_list('survey_id', 'answer_document'):
+                option_counts = self._delta(str(survey_id))['option_counts']
+                for selected in document_option_ids(document):
+                    option_counts[str(selected)] += 1
+
+        self.watermark = now
+        cutoff = now - 2 * POLL_OVERLAP
+        self.seen = {key: at for key, at in self.seen.items() if at >= cutoff}
+
+    def flush(self):
+        deltas, self.deltas = self.deltas, {}
+        return {
+            survey_id: {'new_responses': delta['new_responses'], 'option_counts': dict(delta['option_counts'])}
+            for survey_id, delta in deltas.items()
+        }
+
+
+def sse_message(data, event=None):
+    lines = [f"event: {event}"] if event else []
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+async def live_events(survey_id=None):
+    """Server-Sent Events stream of {survey_id: delta} messages"""
+    loop = asyncio.get_running_loop()
+    subscription = feed.subscribe(survey_id)
+    tracker = DeltaTracker(survey_id)
+    last_poll = last_message = loop.time()
+    try:
+        yield f"retry: {POLL_INTERVAL * 1000}\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=FLUSH_INTERVAL)
+                tracker.add_event(event)
+                while not subscription.queue.empty():
+                    tracker.add_event(subscription.queue.get_nowait())
+            except asyncio.TimeoutError:
+                pass
+
+            if loop.time() - last_poll >= POLL_INTERVAL:
+                await tracker.poll()
+                last_poll = loop.time()
+
+            deltas = tracker.flush()
+            if deltas:
+                yield sse_message(deltas, event='delta')
+                last_message = loop.time()
+            elif loop.time() - last_message >= KEEPALIVE_INTERVAL:
+                yield ': keepalive\n\n'
+                last_message = loop.time()
+    finally:
+        feed.unsubscribe(subscription)
@@ -0,0 +1,248 @@
+# loadtest.py
+import base64
+import contextlib
+import http.client
+import json
+import logging
+import random
+import statistics
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+from django.db import connections
+from django.test import Client
+
+OPERATIONS = ('submit', 'retrieve', 'list', 'analysis', 'reorder')
+DEFAULT_MIX = {'submit': 70, 'retrieve': 20, 'list': 10}
+# Operations that need a staff user (credentials over HTTP, a forced login in-process)
+STAFF_OPERATIONS = {'analysis', 'reorder'}
+ERROR_SAMPLES = 10
+# Loggers that would print a traceback or slow-request report for every failed request;
+# the report already counts those errors
+NOISY_LOGGERS = ('django.request', 'eeusurvey_app.metrics')
+
+
+class HttpTarget:
+    """A running server, one keep-alive connection per worker thread"""
+
+    def __init__(self, base_url, username=None, password=None, timeout=30):
+        url = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.netloc = url.netloc
+        self.prefix = url.path.rstrip('/')
+        self.timeout = timeout
+        self.authorization = None
+        if username:
+            token = base64.b64encode(f"{username}:{password or ''}".encode()).decode()
+            self.authorization = f"Basic {token}"
+        self.local = threading.local()
+
+    def can_run(self, operation):
+        return operation not in STAFF_OPERATIONS or self.authorization is not None
+
+    def request(self, method, path, body=None, staff=False):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = self.connection_class(self.netloc, timeout=self.timeout)
+        headers = {'Content-Type': 'application/json'}
+        if staff:
+            headers['Authorization'] = self.authorization
+        try:
+            connection.request(method, self.prefix + path, body=json.dumps(body) if body is not None else None,
+                               headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self.local.connection = None
+            raise
+
+    def close(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+
+
+class ClientTarget:
+    """The Django test client in this process; every worker thread gets its own clients and database connection"""
+
+    def __init__(self, staff_user=None):
+        self.staff_user = staff_user
+        self.local = threading.local()
+
+    def can_run(self, operation):
+        return operation not in STAFF_OPERATIONS or self.staff_user is not None
+
+    def client(self, staff):
+        name = 'staff' if staff else 'anonymous'
+        client = getattr(self.local, name, None)
+        if client is None:
+            client = Client()
+            if staff:
+                client.force_login(self.staff_user)
+            setattr(self.local, name, client)
+        return client
+
+    def request(self, method, path, body=None, staff=False):
+        response = self.client(staff).generic(
+            method, path, json.dumps(body) if body is not None else '', content_type='application/json',
+        )
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        response.close()
+        return response.status_code
+
+    def close(self):
+        connections.close_all()
+
+
+@contextlib.contextmanager
+def quiet_loggers(names=NOISY_LOGGERS):
+    loggers = [logging.getLogger(name) for name in names]
+    levels = [logger.level for logger in loggers]
+    for logger in loggers:
+        logger.setLevel(logging.CRITICAL)
+    try:
+        yield
+    finally:
+        for logger, level in zip(loggers, levels):
+            logger.setLevel(level)
+
+
+def survey_operations(survey, generator, category_ids=()):
+    """name -> function(respondent number, rng) -> (method, path, body)"""
+    def reorder(respondent, rng):
+        order = list(category_ids)
+        rng.shuffle(order)
+        return 'POST', f'/api/surveys/{survey.id}/categories/order/', {'categories': order}
+
+    return {
+        'submit': lambda respondent, rng: ('POST', '/api/responses/submit/', generator.submission(respondent)),
+        'retrieve': lambda respondent, rng: ('GET', f'/api/surveys/{survey.id}/', None),
+        'list': lambda respondent, rng: ('GET', f'/api/surveys/?lang={survey.language}', None),
+        'analysis': lambda respondent, rng: ('GET', f'/api/surveys/{survey.id}/analysis/', None),
+        'reorder': reorder,
+    }
+
+
+def check_mix(mix, target=None):
+    unknown = set(mix) - set(OPERATIONS)
+    if unknown:
+        raise ValueError(f"Unknown operation(s): {', '.join(sorted(unknown))}")
+    forbidden = [name for name in mix if target is not None and not target.can_run(name)]
+    if forbidden:
+        raise ValueError(f"Staff credentials are needed for: {', '.join(forbidden)}")
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+class LoadTest:
+    """Replays a weighted mix of operations from `concurrency` threads until the duration or request budget runs out"""
+
+    def __init__(self, target, operations, mix, concurrency=200, duration=30, requests=None,
+                 think_time=0.0, ramp_up=0.0, seed=None):
+        check_mix(mix, target)
+        self.target = target
+        self.operations = operations
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.concurrency = concurrency
+        self.duration = duration
+        self.requests = requests
+        self.think_time = think_time
+        self.ramp_up = ramp_up
+        self.seed = seed
+        self._issued = 0
+        self._lock = threading.Lock()
+
+    def next_request(self):
+        """The number of the next request, or None once the request budget is spent"""
+        with self._lock:
+            if self.requests is not None and self._issued >= self.requests:
+                return None
+            self._issued += 1
+            return self._issued
+
+    def worker(self, index, deadline, samples):
+        rng = random.Random(None if self.seed is None else self.seed * 100003 + index)
+        if self.ramp_up:
+            time.sleep(self.ramp_up * index / self.concurrency)
+        try:
+            while time.monotonic() < deadline:
+                number = self.next_request()
+                if number is None:
+                    break
+                name = rng.choices(self.names, self.weights)[0]
+                method, path, body = self.operations[name](number, rng)
+                started = time.perf_counter()
+                try:
+                    status = self.target.request(method, path, body, staff=name in STAFF_OPERATIONS)
+                    error = None if status < 400 else f"HTTP {status}"
+                except Exception as e:
+                    error = f"{type(e).__name__}: {str(e)[:200]}"
+                samples.append((name, time.perf_counter() - started, error))
+                if self.think_time:
+                    time.sleep(rng.expovariate(1 / self.think_time))
+        finally:
+            self.target.close()
+
+    def run(self):
+        start = time.monotonic()
+        deadline = start + (self.duration if self.duration else float('inf'))
+        per_worker = [[] for _ in range(self.concurrency)]
+        threads = [
+            threading.Thread(target=self.worker, args=(index, deadline, per_worker[index]),
+                             name=f"load-{index}", daemon=True)
+            for index in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+        return self.report([sample for samples in per_worker for sample in samples], elapsed)
+
+    def report(self, samples, elapsed):
+        by_operation = defaultdict(list)
+        errors = defaultdict(Counter)
+        for name, latency, error in samples:
+            by_operation[name].append(latency * 1000)
+            if error:
+                errors[name][error] += 1
+
+        def summary(latencies, error_counts):
+            ordered = sorted(latencies)
+            failed = sum(error_counts.values())
+            return {
+                'count': len(ordered),
+                'errors': failed,
+                'error_rate': round(failed / len(ordered), 4) if ordered else 0,
+                'throughput_rps': round(len(ordered) / elapsed, 1) if elapsed else None,
+                'latency_ms': {
+                    'mean': round(statistics.fmean(ordered), 1) if ordered else None,
+                    **{f"p{int(q * 100)}": round(percentile(ordered, q), 1) if ordered else None
+                       for q in (0.5, 0.9, 0.95, 0.99)},
+                    'max': round(ordered[-1], 1) if ordered else None,
+                },
+                'top_errors': error_counts.most_common(ERROR_SAMPLES),
+            }
+
+        all_errors = Counter()
+        for counts in errors.values():
+            all_errors.update(counts)
+        return {
+            'concurrency': self.concurrency,
+            'elapsed_s': round(elapsed, 2),
+            'mix': dict(zip(self.names, self.weights)),
+            'total': summary([latency * 1000 for _, latency, _ in samples], all_errors),
+            'operations': {name: summary(by_operation[name], errors[name]) for name in sorted(by_operation)},
+        }
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from eeusurvey_app.schedule import apply_schedule, surveys_to_activate, surveys_to_deactivate
+
+
+class Command(BaseCommand):
+    help = "Open surveys whose start date has come and close those past their end date"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', type=int, default=0, metavar='SECONDS',
+                            help="Keep running, applying the schedule every SECONDS")
+        parser.add_argument('--dry-run', action='store_true', help="List the surveys that would change")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            today = timezone.now().date()
+            for survey in surveys_to_activate(today):
+                self.stdout.write(f"Would open {survey.title} ({survey.start_time} to {survey.end_time})")
+            for survey in surveys_to_deactivate(today):
+                self.stdout.write(f"Would close {survey.title} ({survey.start_time} to {survey.end_time})")
+            return
+
+        while True:
+            activated, deactivated = apply_schedule()
+            if activated or deactivated or not options['watch']:
+                self.stdout.write(f"Opened {activated} and closed {deactivated} survey(s)")
+            if not options['watch']:
+                break
+            time.sleep(options['watch'])
+            close_old_connections()
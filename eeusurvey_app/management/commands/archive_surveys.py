@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from eeusurvey_app.archives import (
+    ArchiveError, archivable_surveys, archive_survey, finish_archive, interrupted_archives, restore_survey,
+)
+from eeusurvey_app.models import Survey
+from eeusurvey_app.purge import PURGE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Move the responses of long-closed surveys into compressed archive files, or restore them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+                            help="Archive surveys that ended more than DAYS ago")
+        parser.add_argument('--survey', help="Archive only this survey (it must have ended; may be a restored one)")
+        parser.add_argument('--restore', metavar='SURVEY', help="Load this survey's archived responses back")
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="List the surveys that would be archived")
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            survey = self.get_survey(options['restore'])
+            try:
+                restored = restore_survey(survey)
+            except ArchiveError as e:
+                raise CommandError(f"Can't restore {survey.title}: {e}")
+            self.stdout.write(f"Restored {restored} response(s) of {survey.title}")
+            return
+
+        # finish purges an earlier run was interrupted in (never archives being restored)
+        if not options['dry_run']:
+            for archive in interrupted_archives():
+                finish_archive(archive, options['batch_size'])
+                self.stdout.write(f"Finished archiving {archive.survey.title}")
+
+        if options['survey']:
+            surveys = archivable_surveys(0, include_restored=True).filter(id=self.get_survey(options['survey']).id)
+            if not surveys.exists():
+                raise CommandError("That survey hasn't ended yet or is already archived")
+        else:
+            surveys = archivable_surveys(options['days'])
+
+        for survey in surveys:
+            if options['dry_run']:
+                self.stdout.write(f"Would archive {survey.title} (ended {survey.end_time})")
+                continue
+            archive = archive_survey(survey, options['batch_size'])
+            self.stdout.write(
+                f"Archived {archive.response_count} response(s) of {survey.title} "
+                f"into {archive.file_path} ({archive.file_size // 1024} KB)"
+            )
+
+    def get_survey(self, survey_id):
+        try:
+            return Survey.objects.get(id=survey_id)
+        except (Survey.DoesNotExist, ValidationError):
+            raise CommandError(f"No survey {survey_id}")
@@ -0,0 +1,70 @@
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from eeusurvey_app.ids import uuid7
+from eeusurvey_app.models import Answer, Question, QuestionCategory, Survey, SurveyResponse
+
+GENERATORS = {
+    'uuid4': uuid.uuid4,
+    'uuid7': uuid7,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare insert throughput of random (uuid4) and time-ordered (uuid7) response ids. "
+        "Rows are inserted inside a transaction that is rolled back, so run it against a "
+        "copy of production-sized data to see the effect on a large primary key index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000, help="Responses inserted per round")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--rounds', type=int, default=3)
+
+    def insert_round(self, make_id, rows, batch_size):
+        with transaction.atomic():
+            survey = Survey.objects.create(
+                title="ID benchmark", instructions="", version="1", language="en",
+                start_time=date.today(), end_time=date.today() + timedelta(days=1),
+            )
+            category = QuestionCategory.objects.create(survey=survey, name="Benchmark")
+            question = Question.objects.create(
+                survey=survey, category=category, question_text="Benchmark", question_type='text',
+            )
+
+            started = time.perf_counter()
+            for start in range(0, rows, batch_size):
+                responses = SurveyResponse.objects.bulk_create([
+                    SurveyResponse(id=make_id(), survey=survey)
+                    for _ in range(min(batch_size, rows - start))
+                ])
+                Answer.objects.bulk_create([
+                    Answer(response=response, question=question, text_value="x")
+                    for response in responses
+                ])
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+        return elapsed
+
+    def handle(self, *args, **options):
+        rows, batch_size = options['rows'], options['batch_size']
+        timings = {name: [] for name in GENERATORS}
+        for round_number in range(options['rounds']):
+            # alternate the order so neither generator always runs on a warm cache
+            names = list(GENERATORS) if round_number % 2 == 0 else list(reversed(GENERATORS))
+            for name in names:
+                timings[name].append(self.insert_round(GENERATORS[name], rows, batch_size))
+
+        for name, elapsed in timings.items():
+            best = min(elapsed)
+            self.stdout.write(
+                f"{name}: best {best:.2f}s for {rows} responses + answers "
+                f"({rows / best:,.0f} responses/s over {len(elapsed)} rounds)"
+            )
+        ratio = min(timings['uuid4']) / min(timings['uuid7'])
+        self.stdout.write(f"uuid7 inserts are {ratio:.2f}x the speed of uuid4")
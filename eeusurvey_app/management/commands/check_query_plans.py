@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from eeusurvey_app.query_plans import check_query_plans
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the hot queries and fail if any of them falls back to a full table scan"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--verbose-plans', action='store_true', help="Print every plan, not just failures")
+
+    def handle(self, *args, **options):
+        failures = 0
+        for name, plan, scans in check_query_plans(options['database']):
+            if scans:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"FULL SCAN  {name}: {', '.join(scans)}"))
+            else:
+                self.stdout.write(f"ok         {name}")
+            if scans or options['verbose_plans']:
+                self.stdout.write(f"    {plan}".replace('\n', '\n    '))
+        if failures:
+            raise CommandError(f"{failures} hot query plan(s) use a full table scan")
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from eeusurvey_app.export_jobs import cleanup_export_files
+
+
+class Command(BaseCommand):
+    help = "Delete finished export files by age and total size"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age-days', type=int, default=settings.EXPORT_MAX_AGE_DAYS)
+        parser.add_argument('--max-total-mb', type=int, default=settings.EXPORT_MAX_TOTAL_MB)
+
+    def handle(self, *args, **options):
+        expired = cleanup_export_files(
+            max_age=timedelta(days=options['max_age_days']),
+            max_total_bytes=options['max_total_mb'] * 1024 * 1024,
+        )
+        self.stdout.write(f"Expired {expired} export file(s)")
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from eeusurvey_app.models import Answer, encode_option_ids
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy choice answers from the old Answer.selected_options through table into "
+        "Answer.selected_option / Answer.option_ids. Safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--clear-legacy', action='store_true',
+                            help="Delete the through rows of each batch once it has been copied")
+
+    def handle(self, *args, **options):
+        through = Answer.selected_options.through # type: ignore
+        batch_size = options['batch_size']
+        last_id = 0
+        migrated = 0
+        while True:
+            answer_ids = list(
+                through.objects.filter(answer_id__gt=last_id)
+                .order_by('answer_id')
+                .values_list('answer_id', flat=True)
+                .distinct()[:batch_size]
+            )
+            if not answer_ids:
+                break
+            last_id = answer_ids[-1]
+
+            selected = {}
+            for answer_id, option_id in through.objects.filter(answer_id__in=answer_ids).values_list(
+                'answer_id', 'questionoption_id'
+            ).order_by('answer_id', 'questionoption_id'):
+                selected.setdefault(answer_id, []).append(option_id)
+
+            answers = list(Answer.objects.filter(id__in=answer_ids).select_related('question').only(
+                'id', 'question__question_type', 'selected_option', 'option_ids'
+            ))
+            for answer in answers:
+                answer.set_selected_option_ids(
+                    selected.get(answer.id, []), multiple=answer.question.question_type == 'multi_select'
+                )
+
+            with transaction.atomic():
+                Answer.objects.bulk_update(answers, ['selected_option', 'option_ids'])
+                if options['clear_legacy']:
+                    through.objects.filter(answer_id__in=answer_ids).delete()
+            migrated += len(answers)
+            self.stdout.write(f"Migrated {migrated} answers")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {migrated} choice answers use the compact columns"))
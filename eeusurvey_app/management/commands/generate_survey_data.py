@@ -0,0 +1,44 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from eeusurvey_app.dashboard import invalidate_dashboard
+from eeusurvey_app.synthetic import GENERATE_BATCH_SIZE, TEXT, ResponseGenerator, create_survey
+
+
+class Command(BaseCommand):
+    help = (
+        "Create synthetic surveys covering every question type, with skewed answers, "
+        "for benchmarks and load tests. Responses are bulk-inserted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--surveys', type=int, default=1, help="Surveys per language")
+        parser.add_argument('--languages', default='en,am,om', help=f"Comma-separated, from {', '.join(TEXT)}")
+        parser.add_argument('--responses', type=int, default=1000, help="Responses per survey")
+        parser.add_argument('--categories', type=int, default=4)
+        parser.add_argument('--questions-per-category', type=int, default=6)
+        parser.add_argument('--batch-size', type=int, default=GENERATE_BATCH_SIZE)
+        parser.add_argument('--seed', type=int, help="Make the data reproducible")
+
+    def handle(self, *args, **options):
+        languages = [language.strip() for language in options['languages'].split(',') if language.strip()]
+        unknown = set(languages) - set(TEXT)
+        if unknown:
+            raise CommandError(f"Unknown language(s): {', '.join(sorted(unknown))}")
+        rng = random.Random(options['seed'])
+
+        for language in languages:
+            for _ in range(options['surveys']):
+                survey = create_survey(
+                    language, options['categories'], options['questions_per_category'], rng,
+                )
+                started = time.perf_counter()
+                inserted = ResponseGenerator(survey, rng).insert(options['responses'], options['batch_size'])
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{survey.id} {survey.title}: {inserted} responses in {elapsed:.1f}s "
+                    f"({inserted / max(elapsed, 1e-9):,.0f}/s)"
+                )
+        invalidate_dashboard()
@@ -0,0 +1,145 @@
+import contextlib
+import json
+import random
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from eeusurvey_app.benchmarks import BENCHMARK_USER
+from eeusurvey_app.loadtest import (
+    DEFAULT_MIX, ClientTarget, HttpTarget, LoadTest, check_mix, quiet_loggers, survey_operations,
+)
+from eeusurvey_app.models import Survey
+from eeusurvey_app.purge import request_survey_deletion, run_survey_deletion
+from eeusurvey_app.synthetic import ResponseGenerator, create_survey
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        try:
+            mix[name.strip()] = int(weight or 1)
+        except ValueError:
+            raise CommandError(f"Bad --mix entry: {part!r} (expected name=weight)")
+    if not any(mix.values()):
+        raise CommandError("--mix needs at least one operation with a positive weight")
+    return mix
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a weighted mix of submissions and survey reads from many concurrent respondents and "
+        "report throughput, latency percentiles and error rates per operation. Runs in-process through "
+        "the test client, or against a running server with --url. Operations: submit, retrieve, list, "
+        "and (staff only) analysis and reorder. In-process, per-request error logging is muted unless -v 2."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Base URL of a running server (default: in-process test client)")
+        parser.add_argument('--username', help="Staff user for analysis/reorder over --url (HTTP Basic auth)")
+        parser.add_argument('--password', default='')
+        parser.add_argument('--survey', help="Survey id to use (default: create a synthetic one)")
+        parser.add_argument('--responses', type=int, default=1000,
+                            help="Responses to pre-load into the synthetic survey")
+        parser.add_argument('--concurrency', type=int, default=200, help="Concurrent respondents")
+        parser.add_argument('--duration', type=float, default=30, help="Seconds to run (0: until --requests)")
+        parser.add_argument('--requests', type=int, help="Stop after this many requests")
+        parser.add_argument('--mix', default=','.join(f"{name}={weight}" for name, weight in DEFAULT_MIX.items()),
+                            help="Comma-separated operation=weight pairs")
+        parser.add_argument('--think-ms', type=float, default=0, help="Mean pause between a respondent's requests")
+        parser.add_argument('--ramp-up', type=float, default=0, help="Seconds over which respondents start")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help="Also write the report to this JSON file")
+        parser.add_argument('--keep-data', action='store_true', help="Leave the synthetic survey in place")
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        if not options['duration'] and not options['requests']:
+            raise CommandError("Give a --duration or a --requests budget")
+        if options['concurrency'] < 1:
+            raise CommandError("--concurrency must be at least 1")
+
+        survey = None
+        if options['survey']:
+            try:
+                survey = Survey.objects.get(pk=options['survey'], deleted_at__isnull=True)
+            except (Survey.DoesNotExist, ValidationError):
+                raise CommandError(f"No survey {options['survey']}")
+        if options['url']:
+            target = HttpTarget(options['url'], options['username'], options['password'])
+            try:
+                check_mix(mix, target)
+            except ValueError as e:
+                raise CommandError(str(e))
+            report = self.run(target, survey, mix, options)
+        else:
+            try:
+                check_mix(mix)  # every operation can run in-process
+            except ValueError as e:
+                raise CommandError(str(e))
+            staff_user, created_user = User.objects.get_or_create(
+                username=BENCHMARK_USER, defaults={'is_staff': True, 'is_superuser': True},
+            )
+            try:
+                with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), \
+                        (quiet_loggers() if options['verbosity'] < 2 else contextlib.nullcontext()):
+                    report = self.run(ClientTarget(staff_user), survey, mix, options)
+            finally:
+                if created_user:
+                    staff_user.delete()
+
+        self.write_report(report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+    def run(self, target, survey, mix, options):
+        rng = random.Random(options['seed'])
+        created = survey is None
+        if created:
+            # over --url this only works when the server shares this database
+            survey = create_survey('en', rng=rng, title="Load test")
+            self.stdout.write(f"Created survey {survey.id}")
+        try:
+            generator = ResponseGenerator(survey, rng)
+            if created and options['responses']:
+                generator.insert(options['responses'])
+            category_ids = list(survey.categories.order_by('cat_number').values_list('id', flat=True)) # type: ignore
+            load_test = LoadTest(
+                target, survey_operations(survey, generator, category_ids), mix,
+                concurrency=options['concurrency'], duration=options['duration'], requests=options['requests'],
+                think_time=options['think_ms'] / 1000, ramp_up=options['ramp_up'], seed=options['seed'],
+            )
+            self.stdout.write(
+                f"{options['concurrency']} respondents, mix {options['mix']}, against "
+                f"{options['url'] or 'the test client'} ({settings.DATABASES['default']['ENGINE']})"
+            )
+            return load_test.run()
+        finally:
+            if created and not options['keep_data']:
+                run_survey_deletion(request_survey_deletion(survey, BENCHMARK_USER))
+
+    def write_report(self, report):
+        self.stdout.write(f"\n{report['total']['count']} requests in {report['elapsed_s']}s\n")
+        self.stdout.write(
+            f"  {'operation':<10} {'count':>7} {'req/s':>8} {'errors':>7} {'p50':>8} {'p90':>8} "
+            f"{'p95':>8} {'p99':>8} {'max':>8}  (ms)"
+        )
+        rows = [*report['operations'].items(), ('total', report['total'])]
+        for name, summary in rows:
+            latency = summary['latency_ms']
+            self.stdout.write(
+                f"  {name:<10} {summary['count']:>7} {summary['throughput_rps']:>8} "
+                f"{summary['error_rate']:>7.1%} "
+                + ' '.join(f"{latency[key] if latency[key] is not None else '-':>8}"
+                           for key in ('p50', 'p90', 'p95', 'p99', 'max'))
+            )
+        if report['total']['top_errors']:
+            self.stdout.write("\nMost frequent errors:")
+            for error, count in report['total']['top_errors']:
+                self.stdout.write(f"  {count:>6}  {error}")
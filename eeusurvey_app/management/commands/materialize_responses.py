@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from eeusurvey_app.documents import MATERIALIZE_BATCH_SIZE, materialize_pending
+
+
+class Command(BaseCommand):
+    help = "Create Answer rows for responses submitted to document-mode surveys"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=MATERIALIZE_BATCH_SIZE)
+        parser.add_argument('--watch', type=int, default=0, metavar='SECONDS',
+                            help="Keep running, checking for new responses every SECONDS")
+
+    def handle(self, *args, **options):
+        while True:
+            materialized = materialize_pending(options['batch_size'])
+            if materialized or not options['watch']:
+                self.stdout.write(f"Materialized {materialized} response(s)")
+            if not options['watch']:
+                break
+            time.sleep(options['watch'])
+            close_old_connections()
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from eeusurvey_app.purge import PURGE_BATCH_SIZE, run_survey_deletion, unfinished_deletions
+
+
+class Command(BaseCommand):
+    help = "Finish deleting surveys whose background purge was queued, failed or interrupted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE)
+        parser.add_argument('--watch', type=int, default=0, metavar='SECONDS',
+                            help="Keep running, checking for new deletions every SECONDS")
+
+    def handle(self, *args, **options):
+        while True:
+            for deletion in unfinished_deletions().select_related('survey'):
+                title = deletion.survey.title
+                finished = run_survey_deletion(deletion, options['batch_size'])
+                if finished is None:
+                    continue  # claimed by the admin's thread meanwhile
+                if finished:
+                    self.stdout.write(f"Deleted {title}")
+                else:
+                    self.stderr.write(f"Deleting {title} failed; see its deletion status in the admin")
+            if not options['watch']:
+                break
+            time.sleep(options['watch'])
+            close_old_connections()
@@ -0,0 +1,53 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from eeusurvey_app.benchmarks import BenchmarkSuite, compare
+
+
+class Command(BaseCommand):
+    help = (
+        "Time submit, survey retrieve/list, analysis, CSV export and admin changelists against "
+        "synthetic surveys of several sizes, and write wall times and query counts to a JSON file. "
+        "Run it against a scratch database: it adds (and afterwards deletes) benchmark surveys."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,10000', help="Comma-separated response counts")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per case")
+        parser.add_argument('--case', action='append', help="Only run this case (repeatable)")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help="Results file (default: benchmarks/<time>-<commit>.json)")
+        parser.add_argument('--compare', metavar='FILE', help="Print the change against an earlier results file")
+        parser.add_argument('--keep-data', action='store_true', help="Leave the benchmark surveys in place")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError("--sizes must be comma-separated integers")
+        previous = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                previous = json.load(f)
+
+        suite = BenchmarkSuite(sizes, options['repeat'], options['seed'], log=self.stdout.write)
+        report = suite.run(only=options['case'], keep_data=options['keep_data'])
+
+        output = options['output']
+        if not output:
+            stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+            output = os.path.join(settings.BASE_DIR, 'benchmarks', f"{stamp}-{report['commit'] or 'nogit'}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f"Results written to {output}")
+
+        if previous:
+            self.stdout.write(f"\nAgainst {previous.get('commit')} ({previous.get('created_at')}):")
+            for case, size, before, now, ratio in compare(previous, report):
+                change = f"{ratio:.2f}x" if ratio is not None else '-'
+                self.stdout.write(f"  {case:<28} {size:>7}  {before:>9.1f} → {now:>9.1f} ms  {change}")
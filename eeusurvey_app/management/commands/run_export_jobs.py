@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from eeusurvey_app.export_jobs import cleanup_export_files, requeue_stale_export_jobs, run_export_job
+from eeusurvey_app.models import ExportJob
+from eeusurvey_app.routers import replica_reads
+
+
+class Command(BaseCommand):
+    help = (
+        "Run pending export jobs (for deployments that don't run them on a request thread). "
+        "Jobs left running by a worker that stopped are queued again first."
+    )
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_export_jobs()
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stalled export job(s)")
+        for job in ExportJob.objects.filter(status='pending').select_related('survey').order_by('created_at'):
+            with replica_reads():
+                finished = run_export_job(job)
+            if finished is None:
+                continue  # picked up by a request thread meanwhile
+            self.stdout.write(f"{finished.id}: {finished.status} {finished.error}".rstrip())
+        expired = cleanup_export_files()
+        if expired:
+            self.stdout.write(f"Expired {expired} old export file(s)")
@@ -0,0 +1,201 @@
+# metrics.py
+import bisect
+import contextvars
+import heapq
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# Queries kept per request for the slow-request log
+SLOW_QUERIES_LOGGED = 5
+SQL_LOG_LENGTH = 500
+
+# The RequestMetrics of the request being handled; asgiref copies it into
+# sync_to_async threads, so async views are counted too
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """What one request spent in the database and in serializers"""
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.slowest = []  # min-heap of (duration, order, sql)
+        # every (sql, params, duration), only while a request is being profiled
+        self.trace = None
+
+    def add_query(self, sql, duration, params=None):
+        self.queries += 1
+        self.db_time += duration
+        if self.trace is not None:
+            self.trace.append((sql, params, duration))
+        entry = (duration, self.queries, sql)
+        if len(self.slowest) < SLOW_QUERIES_LOGGED:
+            heapq.heappush(self.slowest, entry)
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def top_queries(self):
+        return sorted(self.slowest, reverse=True)
+
+
+def begin_request(request_metrics=None):
+    return _current.set(request_metrics or RequestMetrics())
+
+
+def current_request():
+    return _current.get()
+
+
+def end_request(token):
+    metrics = _current.get()
+    _current.reset(token)
+    return metrics
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper timing every query made while a request is being measured"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - start, params)
+
+
+@receiver(connection_created)
+def install_query_wrapper(sender, connection, **kwargs):
+    # outermost, so execute_wrapper() blocks entered later still pop their own wrapper
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class SerializerTimingMixin:
+    """Adds the time spent producing .data (including the queries it triggers) to the request's metrics"""
+    @property
+    def data(self):
+        metrics = _current.get()
+        if metrics is None:
+            return super().data # type: ignore
+        start = time.perf_counter()
+        try:
+            return super().data # type: ignore
+        finally:
+            metrics.serializer_time += time.perf_counter() - start
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(labels):
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Process-local request metrics, rendered in the Prometheus text format"""
+    HISTOGRAMS = {
+        'eeusurvey_request_duration_seconds': ('Time to build the response', LATENCY_BUCKETS),
+        'eeusurvey_request_db_queries': ('Database queries per request', QUERY_COUNT_BUCKETS),
+        'eeusurvey_response_size_bytes': ('Size of non-streaming response bodies', SIZE_BUCKETS),
+    }
+    COUNTERS = {
+        'eeusurvey_requests_total': 'Requests handled',
+        'eeusurvey_request_db_seconds_total': 'Time spent in database queries',
+        'eeusurvey_request_serializer_seconds_total': 'Time spent producing serializer data, queries included',
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(dict)
+        self._counters = defaultdict(lambda: defaultdict(float))
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            histogram = self._histograms[name].get(labels)
+            if histogram is None:
+                histogram = self._histograms[name][labels] = Histogram(self.HISTOGRAMS[name][1])
+            histogram.observe(value)
+
+    def increment(self, name, labels, value=1):
+        with self._lock:
+            self._counters[name][labels] += value
+
+    def record(self, route, method, status, duration, metrics, size=None):
+        labels = (('route', route), ('method', method))
+        self.increment('eeusurvey_requests_total', labels + (('status', status),))
+        self.observe('eeusurvey_request_duration_seconds', labels, duration)
+        self.observe('eeusurvey_request_db_queries', labels, metrics.queries)
+        self.increment('eeusurvey_request_db_seconds_total', labels, metrics.db_time)
+        self.increment('eeusurvey_request_serializer_seconds_total', labels, metrics.serializer_time)
+        if size is not None:
+            self.observe('eeusurvey_response_size_bytes', labels, size)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (help_text, buckets) in self.HISTOGRAMS.items():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for labels, histogram in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {_number(histogram.sum)}")
+                    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+            for name, help_text in self.COUNTERS.items():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for labels, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def route_of(request):
+    """The URL pattern that matched, so ids don't multiply the label values"""
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+def log_slow_request(request, duration, metrics):
+    queries = '\n'.join(
+        f"  {query_time * 1000:8.1f} ms  {sql[:SQL_LOG_LENGTH]}"
+        for query_time, _, sql in metrics.top_queries()
+    )
+    logger.warning(
+        "Slow request %s %s: %.0f ms, %d queries taking %.0f ms, serializers %.0f ms%s",
+        request.method, request.get_full_path(), duration * 1000, metrics.queries,
+        metrics.db_time * 1000, metrics.serializer_time * 1000,
+        f"\nSlowest queries:\n{queries}" if queries else '',
+    )
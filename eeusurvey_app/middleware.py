@@ -0,0 +1,119 @@
+# middleware.py
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from . import metrics, profiling
+from .routers import begin_request, survey_edited
+
+REPLICA_PIN_COOKIE = 'eeusurvey_primary'
+
+
+class ReplicaRoutingMiddleware:
+    """Resets replica routing per request, and keeps someone who just edited a
+    survey on the primary for READ_YOUR_WRITES_SECONDS so they see their change"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        begin_request(pinned=REPLICA_PIN_COOKIE in request.COOKIES)
+        return self.process_response(self.get_response(request))
+
+    async def __acall__(self, request):
+        begin_request(pinned=REPLICA_PIN_COOKIE in request.COOKIES)
+        return self.process_response(await self.get_response(request))
+
+    def process_response(self, response):
+        if survey_edited():
+            response.set_cookie(
+                REPLICA_PIN_COOKIE, '1', max_age=settings.READ_YOUR_WRITES_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class RequestMetricsMiddleware:
+    """Records latency, query count and time, serializer time and response size per URL
+    pattern (served at /api/metrics/), and logs requests slower than SLOW_REQUEST_SECONDS"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # connections opened before this module was loaded don't have the wrapper yet
+        for connection in connections.all(initialized_only=True):
+            metrics.install_query_wrapper(None, connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        token = metrics.begin_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_metrics = metrics.end_request(token)
+        self.record(request, response, time.perf_counter() - start, request_metrics)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        token = metrics.begin_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_metrics = metrics.end_request(token)
+        self.record(request, response, time.perf_counter() - start, request_metrics)
+        return response
+
+    def record(self, request, response, duration, request_metrics):
+        # streamed bodies are produced after this returns; only time to first byte is measured
+        size = None if response.streaming else len(response.content)
+        metrics.registry.record(
+            metrics.route_of(request), request.method, response.status_code, duration, request_metrics, size,
+        )
+        if duration >= settings.SLOW_REQUEST_SECONDS:
+            metrics.log_slow_request(request, duration, request_metrics)
+
+
+class ProfilingMiddleware:
+    """Profiles a staff request sent with `X-Profile: 1` or `?_profile=1`: cProfile stats and
+    every query, kept under PROFILE_ROOT and listed at /admin/profiles/. WSGI only; under ASGI
+    the view runs on another thread than the one a profiler would watch."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.get_response(request)
+        if not profiling.profiling_requested(request) or not request.user.is_staff:
+            return self.get_response(request)
+
+        profile = profiling.RequestProfile(request)
+        profile.resume()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.pause()
+        if response.streaming:
+            response.streaming_content = profile.stream(response.streaming_content, response)
+        else:
+            profile.save(response)
+        response['X-Profile-Id'] = profile.id
+        return response
@@ -1,8 +1,11 @@
 # models.py
 import uuid
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models, transaction
 from django.utils import timezone
+
+from .ids import uuid7
     
 class Survey(models.Model):
     LANGUAGES = [
@@ -10,10 +13,14 @@ class Survey(models.Model):
         ("am","Amharic"),
         ("om","Afan Oromo")
     ]
+    STORAGE_MODES = [
+        ("normalized", "Answer rows"),
+        ("document", "JSON document per response"),
+    ]
 
     id = models.UUIDField(
         primary_key=True,
-        default=uuid.uuid4,
+        default=uuid7,
         editable=False
     )
     title = models.CharField(max_length=500)
@@ -23,13 +30,44 @@ class Survey(models.Model):
     start_time = models.DateField()
     end_time = models.DateField()
     language = models.CharField(max_length=50,choices=LANGUAGES)
+    # "document" writes each submission as one SurveyResponse row; its Answer rows
+    # are created later by the materializer (see documents.py)
+    storage_mode = models.CharField(max_length=20, choices=STORAGE_MODES, default="normalized")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Set when the survey is deleted; its rows are purged in the background (see purge.py)
+    deleted_at = models.DateTimeField(blank=True, null=True, editable=False)
+    # Switched off by hand inside its window; apply_survey_schedule leaves it closed
+    closed_by_hand = models.BooleanField(default=False, editable=False)
+    # Set when archived responses are restored; archive_surveys then leaves it live
+    restored_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # SurveyViewSet.list filters on language and is_active; language leads
+            # because `is_active=True` compiles to a bare boolean, not an equality
+            models.Index(fields=["language", "is_active"], name="survey_language_active_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remembered so save can tell a survey switched off from one merely edited
+        instance._loaded_is_active = instance.__dict__.get("is_active")
+        return instance
 
     def save(self,*args,**kwargs):
-        if self.end_time <= timezone.now().date():
+        # outside its window a survey is closed; apply_survey_schedule opens it on start_time
+        today = timezone.now().date()
+        if self.end_time <= today or self.start_time > today:
             self.is_active = False
+            self.closed_by_hand = False
+        elif self.is_active:
+            self.closed_by_hand = False
+        elif self._state.adding or getattr(self, "_loaded_is_active", False):
+            self.closed_by_hand = True
         super().save(*args,**kwargs)
+        self._loaded_is_active = self.is_active
 
     
     def __str__(self):
@@ -45,9 +83,19 @@ class QuestionCategory(models.Model):
             models.UniqueConstraint(fields=["survey","cat_number","name"],name="unique_cat_number_per_survey")
         ]
         ordering = ["survey", "cat_number"]
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remembered so a save that keeps the number doesn't renumber its siblings
+        instance._loaded_cat_number = instance.__dict__.get("cat_number")
+        return instance
+
+    def number_changed(self):
+        return self._state.adding or self.cat_number != getattr(self, "_loaded_cat_number", None)
+
     def clean(self):
         """Extra validation: cat_number must stay in range"""
-        if self.cat_number is not None:
+        if self.cat_number is not None and self.number_changed():
             # Count current categories (exclude self if updating)
             count = QuestionCategory.objects.filter(
                 survey=self.survey
@@ -61,6 +109,7 @@ class QuestionCategory(models.Model):
     def save(self, *args, **kwargs):
         self.full_clean()  # ensure validation runs
         with transaction.atomic():
+            previous = None if self._state.adding else getattr(self, "_loaded_cat_number", None)
             if self.cat_number is None:
                 # Auto-generate: next available number
                 last_number = (
@@ -70,14 +119,22 @@ class QuestionCategory(models.Model):
                     .get("cat_number__max")
                 )
                 self.cat_number = 1 if last_number is None else last_number + 1
-            else:
-                # If conflict → shift others down
-                QuestionCategory.objects.filter(
-                    survey=self.survey,
-                    cat_number__gte=self.cat_number
-                ).exclude(pk=self.pk).update(cat_number=models.F("cat_number") + 1)
+            elif self.number_changed():
+                # Make room: shift only the categories between the old and new position
+                siblings = QuestionCategory.objects.filter(survey=self.survey).exclude(pk=self.pk)
+                if previous is None:
+                    siblings.filter(cat_number__gte=self.cat_number).update(cat_number=models.F("cat_number") + 1)
+                elif self.cat_number < previous:
+                    siblings.filter(
+                        cat_number__gte=self.cat_number, cat_number__lt=previous
+                    ).update(cat_number=models.F("cat_number") + 1)
+                else:
+                    siblings.filter(
+                        cat_number__gt=previous, cat_number__lte=self.cat_number
+                    ).update(cat_number=models.F("cat_number") - 1)
 
             super().save(*args, **kwargs)
+            self._loaded_cat_number = self.cat_number
 
     def delete(self, *args, **kwargs):
         with transaction.atomic():
@@ -166,28 +223,69 @@ class Question(models.Model):
 class SurveyResponse(models.Model):
     id = models.UUIDField(
         primary_key=True,
-        default=uuid.uuid4,
+        default=uuid7,
         editable=False
     )
     survey = models.ForeignKey(Survey, related_name='responses', on_delete=models.CASCADE)
     submitted_at = models.DateTimeField(auto_now_add=True)
+    # When the row was written. Imported paper responses keep their historical
+    # submitted_at, so incremental exports page on this column instead.
+    created_at = models.DateTimeField(auto_now_add=True)
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     user_agent = models.TextField(blank=True, null=True)
     session_id = models.CharField(max_length=255, blank=True, null=True)
     is_complete = models.BooleanField(default=True)
+    # Document-mode submissions: the answers as submitted, until materialized into Answer rows
+    answer_document = models.JSONField(blank=True, null=True)
+    answers_materialized = models.BooleanField(default=True)
     
     class Meta:
         ordering = ['-submitted_at']
+        indexes = [
+            # keyset pagination for incremental exports
+            models.Index(fields=["survey", "created_at", "id"], name="response_survey_cursor_idx"),
+            # a survey's responses by submission date (exports newest first, timelines)
+            models.Index(fields=["survey", "submitted_at"], name="response_survey_submitted_idx"),
+            # admin changelist date filter and exact-match search
+            models.Index(fields=["submitted_at"], name="response_submitted_idx"),
+            models.Index(fields=["ip_address"], name="response_ip_idx"),
+            models.Index(fields=["session_id"], name="response_session_idx"),
+            # pending document-mode responses of a survey (survey leads: the flag
+            # alone compiles to a bare boolean that can't seek an index)
+            models.Index(fields=["survey", "answers_materialized"], name="response_pending_idx"),
+        ]
     
     def __str__(self):
         return f"Response to {self.survey.title} at {self.submitted_at}"
 
 
+def encode_option_ids(option_ids):
+    """Multi-select storage format: sorted ids wrapped in commas (",3,17,") so one id matches LIKE '%,17,%'"""
+    ids = sorted({int(option_id) for option_id in option_ids})
+    return f",{','.join(str(option_id) for option_id in ids)}," if ids else None
+
+
+def decode_option_ids(value):
+    return [int(option_id) for option_id in value.strip(',').split(',')] if value else []
+
+
 class Answer(models.Model):
     response = models.ForeignKey(SurveyResponse, related_name='answers', on_delete=models.CASCADE)
     question = models.ForeignKey(Question, related_name='answers', on_delete=models.CASCADE)
     
-    # For choice-based questions
+    # For choice-based questions: single_choice/drop_down answers keep the option
+    # in selected_option, multi_select answers keep encode_option_ids() in option_ids
+    selected_option = models.ForeignKey(
+        QuestionOption,
+        related_name='single_answers',
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL
+    )
+    option_ids = models.TextField(blank=True, null=True)
+
+    # Previous layout (one through row per selected option). Only read by the
+    # compact_choice_answers command; drop it once that has run everywhere.
     selected_options = models.ManyToManyField(QuestionOption, blank=True)
     
     # For text-based questions
@@ -206,6 +304,146 @@ class Answer(models.Model):
     
     class Meta:
         unique_together = ('response', 'question')
+        indexes = [
+            models.Index(fields=["created_at"], name="answer_created_idx"),
+            # per-question analysis; covers the rating and number aggregates
+            models.Index(fields=["question", "rating_value"], name="answer_question_rating_idx"),
+            models.Index(fields=["question", "number_value"], name="answer_question_number_idx"),
+            models.Index(fields=["question", "selected_option"], name="answer_question_option_idx"),
+        ]
     
     def __str__(self):
         return f"Answer to {self.question.question_text[:30]}"
+
+    @property
+    def selected_option_ids(self):
+        if self.selected_option_id is not None: # type: ignore
+            return [self.selected_option_id] # type: ignore
+        return decode_option_ids(self.option_ids)
+
+    def set_selected_option_ids(self, option_ids, multiple):
+        """Store the chosen options in the column that matches the question type"""
+        option_ids = [int(option_id) for option_id in option_ids]
+        if multiple:
+            self.selected_option = None
+            self.option_ids = encode_option_ids(option_ids)
+        else:
+            self.selected_option_id = option_ids[0] if option_ids else None
+            self.option_ids = None
+
+
+class ResponseTombstone(models.Model):
+    """Deleted responses, so incremental exports can propagate deletions"""
+    id = models.BigAutoField(primary_key=True, editable=False)
+    response_id = models.UUIDField()
+    survey_id = models.UUIDField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["survey_id", "id"], name="tombstone_survey_idx"),
+        ]
+
+    def __str__(self):
+        return f"Deleted response {self.response_id} at {self.deleted_at}"
+
+
+class ExportJob(models.Model):
+    STATUSES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("finished", "Finished"),
+        ("failed", "Failed"),
+        ("expired", "Expired"),
+    ]
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    survey = models.ForeignKey(Survey, related_name='export_jobs', on_delete=models.CASCADE)
+    export_format = models.CharField(max_length=10)
+    status = models.CharField(max_length=10, choices=STATUSES, default="pending")
+    total_responses = models.PositiveIntegerField(default=0)
+    processed_responses = models.PositiveIntegerField(default=0)
+    file_path = models.CharField(max_length=500, blank=True)
+    file_size = models.BigIntegerField(default=0)
+    checksum = models.CharField(max_length=64, blank=True, help_text="SHA-256 of the finished file")
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # bumped with every progress report, so a job whose worker died can be told from a slow one
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    @property
+    def progress(self):
+        if self.status == "finished":
+            return 100
+        return int(self.processed_responses * 100 / max(self.total_responses, 1))
+
+    def __str__(self):
+        return f"{self.export_format} export of {self.survey.title} ({self.status})"
+
+
+class SurveyArchive(models.Model):
+    """Responses of a closed survey, moved out of the live tables into a compressed file"""
+    STATUSES = [
+        ("archiving", "Archiving"),
+        ("archived", "Archived"),
+        ("restoring", "Restoring"),
+        ("failed", "Restore failed"),
+    ]
+
+    survey = models.OneToOneField(Survey, related_name='archive', on_delete=models.CASCADE, primary_key=True)
+    # archiving: file written, live rows still being purged; only then may a run resume the purge.
+    # Restores claim archived (or failed) ones, so a purge never races a restore.
+    status = models.CharField(max_length=10, choices=STATUSES, default="archiving")
+    restored_responses = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    file_path = models.CharField(max_length=500)
+    file_size = models.BigIntegerField(default=0)
+    checksum = models.CharField(max_length=64, help_text="SHA-256 of the archive file")
+    response_count = models.PositiveIntegerField(default=0)
+    answer_count = models.PositiveIntegerField(default=0)
+    # Final analysis, so archived surveys still show their results (see archives.py)
+    statistics = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    # bumped after every restored batch, so a stalled restore can be told from a slow one
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def progress(self):
+        return int(self.restored_responses * 100 / max(self.response_count, 1))
+
+    def __str__(self):
+        return f"Archive of {self.survey.title} ({self.response_count} responses)"
+
+
+class SurveyDeletion(models.Model):
+    """Background purge of a deleted survey; goes away with the survey when it finishes"""
+    STATUSES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("failed", "Failed"),
+    ]
+
+    survey = models.OneToOneField(Survey, related_name='deletion', on_delete=models.CASCADE, primary_key=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default="pending")
+    total_responses = models.PositiveIntegerField(default=0)
+    deleted_responses = models.PositiveIntegerField(default=0)
+    requested_by = models.CharField(max_length=150, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # bumped after every batch, so a stalled worker can be told from a slow one
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def progress(self):
+        return int(self.deleted_responses * 100 / max(self.total_responses, 1))
+
+    def __str__(self):
+        return f"Deletion of {self.survey.title} ({self.status}, {self.progress}%)"
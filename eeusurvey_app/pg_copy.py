@@ -0,0 +1,177 @@
+# pg_copy.py
+import codecs
+import tempfile
+import uuid
+
+from .models import Answer, Question, QuestionOption, SurveyResponse
+
+CHOICE_TYPES = ['single_choice', 'drop_down', 'multi_select']
+LABEL_SEPARATOR = '; '
+COPY_SPOOL_BYTES = 8 * 1024 * 1024
+COPY_BLOCK_SIZE = 64 * 1024
+# COPY ... TO STDOUT in csv format with these never quotes jsonb text (which escapes
+# every control character), so each line is the raw JSON document
+JSON_COPY_OPTIONS = "FORMAT csv, DELIMITER E'\\x02', QUOTE E'\\x01'"
+
+
+def copy_supported(connection):
+    """True for PostgreSQL through psycopg 3, whose cursors have copy()"""
+    if connection.vendor != 'postgresql':
+        return False
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    return is_psycopg3
+
+
+def copy_rows_in(connection, table, columns, rows):
+    """COPY rows (sequences of already db-prepped values) into table"""
+    qn = connection.ops.quote_name
+    sql = f"COPY {qn(table)} ({', '.join(qn(column) for column in columns)}) FROM STDIN"
+    with connection.cursor() as cursor:
+        with cursor.copy(sql) as copy:
+            for row in rows:
+                copy.write_row(row)
+
+
+def copy_out(connection, sql, spool_bytes=COPY_SPOOL_BYTES, block_size=COPY_BLOCK_SIZE):
+    """Run `COPY (...) TO STDOUT` and stream its output as text chunks.
+
+    psycopg keeps the connection busy until a COPY ends, so the output is spooled
+    (in memory, then on disk past spool_bytes) and only handed out once the
+    connection is free again; callers can query between chunks.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=spool_bytes) as spool:
+        with connection.cursor() as cursor:
+            with cursor.copy(sql) as copy:
+                for block in copy:
+                    spool.write(block)
+        spool.seek(0)
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        for block in iter(lambda: spool.read(block_size), b''):
+            text = decoder.decode(block)
+            if text:
+                yield text
+        tail = decoder.decode(b'', final=True)
+        if tail:
+            yield tail
+
+
+class CopyExportQuery:
+    """Whole-survey export statements for COPY TO, formatted like the Python exporters"""
+
+    def __init__(self, survey, connection):
+        self.survey = survey
+        self.connection = connection
+        # Django's debug cursor wrapper passes no parameters to copy(), so the
+        # survey id goes in as a literal; round-tripping it through UUID keeps that safe
+        self.survey_literal = f"'{uuid.UUID(str(survey.id))}'::uuid"
+
+    def qn(self, name):
+        return self.connection.ops.quote_name(name)
+
+    def table(self, model):
+        return self.qn(model._meta.db_table)
+
+    def option_label(self, alias):
+        # same precedence as option_text(): label, then text, then value
+        return (
+            f"COALESCE(NULLIF({alias}.{self.qn('label')}, ''), "
+            f"NULLIF({alias}.{self.qn('text')}, ''), {alias}.{self.qn('value')})"
+        )
+
+    def option_ids_array(self):
+        return f"string_to_array(btrim(a.{self.qn('option_ids')}, ','), ',')::bigint[]"
+
+    def csv_cell(self, question):
+        match = f"a.{self.qn('question_id')} = {int(question.id)}"
+        if question.question_type in CHOICE_TYPES:
+            labels = 'ml.labels' if question.question_type == 'multi_select' else 'sl.label'
+            other = f"MAX(CASE WHEN {match} THEN NULLIF(a.{self.qn('custom_text')}, '') END)"
+            return (
+                f"MAX(CASE WHEN {match} THEN {labels} END)"
+                f" || COALESCE(' (Other: ' || {other} || ')', '')"
+            )
+        if question.question_type == 'rating':
+            return f"NULLIF(MAX(CASE WHEN {match} THEN a.{self.qn('rating_value')} END), 0)::text"
+        if question.question_type == 'number':
+            value = f"NULLIF(MAX(CASE WHEN {match} THEN a.{self.qn('number_value')} END), 0)"
+            # Python prints whole floats as "3.0"
+            return (
+                f"CASE WHEN {value} = trunc({value}) AND abs({value}) < 1e16 "
+                f"THEN trunc({value})::bigint::text || '.0' ELSE {value}::text END"
+            )
+        return f"NULLIF(MAX(CASE WHEN {match} THEN a.{self.qn('text_value')} END), '')"
+
+    def csv_sql(self, questions):
+        """COPY statement producing the data rows of the CSV export (header not included)"""
+        columns = [
+            f"r.{self.qn('id')}::text",
+            f"to_char(r.{self.qn('submitted_at')} AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')",
+        ] + [self.csv_cell(question) for question in questions]
+        question_ids = ', '.join(str(int(q.id)) for q in questions) or 'NULL'
+        select = (
+            f"SELECT {', '.join(columns)} "
+            f"FROM {self.table(SurveyResponse)} r "
+            f"LEFT JOIN {self.table(Answer)} a ON a.{self.qn('response_id')} = r.{self.qn('id')} "
+            f"AND a.{self.qn('question_id')} IN ({question_ids}) "
+            f"LEFT JOIN LATERAL (SELECT {self.option_label('so')} AS label "
+            f"FROM {self.table(QuestionOption)} so WHERE so.{self.qn('id')} = a.{self.qn('selected_option_id')} "
+            f"AND so.{self.qn('survey_id')} = r.{self.qn('survey_id')}) sl ON true "
+            f"LEFT JOIN LATERAL (SELECT string_agg({self.option_label('mo')}, '{LABEL_SEPARATOR}' "
+            f"ORDER BY mo.{self.qn('id')}) AS labels FROM {self.table(QuestionOption)} mo "
+            f"WHERE a.{self.qn('option_ids')} IS NOT NULL AND mo.{self.qn('id')} = ANY({self.option_ids_array()}) "
+            f"AND mo.{self.qn('survey_id')} = r.{self.qn('survey_id')}) ml ON true "
+            f"WHERE r.{self.qn('survey_id')} = {self.survey_literal} "
+            f"GROUP BY r.{self.qn('id')}, r.{self.qn('submitted_at')} "
+            f"ORDER BY r.{self.qn('submitted_at')} DESC"
+        )
+        return f"COPY ({select}) TO STDOUT WITH (FORMAT csv)"
+
+    def isoformat(self, column):
+        # datetime.isoformat() on a UTC value: microseconds only when non-zero
+        utc = f"{column} AT TIME ZONE 'UTC'"
+        return (
+            f"to_char({utc}, 'YYYY-MM-DD\"T\"HH24:MI:SS') || "
+            f"CASE WHEN to_char({utc}, 'US') = '000000' THEN '' ELSE to_char({utc}, '.US') END || '+00:00'"
+        )
+
+    def option_object(self, alias):
+        return f"jsonb_build_object('id', {alias}.{self.qn('id')}, 'label', {self.option_label(alias)})"
+
+    def json_value(self):
+        return (
+            f"CASE WHEN q.{self.qn('question_type')} = 'multi_select' THEN COALESCE(("
+            f"SELECT jsonb_agg({self.option_object('mo')} ORDER BY mo.{self.qn('id')}) FROM {self.table(QuestionOption)} mo "
+            f"WHERE mo.{self.qn('id')} = ANY({self.option_ids_array()}) "
+            f"AND mo.{self.qn('survey_id')} = r.{self.qn('survey_id')}), '[]'::jsonb) "
+            f"WHEN q.{self.qn('question_type')} IN ('single_choice', 'drop_down') THEN ("
+            f"SELECT {self.option_object('so')} FROM {self.table(QuestionOption)} so "
+            f"WHERE so.{self.qn('id')} = a.{self.qn('selected_option_id')} "
+            f"AND so.{self.qn('survey_id')} = r.{self.qn('survey_id')}) "
+            f"WHEN q.{self.qn('question_type')} = 'rating' THEN to_jsonb(a.{self.qn('rating_value')}) "
+            f"WHEN q.{self.qn('question_type')} = 'number' THEN to_jsonb(a.{self.qn('number_value')}) "
+            f"ELSE to_jsonb(a.{self.qn('text_value')}) END"
+        )
+
+    def jsonl_sql(self):
+        """COPY statement producing the JSON lines export, one document per response"""
+        answer = (
+            f"jsonb_build_object('question_id', q.{self.qn('id')}, 'type', q.{self.qn('question_type')}, "
+            f"'value', {self.json_value()}, 'custom_text', a.{self.qn('custom_text')})"
+        )
+        submitted_at = f"r.{self.qn('submitted_at')}"
+        select = (
+            f"SELECT jsonb_build_object("
+            f"'response_id', r.{self.qn('id')}::text, "
+            f"'submitted_at', {self.isoformat(submitted_at)}, "
+            f"'is_complete', r.{self.qn('is_complete')}, "
+            f"'answers', COALESCE(jsonb_object_agg(q.{self.qn('question_label')}, {answer}) "
+            f"FILTER (WHERE q.{self.qn('id')} IS NOT NULL), '{{}}'::jsonb))::text "
+            f"FROM {self.table(SurveyResponse)} r "
+            f"LEFT JOIN {self.table(Answer)} a ON a.{self.qn('response_id')} = r.{self.qn('id')} "
+            f"LEFT JOIN {self.table(Question)} q ON q.{self.qn('id')} = a.{self.qn('question_id')} "
+            f"AND q.{self.qn('survey_id')} = r.{self.qn('survey_id')} "
+            f"WHERE r.{self.qn('survey_id')} = {self.survey_literal} "
+            f"GROUP BY r.{self.qn('id')}, r.{self.qn('submitted_at')}, r.{self.qn('is_complete')} "
+            f"ORDER BY r.{self.qn('submitted_at')} DESC"
+        )
+        return f"COPY ({select}) TO STDOUT WITH ({JSON_COPY_OPTIONS})"
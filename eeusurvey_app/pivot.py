@@ -0,0 +1,144 @@
+# pivot.py
+import uuid
+
+from django.db import connections, router
+
+from .models import Answer, QuestionOption, SurveyResponse, decode_option_ids
+
+PIVOT_QUESTION_CHUNK = 50
+PIVOT_RESPONSE_BATCH = 1000
+CHOICE_TYPES = ['single_choice', 'drop_down', 'multi_select']
+LABEL_SEPARATOR = '; '
+
+# question_type -> Answer column holding its value
+VALUE_COLUMNS = {
+    'rating': 'rating_value',
+    'number': 'number_value',
+}
+
+
+class PivotQueryBuilder:
+    """Builds wide (one row per response, one column per question) result sets in the database.
+
+    Each chunk of questions becomes a single conditional-aggregation statement
+    (MAX(CASE WHEN question_id = ... END)) over a batch of responses, reading only
+    the answer table; Python stitches chunks together and turns the stored option
+    ids into labels. Works on SQLite, MySQL and PostgreSQL.
+    """
+
+    def __init__(self, survey, questions=None, using=None,
+                 question_chunk=PIVOT_QUESTION_CHUNK, response_batch=PIVOT_RESPONSE_BATCH):
+        self.survey = survey
+        self.questions = list(questions) if questions is not None else list(
+            survey.questions.all().order_by('category__cat_number', 'id') # type: ignore
+        )
+        # raw SQL bypasses the router, so ask it where survey reads should go
+        self.using = using or router.db_for_read(SurveyResponse)
+        self.connection = connections[self.using]
+        self.question_chunk = question_chunk
+        self.response_batch = response_batch
+        self.labels = {
+            option_id: label or text or value
+            for option_id, label, text, value in QuestionOption.objects.using(using)
+            .filter(survey=survey).values_list('id', 'label', 'text', 'value')
+        }
+
+    def qn(self, name):
+        return self.connection.ops.quote_name(name)
+
+    def columns_for(self, question):
+        """Select expressions for one question (choice questions also carry custom text)"""
+        match = f"a.{self.qn('question_id')} = {int(question.id)}"
+        if question.question_type in CHOICE_TYPES:
+            column = 'option_ids' if question.question_type == 'multi_select' else 'selected_option_id'
+            return [
+                f"MAX(CASE WHEN {match} THEN a.{self.qn(column)} END)",
+                f"MAX(CASE WHEN {match} THEN a.{self.qn('custom_text')} END)",
+            ]
+        column = VALUE_COLUMNS.get(question.question_type, 'text_value')
+        return [f"MAX(CASE WHEN {match} THEN a.{self.qn(column)} END)"]
+
+    def sql(self, questions, batch_size):
+        """SQL for one question chunk; params are the response ids of the batch"""
+        answer_table = self.qn(Answer._meta.db_table)
+        columns = []
+        for question in questions:
+            columns.extend(self.columns_for(question))
+        question_ids = ', '.join(str(int(q.id)) for q in questions)
+        placeholders = ', '.join(['%s'] * batch_size)
+
+        return (
+            f"SELECT a.{self.qn('response_id')}, {', '.join(columns)} "
+            f"FROM {answer_table} a "
+            f"WHERE a.{self.qn('response_id')} IN ({placeholders}) "
+            f"AND a.{self.qn('question_id')} IN ({question_ids}) "
+            f"GROUP BY a.{self.qn('response_id')}"
+        )
+
+    def response_batches(self):
+        """(id, submitted_at) pairs in export order, a batch at a time"""
+        responses = (
+            SurveyResponse.objects.using(self.using)
+            .filter(survey=self.survey)
+            .values_list('id', 'submitted_at')
+            .iterator(chunk_size=self.response_batch)
+        )
+        batch = []
+        for response in responses:
+            batch.append(response)
+            if len(batch) == self.response_batch:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def rows(self):
+        """Yield (response_id, submitted_at, [value per question]) for every response.
+
+        Choice questions yield a (labels, custom_text) pair; unanswered questions yield None.
+        """
+        pk_field = SurveyResponse._meta.pk
+        chunks = [
+            self.questions[i:i + self.question_chunk]
+            for i in range(0, len(self.questions), self.question_chunk)
+        ]
+
+        for batch in self.response_batches():
+            params = [pk_field.get_db_prep_value(response_id, self.connection) for response_id, _ in batch] # type: ignore
+            values = {response_id: [] for response_id, _ in batch}
+            for questions in chunks:
+                found = {}
+                with self.connection.cursor() as cursor:
+                    cursor.execute(self.sql(questions, len(batch)), params)
+                    for row in cursor.fetchall():
+                        found[uuid.UUID(str(row[0]))] = row[1:]
+                for response_id in values:
+                    values[response_id].extend(self.split_row(questions, found.get(response_id)))
+            for response_id, submitted_at in batch:
+                yield response_id, submitted_at, values[response_id]
+
+    def option_labels(self, question, stored):
+        """'; '-joined labels for a stored selected_option_id / option_ids value"""
+        if stored is None:
+            return None
+        if question.question_type == 'multi_select':
+            option_ids = decode_option_ids(stored)
+        else:
+            option_ids = [int(stored)]
+        labels = [self.labels[option_id] for option_id in option_ids if option_id in self.labels]
+        return LABEL_SEPARATOR.join(labels) if labels else None
+
+    def split_row(self, questions, row):
+        """Group a flat chunk row back into one value per question"""
+        result = []
+        position = 0
+        for question in questions:
+            if question.question_type in CHOICE_TYPES:
+                result.append(None if row is None else (
+                    self.option_labels(question, row[position]), row[position + 1]
+                ))
+                position += 2
+            else:
+                result.append(None if row is None else row[position])
+                position += 1
+        return result
@@ -0,0 +1,150 @@
+# profiling.py
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import metrics
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = '_profile'
+PROFILE_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+SUMMARY_FUNCTIONS = 40
+PARAMS_LENGTH = 500
+
+
+def profile_root():
+    os.makedirs(settings.PROFILE_ROOT, exist_ok=True)
+    return settings.PROFILE_ROOT
+
+
+def profiling_requested(request):
+    """`X-Profile: 1` or `?_profile=1` (exactly; `?x_profile=1` or `?_profile=10` don't count)"""
+    return request.META.get(PROFILE_HEADER) == '1' or request.GET.get(PROFILE_PARAM) == '1'
+
+
+def profile_path(profile_id, extension):
+    if not PROFILE_ID_RE.match(profile_id):
+        raise ValueError(f"Not a profile id: {profile_id}")
+    return os.path.join(profile_root(), f"{profile_id}.{extension}")
+
+
+class RequestProfile:
+    """cProfile stats and the full SQL trace of one request, streamed body included"""
+
+    def __init__(self, request):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.profiler = cProfile.Profile()
+        # share the metrics middleware's tracker so its query count matches the trace
+        self.metrics = metrics.current_request() or metrics.RequestMetrics()
+        self.metrics.trace = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self._resumed = self.started
+        self._token = None
+        # Python 3.12+ allows one active profiler per process; overlapping profiles lose time
+        self.complete = True
+
+    def resume(self):
+        self._token = metrics.begin_request(self.metrics)
+        self._resumed = time.perf_counter()
+        try:
+            self.profiler.enable()
+        except ValueError:
+            self.complete = False
+
+    def pause(self):
+        self.profiler.disable()
+        self.elapsed += time.perf_counter() - self._resumed
+        metrics.end_request(self._token)
+
+    def stream(self, content, response):
+        """Profile the production of a streamed body, saving once it has been sent"""
+        try:
+            iterator = iter(content)
+            while True:
+                self.resume()
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    self.pause()
+                yield chunk
+        finally:
+            self.save(response)
+
+    def summary(self):
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.strip_dirs().sort_stats('cumulative').print_stats(SUMMARY_FUNCTIONS)
+        return out.getvalue()
+
+    def save(self, response):
+        self.profiler.dump_stats(profile_path(self.id, 'prof'))
+        trace = self.metrics.trace or []
+        record = {
+            'id': self.id,
+            'created_at': timezone.now().isoformat(),
+            'method': self.request.method,
+            'path': self.request.get_full_path(),
+            'user': self.request.user.get_username(),
+            'status': response.status_code,
+            'streaming': response.streaming,
+            'complete': self.complete,
+            'profiled_ms': round(self.elapsed * 1000, 1),
+            'wall_ms': round((time.perf_counter() - self.started) * 1000, 1),
+            'query_count': len(trace),
+            'db_ms': round(sum(duration for _, _, duration in trace) * 1000, 1),
+            'queries': [
+                {'sql': sql, 'params': repr(params)[:PARAMS_LENGTH], 'ms': round(duration * 1000, 3)}
+                for sql, params, duration in trace
+            ],
+            'summary': self.summary(),
+        }
+        self.metrics.trace = None
+        with open(profile_path(self.id, 'json'), 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        prune_profiles()
+
+
+def list_profiles():
+    """Saved profile records, newest first (without the query list and summary)"""
+    root = profile_root()
+    records = []
+    for name in os.listdir(root):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(root, name), encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            continue
+        record.pop('queries', None)
+        record.pop('summary', None)
+        records.append(record)
+    return sorted(records, key=lambda record: record['created_at'], reverse=True)
+
+
+def load_profile(profile_id):
+    with open(profile_path(profile_id, 'json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def prune_profiles(keep=None):
+    """Delete all but the `keep` newest profiles"""
+    if keep is None:
+        keep = settings.PROFILE_KEEP
+    for record in list_profiles()[keep:]:
+        for extension in ('json', 'prof'):
+            path = profile_path(record['id'], extension)
+            if os.path.exists(path):
+                os.unlink(path)
@@ -0,0 +1,139 @@
+# purge.py
+import os
+import threading
+from datetime import timedelta
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .dashboard import invalidate_dashboard
+from .models import Answer, ExportJob, ResponseTombstone, Survey, SurveyArchive, SurveyDeletion, SurveyResponse
+from .survey_cache import invalidate_surveys
+
+PURGE_BATCH_SIZE = 1000
+# A running deletion that hasn't finished a batch for this long is taken over
+STALE_DELETION_AFTER = timedelta(minutes=10)
+
+
+def delete_in(model, field_name, values, using=DEFAULT_DB_ALIAS):
+    """DELETE rows whose field is in `values`; returns the row count.
+
+    Raw SQL, so Django's collector doesn't load the rows first and no delete
+    signals fire (no ResponseTombstones are written).
+    """
+    if not values:
+        return 0
+    connection = connections[using]
+    field = model._meta.get_field(field_name)
+    qn = connection.ops.quote_name
+    sql = 'DELETE FROM {} WHERE {} IN ({})'.format(
+        qn(model._meta.db_table), qn(field.column), ', '.join(['%s'] * len(values))
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [field.get_db_prep_value(value, connection) for value in values])
+        return cursor.rowcount
+
+
+def purge_responses(response_ids, using=DEFAULT_DB_ALIAS):
+    """Delete responses with their answers (and legacy option rows) in one transaction"""
+    through = Answer.selected_options.through # type: ignore
+    with transaction.atomic(using=using):
+        # nothing points at the through table, so this is a single DELETE ... IN (SELECT ...)
+        through.objects.using(using).filter(answer__response_id__in=response_ids).delete()
+        delete_in(Answer, 'response', response_ids, using)
+        return delete_in(SurveyResponse, 'id', response_ids, using)
+
+
+def purge_survey_responses(survey_id, batch_size=PURGE_BATCH_SIZE, using=DEFAULT_DB_ALIAS, progress=None):
+    """Delete every response of a survey, one short transaction per batch; returns how many.
+
+    `progress`, if given, is called with the number deleted so far after each batch.
+    """
+    deleted = 0
+    responses = SurveyResponse.objects.using(using).filter(survey_id=survey_id).order_by()
+    while True:
+        batch = list(responses.values_list('id', flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        deleted += purge_responses(batch, using)
+        if progress:
+            progress(deleted)
+
+
+def request_survey_deletion(survey, requested_by=''):
+    """Hide the survey right away and queue the purge of its rows; returns the SurveyDeletion"""
+    with transaction.atomic():
+        Survey.objects.filter(pk=survey.pk).update(deleted_at=timezone.now(), is_active=False)
+        deletion, _ = SurveyDeletion.objects.get_or_create(
+            survey=survey,
+            defaults={
+                'total_responses': SurveyResponse.objects.filter(survey=survey).count(),
+                'requested_by': requested_by,
+            },
+        )
+    invalidate_dashboard()
+    invalidate_surveys()
+    return deletion
+
+
+def claim_survey_deletion(deletion):
+    """Mark the deletion running; False if a live worker (thread or command) already has it"""
+    claimed = unfinished_deletions().filter(pk=deletion.pk).order_by().update(
+        status='running', error='', updated_at=timezone.now()
+    )
+    if claimed:
+        deletion.status = 'running'
+    return bool(claimed)
+
+
+def run_survey_deletion(deletion, batch_size=PURGE_BATCH_SIZE):
+    """Purge the responses batch by batch, then delete the (now small) survey itself.
+
+    Returns True when done, False if it failed, or None if someone else is running it.
+    """
+    if not claim_survey_deletion(deletion):
+        return None
+    survey_id = deletion.survey_id # type: ignore
+
+    def report(deleted):
+        SurveyDeletion.objects.filter(pk=deletion.pk).update(
+            deleted_responses=deleted, updated_at=timezone.now()
+        )
+
+    try:
+        purge_survey_responses(survey_id, batch_size, progress=report)
+        ResponseTombstone.objects.filter(survey_id=survey_id).delete()
+        # files outlive their rows, so remove them first
+        paths = list(ExportJob.objects.filter(survey_id=survey_id).exclude(file_path='').values_list('file_path', flat=True))
+        paths += list(SurveyArchive.objects.filter(survey_id=survey_id).values_list('file_path', flat=True))
+        for path in paths:
+            if os.path.exists(path):
+                os.unlink(path)
+        # questions, options, categories and keys: hundreds of rows at most
+        Survey.objects.filter(pk=survey_id).delete()
+    except Exception as e:
+        SurveyDeletion.objects.filter(pk=deletion.pk).update(status='failed', error=str(e), updated_at=timezone.now())
+        return False
+    return True
+
+
+def start_survey_deletion(deletion):
+    """Run the deletion on a daemon thread so the admin request returns immediately"""
+    def target():
+        try:
+            run_survey_deletion(deletion)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=target, name=f"delete-{deletion.survey_id}", daemon=True)
+    thread.start()
+    return thread
+
+
+def unfinished_deletions():
+    """Deletions nobody is working on: queued, failed, or running without progress for a while"""
+    stale = timezone.now() - STALE_DELETION_AFTER
+    return SurveyDeletion.objects.filter(
+        Q(status__in=['pending', 'failed']) | Q(status='running', updated_at__lt=stale)
+    ).order_by('created_at')
@@ -0,0 +1,92 @@
+# query_plans.py
+import json
+import re
+import uuid
+from datetime import timedelta
+
+from django.db import connections
+from django.db.models import Avg, Count
+from django.utils import timezone
+
+from .models import Answer, Question, QuestionCategory, ResponseTombstone, Survey, SurveyResponse
+
+
+def hot_queries():
+    """(name, queryset) for the queries the app runs most, in the shape the code builds them"""
+    survey_id = uuid.uuid4()
+    since = timezone.now() - timedelta(days=30)
+    question_options = Question.options.through # type: ignore
+    return [
+        ('answers by question (rating distribution)',
+         Answer.objects.filter(question_id=1).values('rating_value').annotate(count=Count('id')).order_by()),
+        ('answers by question (number stats)',
+         Answer.objects.filter(question_id=1, number_value__isnull=False).values('question_id')
+         .annotate(average=Avg('number_value')).order_by()),
+        ('answers of a response',
+         Answer.objects.filter(response_id=survey_id)),
+        ('answers by created_at (admin filter)',
+         Answer.objects.filter(created_at__gte=since)),
+        ('responses by survey and submitted_at',
+         SurveyResponse.objects.filter(survey_id=survey_id, submitted_at__gte=since).order_by('submitted_at', 'id')),
+        ('responses since an incremental export cursor',
+         SurveyResponse.objects.filter(survey_id=survey_id, created_at__gte=since).order_by('created_at', 'id')),
+        ('answers by question (single choice counts)',
+         Answer.objects.filter(question_id=1, selected_option__isnull=False)
+         .values_list('selected_option_id').annotate(count=Count('id')).order_by()),
+        ('options of a question',
+         question_options.objects.filter(question_id=1)),
+        ('active surveys by language (SurveyViewSet.list)',
+         Survey.objects.filter(is_active=True, language='en', deleted_at__isnull=True)),
+        ('categories of a survey in order',
+         QuestionCategory.objects.filter(survey_id=survey_id).order_by('cat_number')),
+        ('questions of a survey in export order',
+         Question.objects.filter(survey_id=survey_id).order_by('category__cat_number', 'id')),
+        ('pending document-mode responses of a survey',
+         SurveyResponse.objects.filter(survey_id=survey_id, answers_materialized=False).order_by()),
+        ('tombstones since cursor',
+         ResponseTombstone.objects.filter(survey_id=survey_id, id__gt=0).order_by('id')),
+    ]
+
+
+def full_scans(plan, vendor):
+    """Tables the plan reads with a full table scan"""
+    if vendor == 'sqlite':
+        # "SCAN table" without an index; "SEARCH" and "SCAN ... USING INDEX" are fine
+        return re.findall(r'\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)(?:\s|$)', plan)
+    if vendor == 'postgresql':
+        return re.findall(r'Seq Scan on (\w+)', plan)
+    if vendor == 'mysql':
+        return list(_mysql_full_scans(json.loads(plan)))
+    return []
+
+
+def _mysql_full_scans(node):
+    # FORMAT=JSON plan; access_type ALL is a full table scan
+    if isinstance(node, dict):
+        if node.get('access_type') == 'ALL':
+            yield node.get('table_name', '?')
+        node = list(node.values())
+    if isinstance(node, list):
+        for child in node:
+            yield from _mysql_full_scans(child)
+
+
+def check_query_plans(using='default'):
+    """Returns [(name, plan, scanned tables)] for every hot query"""
+    connection = connections[using]
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        # the planner prefers a seq scan on small tables even when an index fits;
+        # with it discouraged, a seq scan only shows up when no index can serve the query
+        with connection.cursor() as cursor:
+            cursor.execute("SET enable_seqscan = off")
+    results = []
+    try:
+        for name, queryset in hot_queries():
+            plan = queryset.using(using).explain(**({'format': 'json'} if vendor == 'mysql' else {}))
+            results.append((name, plan, full_scans(plan, vendor)))
+    finally:
+        if vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("RESET enable_seqscan")
+    return results
@@ -0,0 +1,84 @@
+# routers.py
+import contextlib
+import contextvars
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+# True on code paths whose reads may be served by the replica (see replica_reads)
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+# True once the current request or thread has written, so it reads its own writes
+_pinned = contextvars.ContextVar('replica_pinned', default=False)
+# True once the current request has changed a survey definition
+_survey_edited = contextvars.ContextVar('survey_edited', default=False)
+
+SURVEY_MODELS = {'survey', 'questioncategory', 'question', 'questionoption', 'keychoice'}
+# Bookkeeping writes that don't change anything the replica paths read
+UNPINNED_MODELS = {'exportjob'}
+# After a failed connection the replica is skipped for this long
+REPLICA_RETRY_SECONDS = 30
+
+_replica_down_until = 0.0
+
+
+@contextlib.contextmanager
+def replica_reads():
+    """Let reads inside the block (or decorated function) go to the replica"""
+    # set/restore rather than reset(token): streamed responses may resume in another context
+    previous = _replica_reads.get()
+    _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.set(previous)
+
+
+def iterate_on_replica(iterable):
+    """Wrap a streamed response body so the reads it makes while streaming use the replica"""
+    with replica_reads():
+        yield from iterable
+
+
+def begin_request(pinned=False):
+    _replica_reads.set(False)
+    _pinned.set(pinned)
+    _survey_edited.set(False)
+
+
+def survey_edited():
+    return _survey_edited.get()
+
+
+def replica_alias():
+    """The replica alias if one is configured and reachable, else None (use the primary)"""
+    global _replica_down_until
+    alias = settings.REPLICA_DATABASE_ALIAS
+    if alias not in settings.DATABASES or time.monotonic() < _replica_down_until:
+        return None
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        _replica_down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+        return None
+    return alias
+
+
+class ReplicaRouter:
+    """Sends reads on replica_reads() paths to the replica; everything else uses the primary"""
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and not _pinned.get():
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == 'eeusurvey_app' and model._meta.model_name not in UNPINNED_MODELS:
+            _pinned.set(True)
+            if model._meta.model_name in SURVEY_MODELS:
+                _survey_edited.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        return True
@@ -0,0 +1,39 @@
+# schedule.py
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .dashboard import invalidate_dashboard
+from .models import Survey
+from .survey_cache import invalidate_surveys
+
+
+def in_window(today):
+    """Surveys whose start_time..end_time window covers today (end_time is exclusive, as in Survey.save)"""
+    return Q(start_time__lte=today, end_time__gt=today)
+
+
+def surveys_to_deactivate(today):
+    return Survey.objects.filter(is_active=True).exclude(in_window(today))
+
+
+def surveys_to_activate(today):
+    # one switched off by hand since it opened (or created closed) stays off
+    return Survey.objects.filter(in_window(today), is_active=False, deleted_at__isnull=True, closed_by_hand=False)
+
+
+def apply_schedule(today=None):
+    """Flip is_active for every survey that crossed its start or end date; returns (activated, deactivated).
+
+    One UPDATE per direction, so SurveyViewSet.list and submissions can trust
+    the indexed is_active flag instead of comparing dates.
+    """
+    if today is None:
+        today = timezone.now().date()
+    with transaction.atomic():
+        deactivated = surveys_to_deactivate(today).update(is_active=False)
+        activated = surveys_to_activate(today).update(is_active=True)
+    if activated or deactivated:
+        invalidate_dashboard()
+        invalidate_surveys()
+    return activated, deactivated
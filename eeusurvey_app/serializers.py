@@ -1,7 +1,12 @@
 # serializers.py
 from rest_framework import serializers
+from .metrics import SerializerTimingMixin
 from .models import KeyChoice, Survey, Question, QuestionOption, QuestionCategory,Answer,SurveyResponse
 
+
+class TimedListSerializer(SerializerTimingMixin, serializers.ListSerializer):
+    pass
+
 class QuestionOptionSerializer(serializers.ModelSerializer):
     class Meta:
         model = QuestionOption
@@ -36,13 +41,14 @@ class KeyChoiceSerializer(serializers.ModelSerializer):
         model = KeyChoice
         fields = ['key','description']
 
-class QuestionCategorySerializer(serializers.ModelSerializer):
+class QuestionCategorySerializer(SerializerTimingMixin, serializers.ModelSerializer):
     class Meta:
         model = QuestionCategory
         fields = ['id','cat_number', 'name']
+        list_serializer_class = TimedListSerializer
 
 
-class SurveySerializer(serializers.ModelSerializer):
+class SurveySerializer(SerializerTimingMixin, serializers.ModelSerializer):
     questions = QuestionSerializer(many=True, read_only=True)
     question_categories = QuestionCategorySerializer(many=True, source='categories', read_only=True)
     key_choice = KeyChoiceSerializer(many=True,source='keys', read_only=True)
@@ -54,6 +60,7 @@ class SurveySerializer(serializers.ModelSerializer):
     class Meta:
         model = Survey
         fields = ['id','metadata', 'questions','key_choice' ,'question_categories']
+        list_serializer_class = TimedListSerializer
     
     # def get_id(self,obj):
     #     return obj.id
@@ -68,6 +75,7 @@ class SurveySerializer(serializers.ModelSerializer):
             'end': obj.end_time.strftime('%Y-%m-%d'),
             'version': obj.version,
             'language': obj.language,
+            'storage_mode': obj.storage_mode,
         }
 
 class AnswerSerializer(serializers.ModelSerializer):
@@ -79,13 +87,14 @@ class AnswerSerializer(serializers.ModelSerializer):
                  'number_value', 'custom_text']
     
     def get_selected_option_ids(self, obj):
-        return [option.id for option in obj.selected_options.all()]
+        return obj.selected_option_ids
 
 
-class SurveyResponseSerializer(serializers.ModelSerializer):
+class SurveyResponseSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     answers = AnswerSerializer(many=True, read_only=True)
     
     class Meta:
         model = SurveyResponse
         fields = ['id', 'survey', 'submitted_at', 'answers', 'is_complete']
+        list_serializer_class = TimedListSerializer
 
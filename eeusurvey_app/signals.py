@@ -0,0 +1,40 @@
+# signals.py
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .dashboard import invalidate_dashboard
+from .models import KeyChoice, Question, QuestionCategory, QuestionOption, ResponseTombstone, Survey, SurveyResponse
+from .survey_cache import invalidate_surveys
+
+
+@receiver(post_delete, sender=SurveyResponse)
+def record_response_tombstone(sender, instance, **kwargs):
+    ResponseTombstone.objects.create(response_id=instance.id, survey_id=instance.survey_id)
+
+
+@receiver(post_save, sender=Survey)
+@receiver(post_delete, sender=Survey)
+def clear_dashboard_cache(sender, **kwargs):
+    invalidate_dashboard()
+
+
+@receiver(post_save, sender=SurveyResponse)
+def refresh_dashboard_counts(sender, **kwargs):
+    # a burst of submissions recomputes the dashboard at most once per DASHBOARD_MIN_AGE
+    invalidate_dashboard(min_age=settings.DASHBOARD_MIN_AGE)
+
+
+@receiver(post_save, sender=Survey)
+@receiver(post_delete, sender=Survey)
+@receiver(post_save, sender=QuestionCategory)
+@receiver(post_delete, sender=QuestionCategory)
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+@receiver(post_save, sender=QuestionOption)
+@receiver(post_delete, sender=QuestionOption)
+@receiver(post_save, sender=KeyChoice)
+@receiver(post_delete, sender=KeyChoice)
+@receiver(m2m_changed, sender=Question.options.through)
+def clear_survey_cache(sender, **kwargs):
+    invalidate_surveys()
@@ -0,0 +1,38 @@
+# survey_cache.py
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Every cached survey rendering is keyed under this generation; invalidating
+# replaces it, retiring them all at once (survey definitions change rarely)
+SURVEY_CACHE_GENERATION_KEY = 'eeusurvey:surveys:generation'
+
+
+async def _generation():
+    generation = await cache.aget(SURVEY_CACHE_GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(SURVEY_CACHE_GENERATION_KEY, uuid.uuid4().hex, None)
+        generation = await cache.aget(SURVEY_CACHE_GENERATION_KEY)
+    return generation
+
+
+async def cached_survey_json(key, build):
+    """The cached rendering for `key`, or the result of `await build()` kept for SURVEY_CACHE_TTL.
+
+    A build returning None (nothing to render) is not cached.
+    """
+    cache_key = f"eeusurvey:surveys:{await _generation()}:{key}"
+    content = await cache.aget(cache_key)
+    if content is None:
+        content = await build()
+        if content is not None:
+            await cache.aset(cache_key, content, settings.SURVEY_CACHE_TTL)
+    return content
+
+
+def invalidate_surveys():
+    """Retire every cached survey rendering once the current transaction commits"""
+    # after the commit, or a reader could cache the old rows under the new generation
+    transaction.on_commit(lambda: cache.set(SURVEY_CACHE_GENERATION_KEY, uuid.uuid4().hex, None))
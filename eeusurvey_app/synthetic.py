@@ -0,0 +1,215 @@
+# synthetic.py
+import random
+from datetime import datetime, time as dt_time, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .ids import uuid7
+from .imports import insert_rows
+from .models import (
+    Answer, KeyChoice, Question, QuestionCategory, QuestionOption, Survey, SurveyResponse, encode_option_ids,
+)
+
+GENERATE_BATCH_SIZE = 1000
+CHOICE_TYPES = ['single_choice', 'drop_down', 'multi_select']
+# Share of optional questions a respondent leaves blank
+SKIP_RATE = 0.1
+
+# Wording per language; scales are shared by every question of a kind, as in the real surveys
+TEXT = {
+    'en': {
+        'category': 'Section', 'question': 'Question', 'title': 'Customer satisfaction survey',
+        'satisfaction': ['Very dissatisfied', 'Dissatisfied', 'Neutral', 'Satisfied', 'Very satisfied'],
+        'channels': ['Office visit', 'Phone', 'SMS', 'Mobile app', 'Website', 'Agent'],
+        'other': 'Other',
+        'comments': ['Power cuts are too frequent', 'Staff were helpful', 'Billing is confusing',
+                     'Service has improved', 'Waited too long at the office', ''],
+    },
+    'am': {
+        'category': 'ክፍል', 'question': 'ጥያቄ', 'title': 'የደንበኞች እርካታ ጥናት',
+        'satisfaction': ['በጣም አልረካሁም', 'አልረካሁም', 'መካከለኛ', 'ረክቻለሁ', 'በጣም ረክቻለሁ'],
+        'channels': ['ቢሮ በመሄድ', 'በስልክ', 'በአጭር መልዕክት', 'በሞባይል መተግበሪያ', 'በድረ-ገጽ', 'በወኪል'],
+        'other': 'ሌላ',
+        'comments': ['የመብራት መቆራረጥ በዝቷል', 'ሰራተኞቹ ተባባሪ ነበሩ', 'ክፍያው ግልጽ አይደለም',
+                     'አገልግሎቱ ተሻሽሏል', 'ቢሮ ውስጥ ብዙ ጠበቅሁ', ''],
+    },
+    'om': {
+        'category': 'Kutaa', 'question': 'Gaaffii', 'title': 'Qorannoo quufinsa maamiltootaa',
+        'satisfaction': ["Baay'ee hin quufne", 'Hin quufne', 'Giddu-galeessa', 'Quufeera', "Baay'ee quufeera"],
+        'channels': ["Waajjira dhaquun", 'Bilbilaan', 'Ergaa gabaabaan', 'Appii moobaayilaa', 'Marsariitii', 'Bakka bu\'aa'],
+        'other': 'Kan biraa',
+        'comments': ['Ibsi yeroo baay\'ee ni cita', 'Hojjettoonni gargaaran', 'Kaffaltiin ifa miti',
+                     'Tajaajilli fooyya\'eera', 'Waajjiratti yeroo dheeraa eeggadhe', ''],
+    },
+}
+
+
+def skewed_weights(count, rng):
+    """Zipf-like weights over a random ranking, so each question has its own favourite answers"""
+    exponent = rng.uniform(0.8, 2.0)
+    weights = [1 / (rank ** exponent) for rank in range(1, count + 1)]
+    rng.shuffle(weights)
+    return weights
+
+
+def create_survey(language='en', categories=4, questions_per_category=6, rng=None, title=None):
+    """A survey with every question type, shared option scales and key choices"""
+    rng = rng or random.Random()
+    text = TEXT[language]
+    today = timezone.now().date()
+    with transaction.atomic():
+        survey = Survey.objects.create(
+            title=title or f"{text['title']} {rng.randint(1000, 9999)}",
+            instructions='', version='1.0', language=language,
+            start_time=today - timedelta(days=30), end_time=today + timedelta(days=30),
+        )
+        KeyChoice.objects.bulk_create([
+            KeyChoice(survey=survey, key=str(number), description=description)
+            for number, description in enumerate(text['satisfaction'], 1)
+        ])
+        satisfaction = [
+            QuestionOption.objects.create(survey=survey, value=str(number), label=label)
+            for number, label in enumerate(text['satisfaction'], 1)
+        ]
+        channels = [QuestionOption.objects.create(survey=survey, label=label) for label in text['channels']]
+        channels.append(QuestionOption.objects.create(survey=survey, label=text['other'], is_other=True))
+
+        types = [question_type for question_type, _ in Question.QUESTION_TYPES]
+        number = 0
+        for category_number in range(1, categories + 1):
+            category = QuestionCategory.objects.create(
+                survey=survey, name=f"{text['category']} {category_number}",
+            )
+            for _ in range(questions_per_category):
+                question_type = types[number % len(types)]
+                number += 1
+                question = Question.objects.create(
+                    survey=survey, category=category, question_type=question_type,
+                    question_text=f"{text['question']} {number}", required=rng.random() < 0.7,
+                    scale='1-5' if question_type == 'rating' else None,
+                )
+                if question_type == 'multi_select':
+                    question.options.add(*channels)
+                elif question_type in CHOICE_TYPES:
+                    question.options.add(*satisfaction)
+    return survey
+
+
+class ResponseGenerator:
+    """Realistic answers for a survey: skewed choices and ratings, sparse free text"""
+
+    def __init__(self, survey, rng=None):
+        self.survey = survey
+        self.rng = rng or random.Random()
+        self.text = TEXT.get(survey.language, TEXT['en'])
+        self.questions = list(survey.questions.prefetch_related('options').order_by('id')) # type: ignore
+        self.options = {}
+        self.weights = {}
+        for question in self.questions:
+            if question.question_type in CHOICE_TYPES:
+                self.options[question.id] = [option for option in question.options.all()]
+                self.weights[question.id] = skewed_weights(len(self.options[question.id]), self.rng)
+            elif question.question_type == 'rating':
+                self.options[question.id] = [1, 2, 3, 4, 5]
+                self.weights[question.id] = skewed_weights(5, self.rng)
+
+    def pick(self, question):
+        return self.rng.choices(self.options[question.id], self.weights[question.id])[0]
+
+    def answer(self, question, respondent):
+        """Answer values as a dict of Answer fields, or None for a skipped question"""
+        if not question.required and self.rng.random() < SKIP_RATE:
+            return None
+        question_type = question.question_type
+        if question_type == 'multi_select':
+            count = min(len(self.options[question.id]), self.rng.choices([1, 2, 3], [6, 3, 1])[0])
+            chosen = {self.pick(question) for _ in range(count)}
+            other = next((option for option in chosen if option.is_other), None)
+            return {
+                'option_ids': [option.id for option in chosen],
+                'custom_text': self.rng.choice(self.text['comments']) or None if other else None,
+            }
+        if question_type in CHOICE_TYPES:
+            return {'option_ids': [self.pick(question).id]}
+        if question_type == 'rating':
+            return {'rating_value': self.pick(question)}
+        if question_type == 'number':
+            return {'number_value': round(self.rng.lognormvariate(3, 1), 2)}
+        if question_type == 'email':
+            return {'text_value': f"respondent{respondent}@example.com"}
+        comment = self.rng.choice(self.text['comments'])
+        return {'text_value': comment} if comment else None
+
+    def submission(self, respondent=0):
+        """A payload for the submit endpoint"""
+        responses = []
+        for question in self.questions:
+            answer = self.answer(question, respondent)
+            if answer is None:
+                continue
+            option_ids = answer.pop('option_ids', None)
+            if option_ids is not None:
+                if question.question_type == 'multi_select':
+                    answer['selected_option_ids'] = option_ids
+                else:
+                    answer['selected_option_id'] = option_ids[0]
+            custom_text = answer.pop('custom_text', None)
+            if custom_text:
+                answer['is_other'] = True
+                answer['text_value'] = custom_text
+            responses.append({'question_id': question.id, 'answer': answer})
+        return {
+            'survey_id': str(self.survey.id),
+            'responses': responses,
+            'respondent_info': {'session_id': f"synthetic-{respondent}", 'user_agent': 'synthetic'},
+        }
+
+    def submitted_at(self):
+        """A time in the survey's window so far, busier in the afternoon"""
+        start = datetime.combine(self.survey.start_time, dt_time(), tzinfo=timezone.get_current_timezone())
+        end = min(timezone.now(), start + timedelta(days=(self.survey.end_time - self.survey.start_time).days))
+        moment = start + (end - start) * self.rng.random()
+        return min(end, moment.replace(hour=min(23, max(6, int(self.rng.gauss(14, 3))))))
+
+    def insert(self, count, batch_size=GENERATE_BATCH_SIZE, progress=None):
+        """Bulk-insert `count` responses with their answers; returns how many were inserted"""
+        inserted = 0
+        while inserted < count:
+            responses, answers = [], []
+            now = timezone.now()
+            for respondent in range(inserted, min(count, inserted + batch_size)):
+                response_id, submitted_at = uuid7(), self.submitted_at()
+                responses.append([
+                    response_id, self.survey.id, submitted_at, now, f"synthetic-{respondent}", True, True,
+                ])
+                for question in self.questions:
+                    answer = self.answer(question, respondent)
+                    if answer is None:
+                        continue
+                    option_ids = answer.get('option_ids') or []
+                    multiple = question.question_type == 'multi_select'
+                    answers.append([
+                        response_id, question.id,
+                        option_ids[0] if option_ids and not multiple else None,
+                        encode_option_ids(option_ids) if multiple else None,
+                        answer.get('text_value'), answer.get('rating_value'), answer.get('number_value'),
+                        answer.get('custom_text'), submitted_at,
+                    ])
+            with transaction.atomic():
+                insert_rows(
+                    SurveyResponse,
+                    ['id', 'survey', 'submitted_at', 'created_at', 'session_id', 'is_complete',
+                     'answers_materialized'],
+                    responses,
+                )
+                insert_rows(
+                    Answer,
+                    ['response', 'question', 'selected_option', 'option_ids', 'text_value',
+                     'rating_value', 'number_value', 'custom_text', 'created_at'],
+                    answers,
+                )
+            inserted += len(responses)
+            if progress:
+                progress(inserted)
+        return inserted
@@ -1,3 +1,1132 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import types
+import warnings
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, resolve, reverse
+from django.utils import timezone
+
+from . import routers, urls as api_urls
+from .analysis import question_chart_data
+from .archives import ArchiveError, archivable_surveys, archive_survey, claim_restore, restore_survey, run_restore
+from .categories import reorder_categories
+from .dashboard import dashboard_stats
+from .documents import materialize_pending, materialize_survey
+from .export_jobs import create_export_job, run_export_job
+from .exports import (
+    Echo, build_sqlite_snapshot, cell_value, csv_rows, encode_cursor, export_questions, iter_responses,
+    option_lookup, responses_since, stream_csv, stream_csv_gzip, stream_jsonl,
+)
+from .ids import uuid7, uuid7_time
+from .imports import ResponseImporter
+from .metrics import MetricsRegistry, RequestMetrics
+from .middleware import REPLICA_PIN_COOKIE
+from .models import (
+    Answer, ExportJob, Question, QuestionCategory, QuestionOption, Survey, SurveyArchive, SurveyResponse,
+    SurveyDeletion, decode_option_ids, encode_option_ids,
+)
+from .pg_copy import copy_out, copy_rows_in, copy_supported
+from .profiling import profiling_requested
+from .purge import request_survey_deletion, run_survey_deletion
+from .query_plans import check_query_plans
+from .schedule import apply_schedule
+from .synthetic import ResponseGenerator, create_survey
+
+
+def api_urlconf(async_api):
+    """The project's /api/ routes as settings.ASYNC_API would build them"""
+    urlconf = types.ModuleType(f"api_urls_{'async' if async_api else 'sync'}")
+    urlconf.urlpatterns = [ # type: ignore
+        path('api/', include((api_urls.async_urlpatterns if async_api else []) + api_urls.api_urlpatterns)),
+    ]
+    return urlconf
+
+
+def basic_auth(username, password):
+    return 'Basic ' + base64.b64encode(f"{username}:{password}".encode()).decode()
+
+
+class AsyncRoutingTests(TestCase):
+    """Writes behave the same whether the async views are routed or not"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        cls.survey = create_survey('en', categories=2, questions_per_category=6, rng=random.Random(1))
+
+    def both_routings(self):
+        for async_api in (False, True):
+            with self.subTest(async_api=async_api), override_settings(ROOT_URLCONF=api_urlconf(async_api)):
+                yield async_api
+
+    def test_basic_auth_writes_need_no_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        for _ in self.both_routings():
+            response = client.post(
+                '/api/surveys/', {'metadata': {'title': 'Posted', 'language': 'en'}},
+                content_type='application/json', HTTP_AUTHORIZATION=basic_auth('admin', 'pw'),
+            )
+            self.assertEqual(response.status_code, 201, response.content)
+            survey_id = response.json()['id']
+            response = client.patch(
+                f'/api/surveys/{survey_id}/', {}, content_type='application/json',
+                HTTP_AUTHORIZATION=basic_auth('admin', 'pw'),
+            )
+            self.assertEqual(response.status_code, 200, response.content)
+
+    def test_session_writes_still_need_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.admin)
+        for _ in self.both_routings():
+            response = client.post(
+                '/api/surveys/', {'metadata': {'title': 'Posted', 'language': 'en'}}, content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 403)
+            self.assertIn(b'CSRF', response.content)
+
+    def test_submissions_parse_the_same_bodies(self):
+        generator = ResponseGenerator(self.survey, random.Random(2))
+        client = Client()
+        for async_api in self.both_routings():
+            response = client.post('/api/responses/submit/', generator.submission(), content_type='application/json')
+            self.assertEqual(response.status_code, 201, response.content)
+            survey_response = self.survey.responses.get(id=response.json()['response_id']) # type: ignore
+            self.assertTrue(survey_response.answers.exists())
+
+            response = client.post('/api/responses/submit/', {'survey_id': str(self.survey.id)})
+            self.assertEqual(response.status_code, 201, response.content)
+
+            for body in ('{"survey_id": ', '[1, 2]'):
+                response = client.post('/api/responses/submit/', body, content_type='application/json')
+                self.assertEqual(response.status_code, 400, (async_api, body))
+                self.assertIn('error', response.json())
+        self.assertEqual(Survey.objects.get(pk=self.survey.pk).responses.count(), 4) # type: ignore
+
+
+@mock.patch('eeusurvey_app.exports.INCREMENTAL_EXPORT_LAG', timedelta(0))
+class IncrementalExportTests(TestCase):
+    """responses_since pages through everything written after a cursor"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.survey = create_survey('en', categories=2, questions_per_category=6, rng=random.Random(1))
+        cls.generator = ResponseGenerator(cls.survey, random.Random(2))
+
+    def drain(self, cursor=None, limit=1000):
+        """Every page from `cursor`: (responses, deleted ids, final cursor)"""
+        responses, deleted = [], []
+        while True:
+            page, page_deleted, next_cursor = responses_since(self.survey, cursor, limit=limit)
+            responses += page
+            deleted += page_deleted
+            if next_cursor == cursor:
+                return responses, deleted, cursor
+            cursor = next_cursor
+
+    def test_equal_timestamps_split_across_pages(self):
+        self.generator.insert(7)  # one batch: every row shares created_at
+        self.assertEqual(self.survey.responses.values('created_at').distinct().count(), 1) # type: ignore
+
+        pages, cursor = [], None
+        while True:
+            page, _, next_cursor = responses_since(self.survey, cursor, limit=3)
+            if next_cursor == cursor:
+                break
+            pages.append([r.id for r in page])
+            cursor = next_cursor
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        exported = [response_id for page in pages for response_id in page]
+        self.assertEqual(exported, sorted(self.survey.responses.values_list('id', flat=True))) # type: ignore
+
+    def test_deletes_between_pages_are_reported(self):
+        self.generator.insert(6)
+        page, deleted, cursor = responses_since(self.survey, limit=3)
+        self.assertEqual(deleted, [])
+        seen = {r.id for r in page}
+        exported_and_deleted = page[0].id
+        unexported_and_deleted = self.survey.responses.exclude(id__in=seen).order_by('id').first().id # type: ignore
+        SurveyResponse.objects.get(id=exported_and_deleted).delete()
+        SurveyResponse.objects.get(id=unexported_and_deleted).delete()
+
+        rest, deleted, _ = self.drain(cursor, limit=3)
+        self.assertEqual(len(rest), 2)
+        self.assertNotIn(unexported_and_deleted, {r.id for r in rest})
+        self.assertEqual(sorted(deleted), sorted([str(exported_and_deleted), str(unexported_and_deleted)]))
+        self.assertEqual(
+            (seen | {r.id for r in rest}) - {exported_and_deleted},
+            set(self.survey.responses.values_list('id', flat=True)), # type: ignore
+        )
+
+    def test_half_a_cursor_is_rejected(self):
+        self.generator.insert(2)
+        client = Client()
+        client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        url = reverse('survey-responses-export', args=[self.survey.id])
+        for cursor in (encode_cursor(timezone.now(), None, 0), encode_cursor(None, uuid7(), 0), 'not a cursor'):
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(ValueError):
+                    responses_since(self.survey, cursor)
+                response = client.get(url, {'since': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('Invalid cursor', response.json()['error'])
+        self.assertEqual(client.get(url, {'since': encode_cursor(None, None, 0)}).status_code, 200)
+
+    def test_imported_responses_follow_the_cursor(self):
+        self.generator.insert(3)
+        exported, _, cursor = self.drain()
+        self.assertEqual(len(exported), 3)
+
+        question = self.survey.questions.filter(question_type='number').first() # type: ignore
+        upload = SimpleUploadedFile(
+            'paper.csv', f"Submitted At,Q{question.id}: {question.question_text}\r\n2019-03-01 09:30:00,7\r\n".encode(),
+        )
+        report = ResponseImporter(self.survey).run(upload)
+        self.assertEqual(report['imported'], 1, report['errors'])
+
+        exported, _, _ = self.drain(cursor)
+        self.assertEqual(len(exported), 1)
+        self.assertEqual(exported[0].session_id, 'import')
+        self.assertEqual(exported[0].submitted_at.year, 2019)
+        self.assertGreater(exported[0].created_at, timezone.now() - timedelta(minutes=1))
+
+    def test_cursor_taken_between_import_chunks_sees_later_chunks(self):
+        question = self.survey.questions.filter(question_type='number').first() # type: ignore
+        ids = sorted(uuid7() for _ in range(4))[::-1]  # later chunks sort below earlier ones by id
+        rows = ''.join(f"{response_id},{index}\r\n" for index, response_id in enumerate(ids))
+        upload = SimpleUploadedFile('paper.csv', f"Response ID,Q{question.id}: x\r\n{rows}".encode())
+
+        cursors = []
+        def export_between_chunks(done, total):
+            if done < total:
+                cursors.append(self.drain()[2])
+        report = ResponseImporter(self.survey, progress=export_between_chunks, chunk_size=2).run(upload)
+        self.assertEqual(report['imported'], 4, report['errors'])
+
+        exported, _, _ = self.drain(cursors[0])
+        self.assertEqual([r.id for r in exported], ids[2:][::-1])
+
+
+class QueryPlanTests(TestCase):
+    """The hot queries stay on their indexes (see the check_query_plans command)"""
+
+    def test_hot_queries_use_an_index(self):
+        for name, plan, scans in check_query_plans():
+            with self.subTest(name):
+                self.assertEqual(scans, [], plan)
+
+
+def answer_matrix_csv(survey):
+    """The CSV export as it was written before PivotQueryBuilder: row by row from Answer objects"""
+    writer = csv.writer(Echo())
+    questions = export_questions(survey)
+    options = option_lookup(survey)
+    lines = [writer.writerow(['Response ID', 'Submitted At'] + [f"Q{q.id}: {q.question_text[:50]}" for q in questions])]
+    for survey_response in iter_responses(survey):
+        answers = {a.question_id: a for a in survey_response.answers.all()}
+        row = [str(survey_response.id), survey_response.submitted_at.strftime('%Y-%m-%d %H:%M:%S')]
+        for question in questions:
+            row.append(cell_value(question, answers.get(question.id), options))
+        lines.append(writer.writerow(row))
+    return ''.join(lines)
+
+
+class CsvExportTests(TestCase):
+
+    def test_pivot_matches_the_answer_writer(self):
+        survey = create_survey('en', categories=3, questions_per_category=6, rng=random.Random(3))
+        ResponseGenerator(survey, random.Random(4)).insert(150)
+        multi_select = survey.questions.filter(question_type='multi_select') # type: ignore
+        answers = [a for a in Answer.objects.filter(question__in=multi_select)]
+        self.assertTrue(any(len(a.selected_option_ids) > 1 for a in answers))
+        self.assertTrue(any(a.custom_text for a in answers))
+
+        writer = csv.writer(Echo())
+        pivoted = ''.join(writer.writerow(row) for row in csv_rows(survey))
+        self.assertEqual(pivoted.encode(), answer_matrix_csv(survey).encode())
+
+
+class Uuid7Tests(SimpleTestCase):
+
+    def test_ids_increase_within_a_millisecond(self):
+        ids = [uuid7() for _ in range(10000)]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertTrue(all(value.version == 7 for value in ids))
+
+    def test_ids_increase_when_the_clock_steps_back(self):
+        now = time.time_ns() + 60_000_000_000  # ahead of any id generated so far
+        clock = [now, now, now - 5_000_000_000, now - 5_000_000_000] + [now] * 5000
+        with mock.patch('eeusurvey_app.ids.time.time_ns', side_effect=clock):
+            ids = [uuid7() for _ in clock]
+        self.assertEqual(ids, sorted(set(ids)))
+        # counter overflow carries into the timestamp rather than wrapping
+        self.assertGreater(uuid7_time(ids[-1]), now // 1_000_000)
+
+
+class CategoryOrderTests(TestCase):
+
+    def setUp(self):
+        self.survey = create_survey('en', categories=0, rng=random.Random(5))
+        self.categories = [
+            QuestionCategory.objects.create(survey=self.survey, name=name) for name in ('A', 'B', 'C', 'D')
+        ]
+
+    def order(self, survey=None):
+        return list(
+            QuestionCategory.objects.filter(survey=survey or self.survey)
+            .order_by('cat_number').values_list('name', 'cat_number')
+        )
+
+    def test_numbers_are_assigned_in_creation_order(self):
+        self.assertEqual(self.order(), [('A', 1), ('B', 2), ('C', 3), ('D', 4)])
+
+    def test_save_moves_a_category_up(self):
+        category = QuestionCategory.objects.get(pk=self.categories[3].pk)
+        category.cat_number = 2
+        category.save()
+        self.assertEqual(self.order(), [('A', 1), ('D', 2), ('B', 3), ('C', 4)])
+
+    def test_save_moves_a_category_down(self):
+        category = QuestionCategory.objects.get(pk=self.categories[0].pk)
+        category.cat_number = 3
+        category.save()
+        self.assertEqual(self.order(), [('B', 1), ('C', 2), ('A', 3), ('D', 4)])
+
+    def test_rename_leaves_siblings_alone(self):
+        category = QuestionCategory.objects.get(pk=self.categories[1].pk)
+        category.name = 'B2'
+        with CaptureQueriesContext(connection) as queries:
+            category.save()
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1, updates)
+        self.assertEqual(self.order(), [('A', 1), ('B2', 2), ('C', 3), ('D', 4)])
+
+    def test_reorder_swaps_two_categories(self):
+        a, b, c, d = (category.id for category in self.categories)
+        self.assertEqual(reorder_categories(self.survey, [a, c, b, d]), [a, c, b, d])
+        self.assertEqual(self.order(), [('A', 1), ('C', 2), ('B', 3), ('D', 4)])
+
+    def test_reorder_appends_unlisted_categories(self):
+        a, b, c, d = (category.id for category in self.categories)
+        reorder_categories(self.survey, [d, b])
+        self.assertEqual(self.order(), [('D', 1), ('B', 2), ('A', 3), ('C', 4)])
+        with self.assertRaises(ValueError):
+            reorder_categories(self.survey, [a, 0])
+
+    def test_reorder_takes_the_same_queries_at_any_size(self):
+        large = create_survey('en', categories=40, questions_per_category=1, rng=random.Random(6))
+        counts = []
+        for survey in (self.survey, large):
+            ids = list(survey.categories.order_by('cat_number').values_list('id', flat=True)) # type: ignore
+            with CaptureQueriesContext(connection) as queries:
+                reorder_categories(survey, ids[::-1])
+            counts.append(len(queries))
+            self.assertEqual([number for _, number in self.order(survey)], list(range(1, len(ids) + 1)))
+        self.assertEqual(counts[0], counts[1])
+        self.assertLessEqual(counts[1], 5)
+
+
+class SyntheticDataTests(TestCase):
+
+    def test_generate_survey_data(self):
+        out = io.StringIO()
+        call_command(
+            'generate_survey_data', languages='en,am', surveys=2, responses=25, categories=2,
+            questions_per_category=5, batch_size=10, seed=1, stdout=out,
+        )
+        surveys = Survey.objects.all()
+        self.assertEqual(sorted(surveys.values_list('language', flat=True)), ['am', 'am', 'en', 'en'])
+        self.assertEqual(out.getvalue().count('25 responses'), 4)
+        for survey in surveys:
+            self.assertEqual(survey.categories.count(), 2) # type: ignore
+            self.assertEqual(survey.questions.count(), 10) # type: ignore
+            self.assertEqual(survey.responses.count(), 25) # type: ignore
+            self.assertFalse(survey.responses.filter(answers__isnull=True).exists()) # type: ignore
+
+        answers = Answer.objects.filter(response__survey__in=surveys)
+        self.assertGreater(answers.count(), 4 * 25)
+        self.assertLessEqual(answers.count(), 4 * 25 * 10)
+        self.assertEqual(
+            set(Question.objects.filter(survey__in=surveys).values_list('question_type', flat=True)),
+            {question_type for question_type, _ in Question.QUESTION_TYPES},
+        )
+        option_ids = set(QuestionOption.objects.filter(survey__in=surveys).values_list('id', flat=True))
+        for answer in answers.filter(question__question_type='multi_select'):
+            self.assertTrue(set(answer.selected_option_ids) <= option_ids)
+
+    def test_generate_rejects_unknown_languages(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_survey_data', languages='en,xx', responses=1, stdout=io.StringIO())
+        self.assertFalse(Survey.objects.exists())
+
+    def test_insert_counts_across_batches(self):
+        survey = create_survey('om', categories=1, questions_per_category=6, rng=random.Random(7))
+        progress = []
+        inserted = ResponseGenerator(survey, random.Random(8)).insert(23, batch_size=10, progress=progress.append)
+        self.assertEqual(inserted, 23)
+        self.assertEqual(progress, [10, 20, 23])
+        self.assertEqual(survey.responses.count(), 23) # type: ignore
+        self.assertEqual(survey.responses.filter(answers_materialized=True).count(), 23) # type: ignore
+
+
+class ScheduleTests(TestCase):
+
+    def setUp(self):
+        self.today = timezone.now().date()
+
+    def survey(self, start, **fields):
+        return Survey.objects.create(
+            title='Scheduled', instructions='', version='1.0', language='en',
+            start_time=self.today + timedelta(days=start), end_time=self.today + timedelta(days=10), **fields,
+        )
+
+    def reach_start(self, survey):
+        """Move the start date to today the way the calendar would, without a save"""
+        Survey.objects.filter(pk=survey.pk).update(start_time=self.today)
+        return Survey.objects.get(pk=survey.pk)
+
+    def test_opens_on_its_start_date(self):
+        survey = self.survey(start=1)
+        self.assertFalse(survey.is_active)
+        self.reach_start(survey)
+        self.assertEqual(apply_schedule(self.today), (1, 0))
+        self.assertTrue(Survey.objects.get(pk=survey.pk).is_active)
+
+    def test_opens_after_an_edit_on_its_start_date(self):
+        survey = self.reach_start(self.survey(start=1))
+        survey.title = 'Scheduled (fixed typo)'
+        survey.save()
+        self.assertEqual(apply_schedule(self.today), (1, 0))
+        self.assertTrue(Survey.objects.get(pk=survey.pk).is_active)
+
+    def test_closed_by_hand_stays_closed(self):
+        survey = self.survey(start=0)
+        self.assertTrue(survey.is_active)
+        survey = Survey.objects.get(pk=survey.pk)
+        survey.is_active = False
+        survey.save()
+        survey.title = 'Still closed'
+        survey.save()
+        self.assertEqual(apply_schedule(self.today), (0, 0))
+        self.assertFalse(Survey.objects.get(pk=survey.pk).is_active)
+
+    def test_created_closed_inside_its_window_stays_closed(self):
+        self.survey(start=-1, is_active=False)
+        self.assertEqual(apply_schedule(self.today), (0, 0))
+
+    def test_rescheduling_a_closed_survey_opens_it_again(self):
+        survey = self.survey(start=0)
+        survey.is_active = False
+        survey.save()
+        survey.start_time = self.today + timedelta(days=2)
+        survey.save()
+        self.reach_start(survey)
+        self.assertEqual(apply_schedule(self.today), (1, 0))
+
+    def test_closes_after_its_end_date(self):
+        survey = self.survey(start=-5)
+        Survey.objects.filter(pk=survey.pk).update(end_time=self.today)
+        self.assertEqual(apply_schedule(self.today), (0, 1))
+        self.assertFalse(Survey.objects.get(pk=survey.pk).is_active)
+
+
+class ProfilingRequestTests(SimpleTestCase):
+
+    def test_only_the_exact_parameter_or_header_asks_for_a_profile(self):
+        factory = RequestFactory()
+        for path, expected in [
+            ('/api/surveys/?_profile=1', True),
+            ('/api/surveys/?lang=en&_profile=1', True),
+            ('/api/surveys/', False),
+            ('/api/surveys/?x_profile=1', False),
+            ('/api/surveys/?_profile=10', False),
+            ('/api/surveys/?_profile=0', False),
+            ('/api/surveys/?q=_profile=1', False),
+        ]:
+            with self.subTest(path):
+                self.assertIs(profiling_requested(factory.get(path)), expected)
+        self.assertTrue(profiling_requested(factory.get('/api/surveys/', HTTP_X_PROFILE='1')))
+        self.assertFalse(profiling_requested(factory.get('/api/surveys/', HTTP_X_PROFILE='yes')))
+
+
+class DashboardCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.survey = create_survey('en', categories=1, questions_per_category=2, rng=random.Random(9))
+
+    def submit(self):
+        SurveyResponse.objects.create(survey=self.survey, session_id='dashboard')
+
+    @override_settings(DASHBOARD_MIN_AGE=60)
+    def test_submissions_keep_fresh_numbers(self):
+        self.assertEqual(dashboard_stats()['total_responses'], 0)
+        self.submit()
+        self.submit()
+        with self.assertNumQueries(0):
+            self.assertEqual(dashboard_stats()['total_responses'], 0)
+
+    @override_settings(DASHBOARD_MIN_AGE=60)
+    def test_submissions_clear_older_numbers(self):
+        dashboard_stats()
+        with mock.patch('eeusurvey_app.dashboard.time.time', return_value=time.time() + 61):
+            self.submit()
+        self.assertEqual(dashboard_stats()['total_responses'], 1)
+
+    @override_settings(DASHBOARD_MIN_AGE=60)
+    def test_survey_changes_clear_at_once(self):
+        self.assertEqual(dashboard_stats()['total_surveys'], 1)
+        create_survey('en', categories=1, questions_per_category=2, rng=random.Random(10))
+        self.assertEqual(dashboard_stats()['total_surveys'], 2)
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(ARCHIVE_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.survey = create_survey('en', categories=1, questions_per_category=8, rng=random.Random(11))
+        ResponseGenerator(self.survey, random.Random(12)).insert(20)
+        Survey.objects.filter(pk=self.survey.pk).update(end_time=timezone.now().date() - timedelta(days=1))
+
+    def archive(self):
+        archive = archive_survey(self.survey)
+        self.assertEqual((archive.status, self.survey.responses.count()), ('archived', 0)) # type: ignore
+        return archive
+
+    def test_restore_brings_responses_back_and_keeps_them_live(self):
+        answers = Answer.objects.filter(response__survey=self.survey).count()
+        self.archive()
+        self.assertEqual(restore_survey(self.survey), 20)
+        self.assertEqual(self.survey.responses.count(), 20) # type: ignore
+        self.assertEqual(Answer.objects.filter(response__survey=self.survey).count(), answers)
+        self.assertFalse(SurveyArchive.objects.filter(survey=self.survey).exists())
+        self.assertIsNotNone(Survey.objects.get(pk=self.survey.pk).restored_at)
+
+        self.assertFalse(archivable_surveys(0).filter(pk=self.survey.pk).exists())
+        self.assertTrue(archivable_surveys(0, include_restored=True).filter(pk=self.survey.pk).exists())
+        call_command('archive_surveys', days=0, stdout=io.StringIO())
+        self.assertEqual(self.survey.responses.count(), 20) # type: ignore
+
+    def test_a_restore_is_claimed_once(self):
+        self.archive()
+        claim_restore(self.survey)
+        with self.assertRaises(ArchiveError):
+            claim_restore(self.survey)
+        with self.assertRaises(CommandError):
+            call_command('archive_surveys', restore=str(self.survey.id), stdout=io.StringIO())
+
+    def test_archive_runs_leave_a_restore_alone(self):
+        archive = self.archive()
+        claim_restore(self.survey)
+        # half-way through the restore
+        restored = SurveyResponse.objects.create(survey=self.survey, session_id='restored')
+        call_command('archive_surveys', stdout=io.StringIO())
+        self.assertTrue(SurveyResponse.objects.filter(pk=restored.pk).exists())
+        self.assertEqual(SurveyArchive.objects.get(pk=archive.pk).status, 'restoring')
+
+    def test_archive_runs_finish_an_interrupted_purge(self):
+        with mock.patch('eeusurvey_app.archives.finish_archive'):
+            archive = archive_survey(self.survey)  # "crashes" before purging
+        self.assertEqual((archive.status, self.survey.responses.count()), ('archiving', 20)) # type: ignore
+        with self.assertRaises(ArchiveError):
+            claim_restore(self.survey)
+
+        call_command('archive_surveys', stdout=io.StringIO())
+        self.assertEqual(SurveyArchive.objects.get(pk=archive.pk).status, 'archived')
+        self.assertEqual(self.survey.responses.count(), 0) # type: ignore
+
+    def test_failed_restore_is_recorded_and_can_be_retried(self):
+        archive = self.archive()
+        with open(archive.file_path, 'ab') as f:
+            f.write(b'tampered')
+        with self.assertRaises(ArchiveError):
+            run_restore(claim_restore(self.survey))
+        archive = SurveyArchive.objects.get(pk=archive.pk)
+        self.assertEqual(archive.status, 'failed')
+        self.assertIn('checksum', archive.error)
+        self.assertEqual(self.survey.responses.count(), 0) # type: ignore
+        # failed restores may be claimed again
+        self.assertEqual(claim_restore(self.survey).status, 'restoring')
+
+
+class ExportJobTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(EXPORT_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.survey = create_survey('en', categories=1, questions_per_category=4, rng=random.Random(13))
+        ResponseGenerator(self.survey, random.Random(14)).insert(10)
+
+    def test_a_job_runs_once(self):
+        job = create_export_job(self.survey, 'jsonl')
+        finished = run_export_job(ExportJob.objects.get(pk=job.pk))
+        self.assertEqual((finished.status, finished.processed_responses), ('finished', 10))
+        with open(finished.file_path, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 10)
+        self.assertIsNone(run_export_job(ExportJob.objects.get(pk=job.pk)))
+
+    def test_a_claimed_job_is_left_to_its_worker(self):
+        job = create_export_job(self.survey, 'csv')
+        stale_copy = ExportJob.objects.get(pk=job.pk)
+        run_export_job(job)
+        self.assertIsNone(run_export_job(stale_copy))
+        out = io.StringIO()
+        call_command('run_export_jobs', stdout=out)
+        self.assertNotIn(str(job.id), out.getvalue())
+
+    def test_command_requeues_jobs_left_running(self):
+        job = create_export_job(self.survey, 'csv')
+        ExportJob.objects.filter(pk=job.pk).update(status='running', updated_at=timezone.now() - timedelta(hours=1))
+        fresh = create_export_job(self.survey, 'csv')
+        ExportJob.objects.filter(pk=fresh.pk).update(status='running')
+
+        call_command('run_export_jobs', stdout=io.StringIO())
+        self.assertEqual(ExportJob.objects.get(pk=job.pk).status, 'finished')
+        self.assertEqual(ExportJob.objects.get(pk=fresh.pk).status, 'running')
+
+    def test_background_export_needs_a_csrf_protected_post(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(admin_user)
+        url = reverse('admin:survey_export_format', args=[self.survey.id, 'csv.gz'])
+        with mock.patch('eeusurvey_app.admin.export_jobs.start_export_job') as start:
+            response = client.get(url + '?background=1')
+            self.assertEqual(response.status_code, 200)
+            b''.join(response.streaming_content) # type: ignore
+            self.assertEqual(client.post(url).status_code, 403)
+            self.assertFalse(ExportJob.objects.exists())
+
+            client.get(reverse('admin:survey_analysis', args=[self.survey.id]))
+            response = client.post(url, {'csrfmiddlewaretoken': client.cookies['csrftoken'].value})
+            self.assertEqual(response.status_code, 302)
+        start.assert_called_once_with(ExportJob.objects.get(survey=self.survey, export_format='csv.gz'))
+
+
+REPLICA = 'test_replica'
+
+
+class ReplicaRoutingTests(TestCase):
+    """ReplicaRouter against a second SQLite database standing in for the replica"""
+    # resolved in setUpClass, once the replica alias is registered
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        replica = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(cls.directory.name, 'replica.sqlite3')}
+        connections.settings[REPLICA] = connections.configure_settings({**connections.settings, REPLICA: replica})[REPLICA]
+        cls.settings_override = override_settings(
+            DATABASES={**settings.DATABASES, REPLICA: replica}, REPLICA_DATABASE_ALIAS=REPLICA,
+        )
+        with warnings.catch_warnings():
+            # the replica is registered with the connection handler by hand above
+            warnings.filterwarnings('ignore', 'Overriding setting DATABASES')
+            cls.settings_override.enable()
+        with connections[REPLICA].schema_editor() as editor:
+            for model in apps.get_app_config('eeusurvey_app').get_models():
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        cls.settings_override.disable()
+        cls.directory.cleanup()
+
+    def setUp(self):
+        routers._replica_down_until = 0.0
+        today = timezone.now().date()
+        fields = dict(instructions='', version='1.0', language='en',
+                      start_time=today - timedelta(days=1), end_time=today + timedelta(days=1))
+        # rows only one side has, so each read shows which database served it
+        self.on_replica = Survey(title='On the replica', **fields)
+        self.on_replica.save(using=REPLICA)
+        self.on_primary = Survey.objects.create(title='On the primary', **fields)
+        routers.begin_request()
+        self.addCleanup(routers.begin_request)
+
+    def titles(self):
+        return set(Survey.objects.values_list('title', flat=True))
+
+    def test_replica_reads_go_to_the_replica(self):
+        self.assertEqual(self.titles(), {'On the primary'})
+        with routers.replica_reads():
+            self.assertEqual(self.titles(), {'On the replica'})
+
+    def test_a_write_pins_reads_to_the_primary(self):
+        with routers.replica_reads():
+            self.assertEqual(self.titles(), {'On the replica'})
+            Survey.objects.filter(pk=self.on_primary.pk).update(title='Edited')
+            self.assertEqual(self.titles(), {'Edited'})
+
+    def test_falls_back_to_the_primary_when_the_replica_is_down(self):
+        with mock.patch.object(connections[REPLICA], 'ensure_connection', side_effect=OperationalError('down')):
+            with routers.replica_reads():
+                self.assertEqual(self.titles(), {'On the primary'})
+        self.assertGreater(routers._replica_down_until, time.monotonic())
+        # still inside the back-off window, so the replica isn't retried yet
+        with routers.replica_reads():
+            self.assertEqual(self.titles(), {'On the primary'})
+
+    @override_settings(ROOT_URLCONF=api_urlconf(False))
+    def test_an_edit_keeps_the_editor_on_the_primary(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        client = Client()
+        listed = lambda: {survey['metadata']['title'] for survey in client.get('/api/surveys/').json()} # noqa: E731
+        self.assertEqual(listed(), {'On the replica'})
+
+        response = client.patch(
+            f'/api/surveys/{self.on_primary.id}/', {},
+            content_type='application/json', HTTP_AUTHORIZATION=basic_auth('admin', 'pw'),
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIn(REPLICA_PIN_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[REPLICA_PIN_COOKIE]['max-age'], settings.READ_YOUR_WRITES_SECONDS)
+        self.assertEqual(listed(), {'On the primary'})
+
+        del client.cookies[REPLICA_PIN_COOKIE]
+        self.assertEqual(listed(), {'On the replica'})
+
+
+@skipUnless(connection.vendor == 'postgresql', "COPY import and export need PostgreSQL")
+class PostgresCopyTests(TestCase):
+    """COPY paths against the Python exporters; run with DB_ENGINE=postgresql"""
+
+    def setUp(self):
+        self.assertTrue(copy_supported(connection), "COPY needs psycopg 3")
+        self.survey = create_survey('en', categories=3, questions_per_category=6, rng=random.Random(5))
+        ResponseGenerator(self.survey, random.Random(6)).insert(60)
+
+    def export(self, stream, copy=True):
+        copied = mock.patch('eeusurvey_app.exports.copy_out', wraps=copy_out)
+        supported = mock.patch('eeusurvey_app.exports.copy_supported', return_value=copy)
+        with copied as copy_out_spy, supported:
+            text = ''.join(stream(self.survey))
+        self.assertEqual(copy_out_spy.called, copy)
+        return text
+
+    def csv_table(self, text):
+        header, *rows = csv.reader(io.StringIO(text))
+        return header, sorted(rows)
+
+    def test_copy_csv_matches_the_python_export(self):
+        copied = self.export(stream_csv)
+        self.assertNotIn('\r\n', copied)
+        self.assertEqual(self.csv_table(copied), self.csv_table(self.export(stream_csv, copy=False)))
+
+    def test_copy_jsonl_matches_the_python_export(self):
+        documents = lambda text: sorted((json.loads(line) for line in text.splitlines()), key=lambda d: d['response_id']) # noqa: E731
+        copied = documents(self.export(stream_jsonl))
+        self.assertEqual(len(copied), 60)
+        self.assertEqual(copied, documents(self.export(stream_jsonl, copy=False)))
+
+    def test_copy_import_round_trips_the_csv_export(self):
+        exported = self.export(stream_csv)
+        SurveyResponse.objects.filter(survey=self.survey).delete()
+
+        with mock.patch('eeusurvey_app.imports.copy_rows_in', wraps=copy_rows_in) as copy_rows_in_spy:
+            report = ResponseImporter(self.survey, chunk_size=25).run(
+                SimpleUploadedFile('export.csv', exported.encode('utf-8')),
+            )
+        self.assertEqual(report['imported'], 60, report['errors'])
+        self.assertTrue(copy_rows_in_spy.called)
+        self.assertEqual(self.csv_table(self.export(stream_csv)), self.csv_table(exported))
+
+
+class ChoiceAnswerTests(TestCase):
+
+    def setUp(self):
+        self.survey = create_survey('en', categories=1, questions_per_category=8, rng=random.Random(7))
+        self.multi_select = self.survey.questions.get(question_type='multi_select') # type: ignore
+        self.single_choice = self.survey.questions.get(question_type='single_choice') # type: ignore
+        # an id that is the first one with a digit appended, e.g. 1 and 11
+        self.first = QuestionOption.objects.create(survey=self.survey, label='First')
+        self.longer = QuestionOption.objects.create(id=int(f'{self.first.id}1'), survey=self.survey, label='Longer')
+        self.multi_select.options.add(self.first, self.longer)
+
+    def answer(self, question, **fields):
+        return Answer.objects.create(response=SurveyResponse.objects.create(survey=self.survey), question=question, **fields)
+
+    def test_option_ids_round_trip(self):
+        self.assertEqual(encode_option_ids([11, 3, '17', 3]), ',3,11,17,')
+        self.assertEqual(decode_option_ids(',3,11,17,'), [3, 11, 17])
+        self.assertIsNone(encode_option_ids([]))
+        self.assertEqual(decode_option_ids(None), [])
+        self.assertEqual(decode_option_ids(''), [])
+
+    def test_multi_select_counts_match_whole_ids(self):
+        self.answer(self.multi_select, option_ids=encode_option_ids([self.longer.id]))
+        self.answer(self.multi_select, option_ids=encode_option_ids([self.first.id, self.longer.id]))
+        self.answer(self.multi_select, option_ids=encode_option_ids([self.longer.id]))
+
+        chart = question_chart_data(self.multi_select, 3)['chart']
+        counts = dict(zip(chart['option_ids'], chart['datasets'][0]['data']))
+        self.assertEqual(counts, {self.first.id: 1, self.longer.id: 3})
+
+    def test_compact_command_moves_legacy_rows(self):
+        multi = self.answer(self.multi_select)
+        multi.selected_options.add(self.longer, self.first)
+        single = self.answer(self.single_choice)
+        option = self.single_choice.options.first()
+        single.selected_options.add(option)
+        through = Answer.selected_options.through # type: ignore
+
+        for _ in range(2):  # safe to re-run
+            call_command('compact_choice_answers', '--clear-legacy', stdout=io.StringIO())
+            multi.refresh_from_db()
+            single.refresh_from_db()
+            self.assertEqual(multi.option_ids, encode_option_ids([self.first.id, self.longer.id]))
+            self.assertIsNone(multi.selected_option_id)
+            self.assertEqual(single.selected_option_id, option.id)
+            self.assertIsNone(single.option_ids)
+            self.assertFalse(through.objects.exists())
+
+
+class DocumentStorageTests(TestCase):
+    """storage_mode='document' keeps the submission as JSON until it is materialized"""
+
+    ANSWER_FIELDS = ['question_id', 'text_value', 'rating_value', 'number_value', 'custom_text',
+                     'selected_option_id', 'option_ids']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.survey = create_survey('en', categories=2, questions_per_category=8, rng=random.Random(8))
+
+    def submit(self, payload, storage_mode, async_api=False):
+        Survey.objects.filter(pk=self.survey.pk).update(storage_mode=storage_mode)
+        with override_settings(ROOT_URLCONF=api_urlconf(async_api)):
+            response = Client().post('/api/responses/submit/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return SurveyResponse.objects.get(id=response.json()['response_id'])
+
+    def answer_rows(self, survey_response):
+        return sorted(
+            Answer.objects.filter(response=survey_response).values_list(*self.ANSWER_FIELDS),
+            key=lambda row: row[0],
+        )
+
+    def test_document_mode_stores_the_answer_document(self):
+        payload = ResponseGenerator(self.survey, random.Random(9)).submission()
+        for async_api in (False, True):
+            with self.subTest(async_api=async_api):
+                survey_response = self.submit(payload, 'document', async_api)
+                self.assertFalse(survey_response.answers_materialized)
+                self.assertEqual(
+                    {entry['question_id'] for entry in survey_response.answer_document},
+                    {entry['question_id'] for entry in payload['responses']},
+                )
+                self.assertFalse(Answer.objects.filter(response=survey_response).exists())
+
+    def test_materializing_writes_the_normalized_rows_once(self):
+        generator = ResponseGenerator(self.survey, random.Random(10))
+        payloads = [generator.submission(respondent) for respondent in range(6)]
+        normalized = [self.submit(payload, 'normalized') for payload in payloads]
+        documents = [self.submit(payload, 'document') for payload in payloads]
+
+        self.assertEqual(materialize_survey(self.survey.id, batch_size=4), 6)
+        for expected, survey_response in zip(normalized, documents):
+            survey_response.refresh_from_db()
+            self.assertTrue(survey_response.answers_materialized)
+            self.assertEqual(self.answer_rows(survey_response), self.answer_rows(expected))
+
+        answer_count = Answer.objects.count()
+        self.assertEqual(materialize_survey(self.survey.id), 0)
+        self.assertEqual(materialize_pending(), 0)
+        self.assertEqual(Answer.objects.count(), answer_count)
+
+    def test_materialize_pending_covers_every_survey(self):
+        other = create_survey('en', categories=1, questions_per_category=8, rng=random.Random(11), title='Other')
+        Survey.objects.filter(pk=other.pk).update(storage_mode='document')
+        self.submit(ResponseGenerator(self.survey, random.Random(12)).submission(), 'document')
+        with override_settings(ROOT_URLCONF=api_urlconf(False)):
+            response = Client().post(
+                '/api/responses/submit/', ResponseGenerator(other, random.Random(13)).submission(),
+                content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+
+        self.assertEqual(SurveyResponse.objects.filter(answers_materialized=False).count(), 2)
+        self.assertEqual(materialize_pending(), 2)
+        self.assertFalse(SurveyResponse.objects.filter(answers_materialized=False).exists())
+        self.assertEqual(materialize_pending(), 0)
+
+    def test_analysis_reads_leave_materializing_to_the_worker(self):
+        self.submit(ResponseGenerator(self.survey, random.Random(20)).submission(), 'document')
+        client = Client()
+        client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        question = self.survey.questions.filter(question_type='rating').first() # type: ignore
+        url = reverse('admin:survey_analysis_question', args=[self.survey.id, question.id])
+
+        with CaptureQueriesContext(connection) as queries:
+            before = client.get(url)
+        self.assertEqual(before.status_code, 200)
+        writes = [q['sql'] for q in queries if not q['sql'].lstrip().upper().startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(writes, [])
+        self.assertTrue(SurveyResponse.objects.filter(answers_materialized=False).exists())
+
+        materialize_pending()
+        self.assertNotEqual(client.get(url)['ETag'], before['ETag'])
+
+    @mock.patch('eeusurvey_app.exports.INCREMENTAL_EXPORT_LAG', timedelta(0))
+    def test_incremental_export_waits_for_pending_documents(self):
+        generator = ResponseGenerator(self.survey, random.Random(21))
+        first = self.submit(generator.submission(1), 'normalized')
+        pending = self.submit(generator.submission(2), 'document')
+        last = self.submit(generator.submission(3), 'normalized')
+
+        page, _, cursor = responses_since(self.survey)
+        self.assertEqual([r.id for r in page], [first.id])
+        self.assertEqual(responses_since(self.survey, cursor)[0], [])
+
+        materialize_pending()
+        page, _, _ = responses_since(self.survey, cursor)
+        self.assertEqual([r.id for r in page], [pending.id, last.id])
+        self.assertTrue(page[0].answers.exists())
+
+    def test_export_jobs_materialize_their_survey(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.submit(ResponseGenerator(self.survey, random.Random(22)).submission(), 'document')
+        with override_settings(EXPORT_ROOT=directory.name):
+            job = run_export_job(create_export_job(self.survey, 'jsonl'))
+        self.assertEqual(job.status, 'finished', job.error)
+        self.assertFalse(SurveyResponse.objects.filter(answers_materialized=False).exists())
+
+
+class SurveyDeletionTests(TestCase):
+    """Deleting a survey hides it at once and purges its rows in batches"""
+
+    def setUp(self):
+        self.survey = create_survey('en', categories=2, questions_per_category=4, rng=random.Random(14))
+        ResponseGenerator(self.survey, random.Random(15)).insert(30)
+        self.deletion = request_survey_deletion(self.survey, 'admin')
+
+    def test_deletion_hides_the_survey_then_purges_it(self):
+        survey = Survey.objects.get(pk=self.survey.pk)
+        self.assertIsNotNone(survey.deleted_at)
+        self.assertFalse(survey.is_active)
+        self.assertEqual((self.deletion.status, self.deletion.total_responses), ('pending', 30))
+
+        self.assertIs(run_survey_deletion(self.deletion, batch_size=7), True)
+        self.assertFalse(Survey.objects.filter(pk=self.survey.pk).exists())
+        self.assertFalse(SurveyResponse.objects.exists())
+        self.assertFalse(Answer.objects.exists())
+        self.assertFalse(SurveyDeletion.objects.exists())
+
+    def test_a_deletion_is_claimed_once(self):
+        SurveyDeletion.objects.filter(pk=self.deletion.pk).update(status='running')
+        self.assertIsNone(run_survey_deletion(self.deletion))
+        call_command('purge_deleted_surveys', stdout=io.StringIO())
+        self.assertEqual(SurveyResponse.objects.count(), 30)
+
+        # a worker that stopped reporting progress is taken over
+        SurveyDeletion.objects.filter(pk=self.deletion.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        call_command('purge_deleted_surveys', stdout=io.StringIO())
+        self.assertFalse(Survey.objects.filter(pk=self.survey.pk).exists())
+
+    def test_failed_deletion_is_recorded_and_can_be_retried(self):
+        with mock.patch('eeusurvey_app.purge.purge_survey_responses', side_effect=RuntimeError('disk full')):
+            self.assertIs(run_survey_deletion(self.deletion), False)
+        deletion = SurveyDeletion.objects.get(pk=self.deletion.pk)
+        self.assertEqual((deletion.status, deletion.error), ('failed', 'disk full'))
+
+        self.assertIs(run_survey_deletion(deletion), True)
+        self.assertFalse(Survey.objects.filter(pk=self.survey.pk).exists())
+
+    def test_admin_views_refuse_deleted_surveys(self):
+        client = Client()
+        client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        question = self.survey.questions.first() # type: ignore
+        category = self.survey.categories.first() # type: ignore
+        for url in (
+            reverse('admin:survey_analysis', args=[self.survey.id]),
+            reverse('admin:survey_analysis_question', args=[self.survey.id, question.id]),
+            reverse('admin:survey_analysis_category', args=[self.survey.id, category.id]),
+            reverse('admin:survey_export_format', args=[self.survey.id, 'jsonl']),
+            reverse('admin:survey_import', args=[self.survey.id]),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(client.get(url).status_code, 404)
+        url = reverse('admin:survey_export_format', args=[self.survey.id, 'csv'])
+        self.assertEqual(client.post(url).status_code, 404)
+        self.assertFalse(ExportJob.objects.exists())
+
+
+class ExportFormatTests(TestCase):
+    """Each export format reads back to the responses it was made from"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.survey = create_survey('en', categories=2, questions_per_category=8, rng=random.Random(16))
+        ResponseGenerator(cls.survey, random.Random(17)).insert(40)
+
+    def stored_answers(self):
+        """{(response id, question id): Answer}"""
+        return {
+            (str(answer.response_id), answer.question_id): answer # type: ignore
+            for answer in Answer.objects.filter(response__survey=self.survey)
+        }
+
+    def test_jsonl_round_trip(self):
+        documents = [json.loads(line) for line in ''.join(stream_jsonl(self.survey)).splitlines()]
+        self.assertEqual(
+            {document['response_id'] for document in documents},
+            {str(response_id) for response_id in self.survey.responses.values_list('id', flat=True)}, # type: ignore
+        )
+        stored = self.stored_answers()
+        exported = 0
+        for document in documents:
+            for entry in document['answers'].values():
+                answer = stored[document['response_id'], entry['question_id']]
+                value = entry['value']
+                if entry['type'] == 'multi_select':
+                    self.assertEqual(sorted(option['id'] for option in value), sorted(answer.selected_option_ids))
+                elif entry['type'] in ('single_choice', 'drop_down'):
+                    self.assertEqual(value['id'], answer.selected_option_id) # type: ignore
+                elif entry['type'] == 'rating':
+                    self.assertEqual(value, answer.rating_value)
+                elif entry['type'] == 'number':
+                    self.assertEqual(value, answer.number_value)
+                else:
+                    self.assertEqual(value, answer.text_value)
+                self.assertEqual(entry['custom_text'], answer.custom_text)
+                exported += 1
+        self.assertEqual(exported, len(stored))
+
+    def test_csv_gzip_round_trip(self):
+        compressed = b''.join(stream_csv_gzip(self.survey))
+        text = gzip.decompress(compressed).decode('utf-8')
+        self.assertEqual(text, ''.join(stream_csv(self.survey)))
+        header, *rows = csv.reader(io.StringIO(text))
+        self.assertEqual(header[:2], ['Response ID', 'Submitted At'])
+        self.assertEqual(len(header), 2 + len(export_questions(self.survey)))
+        self.assertEqual(len(rows), 40)
+
+    def test_sqlite_snapshot_round_trip(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'snapshot.sqlite3')
+        build_sqlite_snapshot(self.survey, path)
+
+        db = sqlite3.connect(path)
+        self.addCleanup(db.close)
+        count = lambda table: db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] # noqa: E731
+        self.assertEqual(db.execute('SELECT id, title FROM survey').fetchall(), [(str(self.survey.id), self.survey.title)])
+        self.assertEqual(count('question'), self.survey.questions.count()) # type: ignore
+        self.assertEqual(count('response'), 40)
+
+        stored = self.stored_answers()
+        options = {}
+        for answer_id, option_id in db.execute('SELECT answer_id, option_id FROM answer_option'):
+            options.setdefault(answer_id, []).append(option_id)
+        rows = db.execute(
+            'SELECT id, response_id, question_id, text_value, rating_value, number_value, custom_text FROM answer'
+        ).fetchall()
+        self.assertEqual(len(rows), len(stored))
+        for answer_id, response_id, question_id, *values in rows:
+            answer = stored[response_id, question_id]
+            self.assertEqual(answer_id, answer.id)
+            self.assertEqual(values, [answer.text_value, answer.rating_value, answer.number_value, answer.custom_text])
+            self.assertEqual(sorted(options.get(answer_id, [])), sorted(answer.selected_option_ids))
+
+
+@override_settings(ROOT_URLCONF=api_urlconf(False), METRICS_TOKEN='scrape-me')
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        patcher = mock.patch('eeusurvey_app.metrics.registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_prometheus_text_format(self):
+        request_metrics = RequestMetrics()
+        request_metrics.add_query('SELECT 1', 0.01)
+        request_metrics.add_query('SELECT 2', 0.02)
+        request_metrics.serializer_time = 0.5
+        self.registry.record('api/"quoted"/', 'GET', 200, 0.03, request_metrics, size=2000)
+
+        lines = self.registry.render().splitlines()
+        labels = 'route="api/\\"quoted\\"/",method="GET"'
+        for line in (
+            '# TYPE eeusurvey_request_duration_seconds histogram',
+            f'eeusurvey_request_duration_seconds_bucket{{{labels},le="0.025"}} 0',
+            f'eeusurvey_request_duration_seconds_bucket{{{labels},le="0.05"}} 1',
+            f'eeusurvey_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1',
+            f'eeusurvey_request_duration_seconds_count{{{labels}}} 1',
+            f'eeusurvey_request_db_queries_bucket{{{labels},le="1"}} 0',
+            f'eeusurvey_request_db_queries_bucket{{{labels},le="2"}} 1',
+            f'eeusurvey_response_size_bytes_bucket{{{labels},le="4096"}} 1',
+            '# TYPE eeusurvey_requests_total counter',
+            f'eeusurvey_requests_total{{{labels},status="200"}} 1.0',
+            f'eeusurvey_request_serializer_seconds_total{{{labels}}} 0.5',
+        ):
+            self.assertIn(line, lines)
+
+    def test_requests_are_labelled_by_route(self):
+        surveys = [
+            create_survey('en', categories=1, questions_per_category=2, rng=random.Random(seed), title=f"Survey {seed}")
+            for seed in (18, 19)
+        ]
+        client = Client()
+        for survey in surveys:
+            self.assertEqual(client.get(f'/api/surveys/{survey.id}/').status_code, 200)
+        client.get('/api/surveys/')
+
+        detail = resolve(f'/api/surveys/{surveys[0].id}/').route
+        rendered = self.registry.render()
+        self.assertIn(f'eeusurvey_requests_total{{route="{detail}",method="GET",status="200"}} 2.0\n', rendered)
+        self.assertIn(
+            f'eeusurvey_requests_total{{route="{resolve("/api/surveys/").route}",method="GET",status="200"}} 1.0\n',
+            rendered,
+        )
+        for survey in surveys:
+            self.assertNotIn(str(survey.id), rendered)
+
+    def test_endpoint_needs_staff_or_the_token(self):
+        client = Client()
+        self.assertEqual(client.get('/api/metrics/').status_code, 403)
+        self.assertEqual(client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        client.force_login(User.objects.create_user('respondent', password='pw'))
+        self.assertEqual(client.get('/api/metrics/').status_code, 403)
+
+        response = Client().get('/api/metrics/', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'# TYPE eeusurvey_requests_total counter', response.content)
+
+        client.force_login(User.objects.create_user('staff', password='pw', is_staff=True))
+        self.assertEqual(client.get('/api/metrics/').status_code, 200)
+
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(Client().get('/api/metrics/', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
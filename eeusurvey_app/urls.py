@@ -1,14 +1,32 @@
 # urls.py
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import SurveyViewSet, get_survey_analysis, submit_survey_response
+from .views import (
+    SurveyViewSet, export_responses_since, get_survey_analysis, metrics_endpoint, reorder_survey_categories,
+    submit_survey_response, submit_survey_response_async, survey_detail_async, survey_list_async, survey_live_feed,
+)
 from .admin import admin_site  # instead of default admin
 
 router = DefaultRouter()
 router.register(r'surveys', SurveyViewSet)
 
-urlpatterns = [
+api_urlpatterns = [
     path('surveys/<uuid:survey_id>/analysis/', get_survey_analysis, name='survey-analysis'),
+    path('surveys/<uuid:survey_id>/responses/export/', export_responses_since, name='survey-responses-export'),
+    path('surveys/<uuid:survey_id>/categories/order/', reorder_survey_categories, name='survey-categories-order'),
+    path('surveys/<uuid:survey_id>/live/', survey_live_feed, name='survey-live-feed'),
+    path('live/', survey_live_feed, name='live-feed'),
     path('responses/submit/', submit_survey_response, name='submit-response'),
+    path('metrics/', metrics_endpoint, name='metrics'),
     path('', include(router.urls)),  # keeps /surveys/ and /surveys/<id>/
 ]
+
+# ASGI deployments: matched before the router's sync routes; other methods are handed on to SurveyViewSet
+async_urlpatterns = [
+    path('surveys/', survey_list_async, name='survey-list-async'),
+    path('surveys/<uuid:pk>/', survey_detail_async, name='survey-detail-async'),
+    path('responses/submit/', submit_survey_response_async, name='submit-response-async'),
+]
+
+urlpatterns = (async_urlpatterns if settings.ASYNC_API else []) + api_urlpatterns
@@ -2,19 +2,38 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAdminUser, AllowAny
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from asgiref.sync import sync_to_async
 from datetime import datetime, timedelta
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from eeusurvey_app.analysis import analyze_survey_responses
-from .serializers import SurveyResponseSerializer, SurveySerializer
-from .models import Answer, KeyChoice, Survey, Question, QuestionOption, QuestionCategory, SurveyResponse
-from django.db.models import Count, Avg, Q, F
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from eeusurvey_app import metrics
+from eeusurvey_app.analysis import analyze_survey_responses, survey_analysis_data
+from eeusurvey_app.categories import reorder_categories
+from eeusurvey_app.documents import (
+    abuild_answer_document, build_answer_document, document_answers, document_option_ids,
+    submitted_option_ids,
+)
+from eeusurvey_app.exports import INCREMENTAL_EXPORT_LIMIT, responses_since
+from eeusurvey_app.live import live_events, publish_response
+from eeusurvey_app.purge import request_survey_deletion, start_survey_deletion
+from eeusurvey_app.routers import replica_reads
+from eeusurvey_app.survey_cache import cached_survey_json
+from .serializers import QuestionCategorySerializer, SurveyResponseSerializer, SurveySerializer
+from .models import Answer, KeyChoice, Survey, SurveyArchive, Question, QuestionOption, QuestionCategory, SurveyResponse
+from django.db.models import Count, Avg, Q, F, Prefetch
 from django.db.models.functions import TruncDate
 from collections import defaultdict
+import hmac
 import json
 
 class SurveyViewSet(viewsets.ModelViewSet):
-    queryset = Survey.objects.all()
+    queryset = Survey.objects.filter(deleted_at__isnull=True)
     serializer_class = SurveySerializer
     
     def get_permissions(self):
@@ -22,6 +41,10 @@ class SurveyViewSet(viewsets.ModelViewSet):
             return [IsAdminUser()]  # 👈 Only admins
         return [AllowAny()]
 
+    def perform_destroy(self, instance):
+        """Hide the survey now; its responses are purged in batches in the background"""
+        start_survey_deletion(request_survey_deletion(instance, self.request.user.get_username()))
+
     def create(self, request):
         """Create a new survey from JSON data"""
         try:
@@ -30,6 +53,10 @@ class SurveyViewSet(viewsets.ModelViewSet):
 
             start_str = survey_data.get('start', datetime.today().strftime('%Y-%m-%d'))
             end_str = survey_data.get('end', datetime.today().strftime('%Y-%m-%d'))
+            storage_mode = survey_data.get('storage_mode', 'normalized')
+            if storage_mode not in dict(Survey.STORAGE_MODES):
+                return Response({'error': f"Unknown storage_mode: {storage_mode}"},
+                                status=status.HTTP_400_BAD_REQUEST)
 
             survey = Survey.objects.create(
                 title=survey_data.get('title', ''),
@@ -37,7 +64,8 @@ class SurveyViewSet(viewsets.ModelViewSet):
                 version=survey_data.get('version', '1.0'),
                 start_time = timezone.make_aware(datetime.strptime(start_str, '%Y-%m-%d')).date(),
                 end_time = timezone.make_aware(datetime.strptime(end_str, '%Y-%m-%d') + timedelta(days=1, seconds=-1)).date(),
-                language=survey_data.get('language', '')
+                language=survey_data.get('language', ''),
+                storage_mode=storage_mode
             )
 
             # Create KeyChoice
@@ -93,11 +121,16 @@ class SurveyViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @replica_reads()
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @replica_reads()
     def list(self, request, *args, **kwargs):
         lang = request.query_params.get("lang")
         show_all = request.query_params.get("show_all")
 
-        queryset = Survey.objects.all()
+        queryset = Survey.objects.filter(deleted_at__isnull=True)
 
         if show_all != "true":
             queryset = queryset.filter(is_active=True)
@@ -132,20 +165,38 @@ def submit_survey_response(request):
         
         # Validate survey exists and is active
         try:
-            survey = Survey.objects.get(id=survey_id, is_active=True)
+            survey = Survey.objects.get(id=survey_id, is_active=True, deleted_at__isnull=True)
         except Survey.DoesNotExist:
             return Response({'error': 'Survey not found or inactive'}, 
                           status=status.HTTP_404_NOT_FOUND)
         
+        respondent_info = {
+            'ip_address': data.get('respondent_info', {}).get('ip_address'),
+            'user_agent': data.get('respondent_info', {}).get('user_agent'),
+            'session_id': data.get('respondent_info', {}).get('session_id'),
+        }
+
+        if survey.storage_mode == 'document':
+            # One INSERT; Answer rows are created later by the materializer
+            document = build_answer_document(survey, data.get('responses', []))
+            survey_response = SurveyResponse.objects.create(
+                survey=survey,
+                answer_document=document,
+                answers_materialized=False,
+                **respondent_info
+            )
+            publish_response(survey_response, document_option_ids(document))
+            return Response({
+                'success': True,
+                'response_id': survey_response.id,
+                'message': 'Response submitted successfully'
+            }, status=status.HTTP_201_CREATED)
+
         # Create response record
-        survey_response = SurveyResponse.objects.create(
-            survey=survey,
-            ip_address=data.get('respondent_info', {}).get('ip_address'),
-            user_agent=data.get('respondent_info', {}).get('user_agent'),
-            session_id=data.get('respondent_info', {}).get('session_id'),
-        )
+        survey_response = SurveyResponse.objects.create(survey=survey, **respondent_info)
         
         # Process each answer
+        selected_option_ids = []
         for response_data in data.get('responses', []):
             question_id = response_data.get('question_id')
             answer_data = response_data.get('answer', {})
@@ -155,8 +206,14 @@ def submit_survey_response(request):
             except Question.DoesNotExist:
                 continue  # Skip invalid questions
             
+            # Handle selected options (unknown ids are skipped)
+            option_ids = submitted_option_ids(answer_data)
+            if option_ids:
+                existing = set(QuestionOption.objects.filter(id__in=option_ids).values_list('id', flat=True))
+                option_ids = [option_id for option_id in option_ids if option_id in existing]
+
             # Create answer record
-            answer = Answer.objects.create(
+            answer = Answer(
                 response=survey_response,
                 question=question,
                 text_value=answer_data.get('text_value'),
@@ -164,23 +221,12 @@ def submit_survey_response(request):
                 number_value=answer_data.get('number_value'),
                 custom_text=answer_data.get('text_value') if answer_data.get('is_other') else None
             )
-            
-            # Handle selected options
-            if answer_data.get('selected_option_id'):
-                try:
-                    option = QuestionOption.objects.get(id=answer_data['selected_option_id'])
-                    answer.selected_options.add(option)
-                except QuestionOption.DoesNotExist:
-                    pass
-            
-            if answer_data.get('selected_option_ids'):
-                for option_id in answer_data['selected_option_ids']:
-                    try:
-                        option = QuestionOption.objects.get(id=option_id)
-                        answer.selected_options.add(option)
-                    except QuestionOption.DoesNotExist:
-                        continue
+            answer.set_selected_option_ids(option_ids, multiple=question.question_type == 'multi_select')
+            answer.save()
+            selected_option_ids.extend(answer.selected_option_ids)
         
+        publish_response(survey_response, selected_option_ids)
+
         return Response({
             'success': True,
             'response_id': survey_response.id,
@@ -191,152 +237,218 @@ def submit_survey_response(request):
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+# Native async versions of the survey reads and submission, routed instead of
+# the sync ones when ASYNC_API is on (the ASGI deployment, see eeusurvey/asgi.py)
+
+survey_collection = SurveyViewSet.as_view({'get': 'list', 'post': 'create'}, basename='survey', detail=False)
+survey_member = SurveyViewSet.as_view(
+    {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'},
+    basename='survey', detail=True,
+)
+
+
+def survey_documents():
+    """Surveys with everything SurveySerializer reads, so rendering one makes no further queries"""
+    return Survey.objects.filter(deleted_at__isnull=True).prefetch_related(
+        Prefetch('questions', queryset=Question.objects.select_related('category').prefetch_related('options')),
+        'categories', 'keys',
+    )
+
+
+def json_response(content, status=200):
+    return HttpResponse(content, status=status, content_type='application/json')
+
+
+@csrf_exempt  # like DRF's as_view(); SessionAuthentication still checks CSRF for cookie sessions
+async def survey_list_async(request):
+    """SurveyViewSet.list on the async ORM; the rendered list is shared through the cache.
+
+    Reads go to the primary: a replica lagging behind an edit would put the old
+    survey back in the cache right after the edit retired it.
+    """
+    if request.method != 'GET':
+        return await sync_to_async(survey_collection)(request)
+    lang = request.GET.get('lang')
+    show_all = request.GET.get('show_all') == 'true'
+
+    async def build():
+        queryset = survey_documents()
+        if not show_all:
+            queryset = queryset.filter(is_active=True)
+        if lang:
+            queryset = queryset.filter(language=lang)
+        surveys = [survey async for survey in queryset]
+        return JSONRenderer().render(SurveySerializer(surveys, many=True).data)
+
+    if lang and lang not in dict(Survey.LANGUAGES):
+        return json_response(await build())  # nothing to cache for unknown languages
+    return json_response(await cached_survey_json(f"list:{lang or ''}:{int(show_all)}", build))
+
+
+@csrf_exempt
+async def survey_detail_async(request, pk):
+    """SurveyViewSet.retrieve on the async ORM, cached like survey_list_async"""
+    if request.method != 'GET':
+        return await sync_to_async(survey_member)(request, pk=pk)
+
+    async def build():
+        try:
+            survey = await survey_documents().aget(pk=pk)
+        except Survey.DoesNotExist:
+            return None
+        return JSONRenderer().render(SurveySerializer(survey).data)
+
+    content = await cached_survey_json(f"survey:{pk}", build)
+    if content is None:
+        return JsonResponse({'detail': 'No Survey matches the given query.'}, status=status.HTTP_404_NOT_FOUND)
+    return json_response(content)
+
+
+@csrf_exempt
+@require_POST
+async def submit_survey_response_async(request):
+    """submit_survey_response on the async ORM: the same few queries and one bulk insert
+    whatever the number of answers, and no worker thread held while a slow client uploads"""
+    if request.content_type != 'application/json':
+        # form and multipart posts keep DRF's parsers
+        return await sync_to_async(submit_survey_response)(request)
+    try:
+        data = json.loads(request.body)
+    except ValueError as e:
+        return JsonResponse({'error': f"Invalid JSON: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Expected a JSON object'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        try:
+            survey = await Survey.objects.aget(id=data.get('survey_id'), is_active=True, deleted_at__isnull=True)
+        except Survey.DoesNotExist:
+            return JsonResponse({'error': 'Survey not found or inactive'}, status=status.HTTP_404_NOT_FOUND)
+
+        respondent_info = {
+            'ip_address': data.get('respondent_info', {}).get('ip_address'),
+            'user_agent': data.get('respondent_info', {}).get('user_agent'),
+            'session_id': data.get('respondent_info', {}).get('session_id'),
+        }
+        questions = Question.objects.filter(survey=survey).values_list('id', 'question_type')
+        question_types = {question_id: question_type async for question_id, question_type in questions}
+        document = await abuild_answer_document(question_types, data.get('responses', []))
+
+        if survey.storage_mode == 'document':
+            survey_response = await SurveyResponse.objects.acreate(
+                survey=survey, answer_document=document, answers_materialized=False, **respondent_info
+            )
+        else:
+            survey_response = await SurveyResponse.objects.acreate(survey=survey, **respondent_info)
+            try:
+                await Answer.objects.abulk_create(document_answers(survey_response.id, document, question_types))
+            except Exception:
+                await survey_response.adelete()  # don't leave a response without its answers
+                raise
+        publish_response(survey_response, document_option_ids(document))
+
+        return JsonResponse({
+            'success': True,
+            'response_id': survey_response.id,
+            'message': 'Response submitted successfully'
+        }, status=status.HTTP_201_CREATED)
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
+@replica_reads()
+def export_responses_since(request, survey_id):
+    """Incremental export: responses and deletions after the `since` cursor"""
+    try:
+        survey = Survey.objects.get(id=survey_id, deleted_at__isnull=True)
+    except Survey.DoesNotExist:
+        return Response({'error': 'Survey not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        limit = int(request.query_params.get('limit', INCREMENTAL_EXPORT_LIMIT))
+        limit = max(1, min(limit, INCREMENTAL_EXPORT_LIMIT))
+        responses, deleted, next_cursor = responses_since(survey, request.query_params.get('since'), limit)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'survey_id': survey.id,
+        'responses': SurveyResponseSerializer(responses, many=True).data,
+        'deleted': deleted,
+        'next_cursor': next_cursor,
+        'has_more': len(responses) == limit or len(deleted) == limit,
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def reorder_survey_categories(request, survey_id):
+    """Renumber a survey's categories in the order of the posted `categories` ids"""
+    try:
+        survey = Survey.objects.get(id=survey_id, deleted_at__isnull=True)
+    except Survey.DoesNotExist:
+        return Response({'error': 'Survey not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    category_ids = request.data.get('categories')
+    if not isinstance(category_ids, list):
+        return Response({'error': 'categories must be a list of category ids'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        reorder_categories(survey, category_ids)
+    except (TypeError, ValueError) as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    categories = survey.categories.order_by('cat_number') # type: ignore
+    return Response({'question_categories': QuestionCategorySerializer(categories, many=True).data})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+@replica_reads()
 def get_survey_analysis(request, survey_id):
     """Get comprehensive analysis of survey responses"""
     try:
-        survey = Survey.objects.get(id=survey_id)
+        survey = Survey.objects.get(id=survey_id, deleted_at__isnull=True)
     except Survey.DoesNotExist:
         return Response({'error': 'Survey not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    # Basic statistics
-    total_responses = SurveyResponse.objects.filter(survey=survey).count()
-    
-    if total_responses == 0:
-        return Response({
-            'survey': {
-                'id': survey.id,
-                'title': survey.title,
-                'total_responses': 0
-            },
-            'analysis': {},
-            'message': 'No responses yet'
-        })
-    
-    # Response timeline
-    daily_responses = (
-        SurveyResponse.objects
-        .filter(survey=survey)
-        .extra({'date': "DATE(submitted_at)"})
-        .values('date')
-        .annotate(count=Count('id'))
-        .order_by('date')
+    archive = SurveyArchive.objects.filter(survey=survey).first()
+    if archive:
+        # responses have moved to cold storage; serve the statistics kept when archiving
+        return Response({**archive.statistics['analysis'], 'archived_at': archive.archived_at})
+
+    return Response(survey_analysis_data(survey))
+
+
+async def survey_live_feed(request, survey_id=None):
+    """Server-Sent Events feed of new responses and option increments (staff only, serve over ASGI)"""
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI an endless stream would pin a worker; clients fall back to polling
+        return JsonResponse({'error': 'Live feed is only served by the ASGI application'},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+    user = await request.auser()
+    if not user.is_staff:
+        return JsonResponse({'error': 'Staff access required'}, status=status.HTTP_403_FORBIDDEN)
+    if survey_id and not await Survey.objects.filter(id=survey_id, deleted_at__isnull=True).aexists():
+        return JsonResponse({'error': 'Survey not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    response = StreamingHttpResponse(
+        live_events(str(survey_id) if survey_id else None),
+        content_type='text/event-stream',
     )
-    
-    # Analyze each question
-    questions_analysis = {}
-    
-    for question in survey.questions.all():
-        question_analysis = analyze_question(question)
-        questions_analysis[question.id] = question_analysis
-    
-    # Category analysis
-    category_analysis = {}
-    for category in survey.categories.all():
-        category_questions = category.questions.all()
-        category_analysis[category.id] = {
-            'name': category.name,
-            'total_questions': category_questions.count(),
-            'questions': [q.id for q in category_questions]
-        }
-    
-    return Response({
-        'survey': {
-            'id': survey.id,
-            'title': survey.title,
-            'total_responses': total_responses,
-            'response_timeline': list(daily_responses)
-        },
-        'categories': category_analysis,
-        'questions': questions_analysis,
-        'generated_at': timezone.now().isoformat()
-    })
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
-def analyze_question(question):
-    """Analyze individual question responses"""
-    answers = Answer.objects.filter(question=question)
-    total_answers = answers.count()
-    
-    analysis = {
-        'question_id': question.id,
-        'question_text': question.question_text,
-        'question_type': question.question_type,
-        'total_responses': total_answers,
-        'category': {
-            'id': question.category.id,
-            'name': question.category.name
-        }
-    }
-    
-    if total_answers == 0:
-        return analysis
-    
-    if question.question_type in ['single_choice', 'drop_down']:
-        # Analyze choice distribution
-        option_counts = defaultdict(int)
-        other_responses = []
-        
-        for answer in answers:
-            selected_options = answer.selected_options.all()
-            if selected_options:
-                for option in selected_options:
-                    if option.is_other and answer.custom_text:
-                        other_responses.append(answer.custom_text)
-                    option_counts[option.label or option.text or option.value] += 1
-        
-        analysis['distribution'] = dict(option_counts)
-        analysis['other_responses'] = other_responses
-        
-    elif question.question_type == 'multi_select':
-        # Analyze multiple selection patterns
-        option_counts = defaultdict(int)
-        combination_counts = defaultdict(int)
-        
-        for answer in answers:
-            selected_options = answer.selected_options.all()
-            if selected_options:
-                # Count individual options
-                option_labels = []
-                for option in selected_options:
-                    label = option.label or option.text or option.value
-                    option_counts[label] += 1
-                    option_labels.append(label)
-                
-                # Count combinations
-                combination = ', '.join(sorted(option_labels))
-                combination_counts[combination] += 1
-        
-        analysis['option_distribution'] = dict(option_counts)
-        analysis['combination_distribution'] = dict(combination_counts)
-        
-    elif question.question_type == 'rating':
-        # Calculate rating statistics
-        ratings = [a.rating_value for a in answers if a.rating_value is not None]
-        if ratings:
-            analysis['average_rating'] = sum(ratings) / len(ratings)
-            analysis['rating_distribution'] = {
-                str(i): ratings.count(i) for i in range(1, 6)  # Assuming 1-5 scale
-            }
-            analysis['total_ratings'] = len(ratings)
-        
-    elif question.question_type == 'number':
-        # Calculate number statistics
-        numbers = [a.number_value for a in answers if a.number_value is not None]
-        if numbers:
-            analysis['average'] = sum(numbers) / len(numbers)
-            analysis['minimum'] = min(numbers)
-            analysis['maximum'] = max(numbers)
-            analysis['total_numeric_responses'] = len(numbers)
-        
-    elif question.question_type in ['text', 'text_area']:
-        # Analyze text responses
-        text_responses = [a.text_value for a in answers if a.text_value]
-        analysis['total_text_responses'] = len(text_responses)
-        analysis['average_length'] = sum(len(text) for text in text_responses) / len(text_responses) if text_responses else 0
-        
-        # You could add more text analysis here (sentiment, keywords, etc.)
-        # analysis['sample_responses'] = text_responses[:5]  # First 5 responses as sample
-    
-    return analysis
+def metrics_endpoint(request):
+    """Request metrics in the Prometheus text format (staff, or a scraper holding METRICS_TOKEN)"""
+    authorization = request.headers.get('Authorization', '')
+    token_ok = bool(settings.METRICS_TOKEN) and hmac.compare_digest(
+        authorization.encode(), f"Bearer {settings.METRICS_TOKEN}".encode()
+    )
+    if not token_ok and not request.user.is_staff:
+        return JsonResponse({'error': 'Staff access required'}, status=status.HTTP_403_FORBIDDEN)
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')